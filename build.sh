@@ -1,2 +1,2 @@
 #!/bin/sh
-(cd src; python setup.py sdist)
+(cd src; python compilemaps.py; python setup.py sdist)
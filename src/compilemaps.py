@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+
+import os
+import sys
+
+import rpg.parser
+import rpg.mapformat
+
+"""
+Compiles every text map into the binary format that rpg.parser.loadRpgMap loads in
+preference to the text format.  Compiled maps are written alongside the text maps
+and are only rebuilt when they are missing or stale, unless -f is given.
+
+$ python compilemaps.py [-f] [folder ...]
+"""
+
+MAP_FOLDERS = ["maps", "maps093"]
+
+def compileMap(mapPath, force = False):
+    compiledPath = rpg.mapformat.getCompiledPath(mapPath)
+    if not force and rpg.mapformat.readMapData(compiledPath, mapPath):
+        print "up to date: %s" % compiledPath
+        return False
+    mapData = rpg.parser.parseMapFile(mapPath)
+    rpg.mapformat.writeMapData(mapData, compiledPath, mapPath)
+    print "compiled: %s" % compiledPath
+    return True
+
+def compileFolder(folder, force = False):
+    count = 0
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(rpg.parser.MAP_EXTENSION):
+            if compileMap(os.path.join(folder, filename), force):
+                count += 1
+    return count
+
+def compileMain(args):
+    force = "-f" in args
+    folders = [arg for arg in args if arg != "-f"] or MAP_FOLDERS
+    count = 0
+    for folder in folders:
+        count += compileFolder(folder, force)
+    print "%s map(s) compiled" % count
+
+# this calls the compileMain function when this script is executed
+if __name__ == '__main__': compileMain(sys.argv[1:])
@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import time
+import random
+
+"""
+Runs the game without a window, sound or frame rate cap - eg. to soak test the
+maps with random key presses, or to see how many ticks a second the game can run.
+The states tick exactly as they do in play.py, the screen just never gets shown.
+Like play.py this is run from the src folder:
+
+$ python headless.py [ticks] [seed]
+$ python headless.py --replay <recording>
+
+The second form plays back a recording made with play.py --record as fast as it
+can, and prints where the player ended up so runs can be compared.  It can also
+be used from a script - create a HeadlessGame and call tick with the key presses
+for each tick.
+"""
+
+# these must be set before pygame is initialised
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import pygame
+
+from pygame.locals import K_UP, K_DOWN, K_LEFT, K_RIGHT, K_SPACE
+
+pygame.init()
+# no sound or music - loading the music tracks takes longer than whole ticks do
+pygame.mixer.quit()
+
+import rpg.view
+rpg.view.PRESENT_DISPLAY = False
+rpg.view.DISPLAY_DEPTH = 32
+
+import rpg.states
+import rpg.gameclock
+import rpg.replay
+
+NUM_TICKS = 10000
+RANDOM_SEED = 1
+
+# the keys that are held down for a random number of ticks when soak testing
+DIRECTION_KEYS = [K_UP, K_DOWN, K_LEFT, K_RIGHT]
+MIN_HOLD_TICKS = 10
+MAX_HOLD_TICKS = 80
+ACTION_CHANCE = 0.3
+
+NUM_KEYS = len(pygame.key.get_pressed())
+
+NO_KEYS = (0,) * NUM_KEYS
+
+"""
+Returns key presses in the same form as pygame.key.get_pressed, with the given
+keys held down.
+"""
+def createKeyPresses(keys):
+    keyPresses = [0] * NUM_KEYS
+    for key in keys:
+        keyPresses[key] = 1
+    return keyPresses
+
+"""
+The game, starting from the title screen - or from the play state if a registry is
+given.  Pass render as False to only update the play state and never draw it, as
+drawing has no effect on the game.
+"""
+class HeadlessGame:
+
+    def __init__(self, render = True, registry = None):
+        self.render = render
+        if registry:
+            self.currentState = rpg.states.playFrom(registry)
+        else:
+            self.currentState = rpg.states.showTitle(True)
+        self.ticks = 0
+
+    def tick(self, keyPresses = NO_KEYS):
+        self.currentState = rpg.gameclock.tickState(self.currentState, keyPresses,
+                                                     rpg.states.soundHandler)
+        if self.render and hasattr(self.currentState, "render"):
+            self.currentState.render()
+        self.ticks += 1
+
+"""
+Generates random key presses, holding each combination down for a random number
+of ticks.
+"""
+def randomKeyPresses(seed):
+    rnd = random.Random(seed)
+    while True:
+        keys = rnd.sample(DIRECTION_KEYS, rnd.choice([1, 1, 2]))
+        if rnd.random() < ACTION_CHANCE:
+            keys.append(K_SPACE)
+        keyPresses = createKeyPresses(keys)
+        for i in range(rnd.randint(MIN_HOLD_TICKS, MAX_HOLD_TICKS)):
+            yield keyPresses
+
+def headlessMain(args):
+    if args and args[0] == "--replay":
+        replayMain(args[1])
+        return
+    numTicks = int(args[0]) if len(args) > 0 else NUM_TICKS
+    seed = int(args[1]) if len(args) > 1 else RANDOM_SEED
+    runGame(HeadlessGame(), randomKeyPresses(seed), numTicks)
+
+def replayMain(recordingPath):
+    recording = rpg.replay.loadRecording(recordingPath)
+    if not recording:
+        return
+    if not recording.isMapSetCurrent():
+        print "Warning: the maps have changed since this recording was made"
+    # play back from a copy so the recording's registry stays as it was
+    game = HeadlessGame(True, recording.registry.takeSnapshot())
+    runGame(game, recording.playBack(), recording.getTickCount())
+    player = rpg.states.player
+    print "player: %s %s level %s" % (player.rpgMap.name, player.mapRect.topleft, player.level)
+
+def runGame(game, keyPresses, numTicks):
+    # the time spent in each state, keyed on state name
+    stateTimes, stateTicks = {}, {}
+    start = time.time()
+    for i in range(numTicks):
+        stateName = game.currentState.__class__.__name__
+        tickStart = time.time()
+        game.tick(keyPresses.next())
+        stateTimes[stateName] = stateTimes.get(stateName, 0) + time.time() - tickStart
+        stateTicks[stateName] = stateTicks.get(stateName, 0) + 1
+    elapsed = time.time() - start
+    print "%s ticks in %.2fs: %.0f ticks per second" % (numTicks, elapsed, numTicks / elapsed)
+    for stateName in sorted(stateTicks.keys()):
+        print "%s: %s ticks, %.0f ticks per second" % (stateName, stateTicks[stateName],
+                                                       stateTicks[stateName] / stateTimes[stateName])
+
+# this calls the headlessMain function when this script is executed
+if __name__ == '__main__': headlessMain(sys.argv[1:])
@@ -0,0 +1,43 @@
+#! /usr/bin/env python
+
+import unittest
+
+"""
+Tests that play the whole game with headless.py.  Like headless.py this is run
+from the src folder:
+
+$ python headlesstest.py
+"""
+
+# sets up pygame without a window or sound before the game is imported
+import headless
+import rpg.states
+
+NUM_TICKS = 500
+
+class HeadlessGameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = rpg.states.Registry("start", rpg.states.PLAYER_ON_SCREEN_START, 1)
+
+    # plays the game from the registry with random key presses + returns the player's state after each tick
+    def playGame(self, render):
+        game = headless.HeadlessGame(render, self.registry.takeSnapshot())
+        keyPresses = headless.randomKeyPresses(headless.RANDOM_SEED)
+        player = rpg.states.player
+        playerStates = []
+        for i in range(NUM_TICKS):
+            game.tick(keyPresses.next())
+            playerStates.append((game.currentState.__class__.__name__, player.rpgMap.name,
+                                 player.mapRect.topleft, player.level, player.coinCount.count,
+                                 player.keyCount.count, player.lives.count))
+        return playerStates
+
+    def testRenderHasNoEffect(self):
+        playerStates = self.playGame(False)
+        # the player gets as far as another map
+        self.assertNotEqual(playerStates[0][1], playerStates[-1][1])
+        self.assertEqual(playerStates, self.playGame(True))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@
 
 from pygame.locals import KEYDOWN, K_ESCAPE, K_x, QUIT
 
+import sys
 import pygame
 
 """
@@ -15,17 +16,46 @@ sudo modprobe snd_bcm2835
 pygame.mixer.pre_init(44100, -16, 2, 1024)
 pygame.init()
 
+# run with --native [scalar] to draw at the native size of the art and scale the
+# screen up when it's shown (2x by default), or --native <width>x<height> to scale
+# it up as far as it fits on a display of that size - see view.useNativeResolution
+if "--native" in sys.argv:
+    import rpg.view
+    args = sys.argv[sys.argv.index("--native") + 1:]
+    if args and args[0].isdigit():
+        rpg.view.useNativeResolution(int(args[0]))
+    elif args and "x" in args[0]:
+        width, height = args[0].split("x")
+        rpg.view.useNativeResolution(displaySize = (int(width), int(height)))
+    else:
+        rpg.view.useNativeResolution()
+
 import rpg.states
+import rpg.gameclock
+import rpg.replay
 
-def playMain():
+"""
+Plays the game.  If recordingPath is given, the game starts straight in the play
+state and the keys pressed on each tick are saved there when the game exits -
+see replay.py.
+"""
+def playMain(recordingPath = None):
+    recording = None
     # get the first state
-    currentState = rpg.states.showTitle(True)
+    if recordingPath:
+        registry = rpg.states.Registry("start", rpg.states.PLAYER_ON_SCREEN_START, 1)
+        recording = rpg.replay.Recording(registry)
+        currentState = rpg.states.playFrom(registry)
+    else:
+        currentState = rpg.states.showTitle(True)
     # start the main loop
-    clock = pygame.time.Clock()    
+    tickClock = rpg.gameclock.TickClock(pygame.time.Clock())
     while True:
-        clock.tick(rpg.states.FRAMES_PER_SEC)
+        ticks = tickClock.getTicks()
         for event in pygame.event.get():
             if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                if recording:
+                    recording.save(recordingPath)
                 return
             if event.type == KEYDOWN and event.key == K_x:
                 # toggle sound
@@ -33,13 +63,18 @@ def playMain():
                 rpg.states.musicPlayer.toggleMusic()
         # detect key presses    
         keyPresses = pygame.key.get_pressed()
-        # delegate key presses to the current state
-        newState = currentState.execute(keyPresses)
-        # flush sounds
-        rpg.states.soundHandler.flush()
-        # change state if necessary
-        if newState:
-            currentState = newState
-
-# this calls the playMain function when this script is executed
-if __name__ == '__main__': playMain()
+        # run a tick for every tick's worth of time that has passed
+        for i in range(ticks):
+            currentState = rpg.gameclock.tickState(currentState, keyPresses, rpg.states.soundHandler)
+            if recording:
+                recording.record(keyPresses)
+        if ticks > 0 and hasattr(currentState, "render"):
+            currentState.render()
+
+# this calls the playMain function when this script is executed - run with
+# --record <recording> to record the game
+if __name__ == '__main__':
+    if "--record" in sys.argv:
+        playMain(sys.argv[sys.argv.index("--record") + 1])
+    else:
+        playMain()
@@ -0,0 +1,538 @@
+#! /usr/bin/env python
+
+from __future__ import with_statement
+
+import os
+import sys
+import gc
+import math
+import json
+import shutil
+import tempfile
+import resource
+import random
+import timeit
+import platform
+import pygame
+import parser
+import sprites
+import view
+import font
+import othersprites
+import staticsprites
+import fixedsprites
+import player
+import spritebuilder
+import mapformat
+import mapgen
+
+from pygame.locals import Rect
+
+from view import TILE_SIZE, VIEW_WIDTH, VIEW_HEIGHT, UP, DOWN, LEFT, RIGHT
+from sprites import MOVE_UNIT
+from eventbus import EventBus
+from registry import Registry
+
+"""
+Times the hot paths of the game.  Like maptest.py this is run from the rpg folder:
+
+$ python benchmark.py [map name]
+$ python benchmark.py --json [output path]
+$ python benchmark.py --scaling [map size ...]
+
+The first form compares the hot paths against the code they replaced on one map.
+The second runs the benchmark suite against every map in parser.MAPS_FOLDER and
+writes the ops per second for each hot path as JSON (to benchmark.json by default),
+so runs on different machines or builds can be compared.  The third generates
+square maps of the given sizes (see mapgen.py) and times loading + playing each
+one, writing the results to SCALING_OUTPUT as well as printing them.
+"""
+
+RANDOM_SEED = 1
+NUM_RECTS = 1000
+NUM_REPEATS = 10
+BASE_RECT_SIZES = ((24, 12), (32, 16), (20, 8))
+SPRITE_SIZES = ((28, 48), (32, 32), (24, 24))
+SPRITE_LEVELS = (1, 1.5, 2, 2.5, 3)
+NUM_SPRITES = 200
+NUM_FRAMES = 100
+# the proportion of sprites that move on each frame
+MOVING_SPRITES = 0.25
+
+# initialize everything
+pygame.init()
+screen = pygame.display.set_mode((1, 1))
+
+parser.MAPS_FOLDER = "../maps"
+parser.TILES_FOLDER = "../tiles"
+font.FONT_FOLDER = "../images"
+# the sprite modules each have their own copy of SPRITES_FOLDER
+for module in (sprites, othersprites, staticsprites, fixedsprites, player):
+    module.SPRITES_FOLDER = "../sprites"
+
+# the suite takes this many samples of each hot path
+NUM_SAMPLES = 10
+NUM_LOADS = 100
+NUM_TEXTS = 100
+SUITE_OUTPUT = "benchmark.json"
+# map sizes in tiles for the scaling benchmark, smallest first
+SCALING_SIZES = (50, 100, 200, 500, 1000)
+SCALING_MAP = "synthetic"
+SCALING_OUTPUT = "benchmark-scaling.json"
+TEXT_SAMPLES = ("COINS", "LIVES 3", "GAME OVER", "PRESS SPACE TO START", "0123456789")
+
+def createBaseRects(rpgMap, count):
+    random.seed(RANDOM_SEED)
+    baseRects = []
+    for i in range(count):
+        width, height = random.choice(BASE_RECT_SIZES)
+        x = random.randint(0, rpgMap.mapRect.width - width)
+        y = random.randint(0, rpgMap.mapRect.height - height)
+        baseRects.append((random.choice(SPRITE_LEVELS), Rect(x, y, width, height)))
+    return baseRects
+
+def runMovement(rpgMap, baseRects):
+    for level, baseRect in baseRects:
+        valid, newLevel = rpgMap.isMoveValid(level, baseRect)
+        # these use what isMoveValid cached for this base rect
+        if not valid:
+            rpgMap.isVerticalValid(level, baseRect)
+            rpgMap.isHorizontalValid(level, baseRect)
+        rpgMap.getActionEvent(level, baseRect)
+
+def timeMovement(rpgMap, baseRects, levelGrid):
+    rpgMap.levelGrid = levelGrid
+    return timeit.timeit(lambda: runMovement(rpgMap, baseRects), number = 1) / len(baseRects)
+
+"""
+Times the movement checks for a set of random base rects, with and without the
+level grid.  The two are timed alternately so they're equally affected by whatever
+else the machine is doing.
+"""
+def benchmarkMovement(mapName):
+    rpgMap = parser.loadRpgMap(mapName)
+    baseRects = createBaseRects(rpgMap, NUM_RECTS)
+    levelGrid = rpgMap.levelGrid
+    tileTimes, gridTimes = [], []
+    try:
+        for i in range(NUM_REPEATS):
+            tileTimes.append(timeMovement(rpgMap, baseRects, None))
+            if levelGrid:
+                gridTimes.append(timeMovement(rpgMap, baseRects, levelGrid))
+    finally:
+        rpgMap.levelGrid = levelGrid
+    tileTime = min(tileTimes)
+    print "movement (%s) tiles: %.1f us per rect" % (mapName, tileTime * 1000000)
+    if levelGrid:
+        gridTime = min(gridTimes)
+        print "movement (%s) grid: %.1f us per rect (%.1fx)" % (mapName, gridTime * 1000000,
+                                                                 tileTime / gridTime)
+
+"""
+Stands in for a sprite when getting masks - see RpgMap.getMasks.
+"""
+class MaskSprite:
+
+    def __init__(self, mapRect, level, upright):
+        self.mapRect = mapRect
+        self.level = level
+        self.upright = upright
+        self.z = int(mapRect.bottom + level * TILE_SIZE)
+
+def createMaskSprites(rpgMap, count):
+    random.seed(RANDOM_SEED)
+    sprites = []
+    for i in range(count):
+        width, height = random.choice(SPRITE_SIZES)
+        x = random.randint(0, rpgMap.mapRect.width - width)
+        y = random.randint(0, rpgMap.mapRect.height - height)
+        sprites.append(MaskSprite(Rect(x, y, width, height), random.choice(SPRITE_LEVELS),
+                                  random.random() < 0.8))
+    return sprites
+
+"""
+Times getMasks for a set of random sprites.
+"""
+def benchmarkMasks(mapName):
+    rpgMap = parser.loadRpgMap(mapName)
+    sprites = createMaskSprites(rpgMap, NUM_RECTS)
+    def run():
+        for sprite in sprites:
+            rpgMap.getMasks(sprite)
+    maskTime = min(timeit.repeat(run, number = 1, repeat = NUM_REPEATS)) / len(sprites)
+    print "masks (%s): %.1f us per sprite" % (mapName, maskTime * 1000000)
+
+"""
+Stands in for the frames of a sprite that never changes.
+"""
+class StillFrames:
+
+    def __init__(self, image):
+        self.image = image
+
+    def advanceFrame(self, increment, **metadata):
+        return self.image, 0
+
+"""
+The group RpgSprites replaced, which sorts the sprites every time sprites() is called.
+"""
+class SortedSprites(pygame.sprite.Group):
+
+    def sprites(self):
+        return sorted(self.spritedict.keys(),
+                      lambda sprite1, sprite2: sprite1.z - sprite2.z)
+
+def createZSprites(count):
+    random.seed(RANDOM_SEED)
+    image = view.createRectangle((TILE_SIZE, TILE_SIZE))
+    zSprites = []
+    for i in range(count):
+        sprite = sprites.RpgSprite(StillFrames(image))
+        sprite.setPixelPosition(random.randint(1, 1000), random.randint(1, 1000), 1)
+        zSprites.append(sprite)
+    return zSprites
+
+"""
+Times a frame's worth of calls to sprites() for a group of NUM_SPRITES, where some
+of the sprites move each frame.  sprites() is called three times per frame - by
+Player.handleInteractions for collisions + actions, and when the group is drawn.
+"""
+def timeSpriteOrder(group, zSprites):
+    group.add(*zSprites)
+    random.seed(RANDOM_SEED)
+    moves = [random.sample(zSprites, int(len(zSprites) * MOVING_SPRITES)) for i in range(NUM_FRAMES)]
+    def run():
+        for movingSprites in moves:
+            for sprite in movingSprites:
+                sprite.doMove(0, random.choice((-2, 2)))
+            for i in range(3):
+                group.sprites()
+    frameTime = min(timeit.repeat(run, number = 1, repeat = NUM_REPEATS)) / NUM_FRAMES
+    group.empty()
+    return frameTime
+
+def benchmarkSpriteOrder():
+    zSprites = createZSprites(NUM_SPRITES)
+    sortedTime = timeSpriteOrder(SortedSprites(), zSprites)
+    orderedTime = timeSpriteOrder(sprites.RpgSprites(), zSprites)
+    print "sprite order (%s sprites) sorted: %.1f us per frame" % (NUM_SPRITES, sortedTime * 1000000)
+    print "sprite order (%s sprites) ordered: %.1f us per frame (%.1fx)" % (NUM_SPRITES, orderedTime * 1000000,
+                                                                            sortedTime / orderedTime)
+
+"""
+Times finding the sprites intersecting a base rect in a group of NUM_SPRITES, by
+testing every sprite in the group and by only testing the nearby sprites.
+"""
+def benchmarkCollisions():
+    zSprites = createZSprites(NUM_SPRITES)
+    group = sprites.RpgSprites(*zSprites)
+    probes = createZSprites(NUM_RECTS)
+    def runAll():
+        for probe in probes:
+            [sprite for sprite in group.unordered() if sprite.isIntersecting(probe)]
+    def runNearby():
+        for probe in probes:
+            [sprite for sprite in group.getNearbySprites(probe.baseRect) if sprite.isIntersecting(probe)]
+    allTime = min(timeit.repeat(runAll, number = 1, repeat = NUM_REPEATS)) / len(probes)
+    nearbyTime = min(timeit.repeat(runNearby, number = 1, repeat = NUM_REPEATS)) / len(probes)
+    print "collisions (%s sprites) all: %.1f us per rect" % (NUM_SPRITES, allTime * 1000000)
+    print "collisions (%s sprites) nearby: %.1f us per rect (%.1fx)" % (NUM_SPRITES, nearbyTime * 1000000,
+                                                                       allTime / nearbyTime)
+
+"""
+Takes NUM_SAMPLES samples of run, which does numOps operations each time it's
+called, and returns the ops per second for each sample along with their mean +
+spread.  Returns None if there are no operations to time.
+"""
+def sampleOpsPerSec(run, numOps):
+    if numOps == 0:
+        return None
+    samples = [numOps / timeit.timeit(run, number = 1) for i in range(NUM_SAMPLES)]
+    mean = sum(samples) / len(samples)
+    variance = sum((sample - mean) ** 2 for sample in samples) / (len(samples) - 1)
+    return {"mean": mean,
+            "stdev": math.sqrt(variance),
+            "min": min(samples),
+            "max": max(samples),
+            "samples": samples}
+
+def createBoundaryRanges(rpgMap, count):
+    random.seed(RANDOM_SEED)
+    boundaryRanges = []
+    for i in range(count):
+        boundary = random.choice((UP, DOWN, LEFT, RIGHT))
+        numTiles = rpgMap.cols if boundary in (UP, DOWN) else rpgMap.rows
+        first = random.randint(0, numTiles - 2)
+        boundaryRanges.append((boundary, range(first, first + random.randint(1, 2))))
+    return boundaryRanges
+
+"""
+Returns the sprites for the given map along with a player in the middle of it,
+ready to be updated.
+"""
+def createUpdateSprites(rpgMap):
+    eventBus = EventBus()
+    registry = Registry(rpgMap.name, (rpgMap.cols // 2, rpgMap.rows // 2), 1)
+    gameSprites = spritebuilder.createSpritesForMap(rpgMap, eventBus, registry)
+    ulmo = player.Ulmo()
+    ulmo.setup("ulmo", rpgMap, eventBus)
+    ulmo.setTilePosition(registry.playerPosition[0], registry.playerPosition[1], 1)
+    return gameSprites.sprites(), ulmo
+
+"""
+Times OtherSprite.update for every sprite on the given map over NUM_FRAMES frames.
+The view covers the whole map, so every sprite is animated + masked on every frame.
+"""
+def sampleSpriteUpdates(rpgMap):
+    otherSprites, ulmo = createUpdateSprites(rpgMap)
+    visibleSprites = sprites.RpgSprites()
+    viewRect = rpgMap.mapRect.copy()
+    def run():
+        for i in range(NUM_FRAMES):
+            for sprite in otherSprites:
+                sprite.update(ulmo, visibleSprites, viewRect, 1)
+    return sampleOpsPerSec(run, len(otherSprites) * NUM_FRAMES)
+
+"""
+Times parser.loadRpgMap for the given map with empty caches, and again with the map
+already in the cache.
+"""
+def sampleMapLoads(mapName):
+    def runCold():
+        parser.mapCache.clear()
+        parser.tileSetCache.clear()
+        parser.loadRpgMap(mapName)
+    def runWarm():
+        for i in range(NUM_LOADS):
+            parser.loadRpgMap(mapName)
+    results = {"loadRpgMap (cold)": sampleOpsPerSec(runCold, 1)}
+    parser.loadRpgMap(mapName)
+    results["loadRpgMap (warm)"] = sampleOpsPerSec(runWarm, NUM_LOADS)
+    return results
+
+"""
+isVerticalValid + isHorizontalValid use the base window (or the stripes of tiles)
+cached by the last call to isMoveValid, so this returns what isMoveValid caches for
+each of the given base rects.  They're restored before each call when timing
+isVerticalValid + isHorizontalValid on their own.
+"""
+def getMoveStates(rpgMap, baseRects):
+    moveStates = []
+    for level, baseRect in baseRects:
+        rpgMap.isMoveValid(level, baseRect)
+        moveStates.append((rpgMap.baseWindow, getattr(rpgMap, "verticals", None),
+                           getattr(rpgMap, "horizontals", None)))
+    return moveStates
+
+"""
+Runs the map hot paths against the named map.  Returns the samples for each hot
+path, keyed on its name.
+"""
+def runMapSuite(mapName):
+    results = sampleMapLoads(mapName)
+    rpgMap = parser.loadRpgMap(mapName)
+    baseRects = createBaseRects(rpgMap, NUM_RECTS)
+    maskSprites = createMaskSprites(rpgMap, NUM_RECTS)
+    boundaryRanges = createBoundaryRanges(rpgMap, NUM_RECTS)
+    def runMoves():
+        for level, baseRect in baseRects:
+            rpgMap.isMoveValid(level, baseRect)
+    moveStates = getMoveStates(rpgMap, baseRects)
+    def runVerticals():
+        for (level, baseRect), moveState in zip(baseRects, moveStates):
+            rpgMap.baseWindow, rpgMap.verticals, rpgMap.horizontals = moveState
+            rpgMap.isVerticalValid(level, baseRect)
+    def runHorizontals():
+        for (level, baseRect), moveState in zip(baseRects, moveStates):
+            rpgMap.baseWindow, rpgMap.verticals, rpgMap.horizontals = moveState
+            rpgMap.isHorizontalValid(level, baseRect)
+    def runActions():
+        for level, baseRect in baseRects:
+            rpgMap.getActionEvent(level, baseRect)
+    def runBoundaries():
+        for boundary, tileRange in boundaryRanges:
+            rpgMap.getBoundaryEvent(boundary, tileRange)
+    def runMasks():
+        for sprite in maskSprites:
+            rpgMap.getMasks(sprite)
+    results["isMoveValid"] = sampleOpsPerSec(runMoves, len(baseRects))
+    results["isVerticalValid"] = sampleOpsPerSec(runVerticals, len(baseRects))
+    results["isHorizontalValid"] = sampleOpsPerSec(runHorizontals, len(baseRects))
+    results["getActionEvent"] = sampleOpsPerSec(runActions, len(baseRects))
+    results["getBoundaryEvent"] = sampleOpsPerSec(runBoundaries, len(boundaryRanges))
+    results["getMasks"] = sampleOpsPerSec(runMasks, len(maskSprites))
+    results["OtherSprite.update"] = sampleSpriteUpdates(rpgMap)
+    return results
+
+"""
+Runs the hot paths that don't depend on the map.
+"""
+def runGeneralSuite():
+    zSprites = createZSprites(NUM_SPRITES)
+    group = sprites.RpgSprites(*zSprites)
+    random.seed(RANDOM_SEED)
+    moves = [random.sample(zSprites, int(len(zSprites) * MOVING_SPRITES)) for i in range(NUM_FRAMES)]
+    def runSprites():
+        for movingSprites in moves:
+            for sprite in movingSprites:
+                sprite.doMove(0, random.choice((-2, 2)))
+            group.sprites()
+    gameFont = font.GameFont()
+    def runTexts():
+        for i in range(NUM_TEXTS):
+            for text in TEXT_SAMPLES:
+                gameFont.getTextImage(text)
+    return {"RpgSprites.sprites": sampleOpsPerSec(runSprites, NUM_FRAMES),
+            "Font.getTextImage": sampleOpsPerSec(runTexts, NUM_TEXTS * len(TEXT_SAMPLES))}
+
+def getMapNames():
+    return sorted(fileName[:-len(parser.MAP_EXTENSION)] for fileName in os.listdir(parser.MAPS_FOLDER)
+                  if fileName.endswith(parser.MAP_EXTENSION))
+
+def getEnvironment():
+    return {"platform": platform.platform(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "samples": NUM_SAMPLES}
+
+"""
+Runs the benchmark suite against every map and writes the results to outputPath as
+JSON.  Every hot path is reported in ops per second.
+"""
+def runSuite(outputPath):
+    results = {"environment": getEnvironment(),
+               "general": runGeneralSuite(),
+               "maps": {}}
+    for mapName in getMapNames():
+        results["maps"][mapName] = runMapSuite(mapName)
+    with open(outputPath, "w") as outputFile:
+        json.dump(results, outputFile, indent = 2, sort_keys = True)
+    print "results written to: %s" % os.path.abspath(outputPath)
+
+"""
+Returns the most memory this process has used so far in MB.  ru_maxrss is in KB
+on Linux, which is what the Pi runs.
+"""
+def getPeakMemory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+"""
+Times NUM_FRAMES frames of play on the given map, with the view moving diagonally
+away from the middle of the map the way it follows the player.  Each frame the
+sprites are updated (on a schedule, as in the game), the move + action events are
+checked for a base rect in the middle of the view, and the view of the map is drawn
+along with the visible sprites.  Returns the time taken to create the sprites +
+run the first frame, and the average time for the frames after that.
+"""
+def timeFrames(rpgMap):
+    eventBus = EventBus()
+    registry = Registry(rpgMap.name, (rpgMap.cols // 2, rpgMap.rows // 2), 1)
+    ulmo = player.Ulmo()
+    ulmo.setup("ulmo", rpgMap, eventBus)
+    ulmo.setTilePosition(registry.playerPosition[0], registry.playerPosition[1], 1)
+    surface = view.createRectangle((VIEW_WIDTH, VIEW_HEIGHT))
+    viewRect = Rect(0, 0, VIEW_WIDTH, VIEW_HEIGHT)
+    viewRect.center = ulmo.mapRect.center
+    baseRect = Rect(0, 0, BASE_RECT_SIZES[0][0], BASE_RECT_SIZES[0][1])
+    groups = []
+    def runSetup():
+        visibleSprites = sprites.RpgSprites()
+        gameSprites = spritebuilder.createSpritesForMap(rpgMap, eventBus, registry, visibleSprites)
+        groups[:] = [gameSprites, visibleSprites]
+        runFrame()
+    def runFrame():
+        gameSprites, visibleSprites = groups
+        viewRect.move_ip(MOVE_UNIT, MOVE_UNIT)
+        baseRect.center = viewRect.center
+        rpgMap.isMoveValid(1, baseRect)
+        rpgMap.getActionEvent(1, baseRect)
+        gameSprites.update(ulmo, visibleSprites, viewRect, 1)
+        rpgMap.mapImage.draw(surface, (0, 0), viewRect)
+        visibleSprites.draw(surface)
+    def runFrames():
+        for i in range(NUM_FRAMES):
+            runFrame()
+    setupTime = timeit.timeit(runSetup, number = 1)
+    return setupTime, timeit.timeit(runFrames, number = 1) / NUM_FRAMES
+
+"""
+Generates a square map of the given size in mapsFolder and times loading it from
+the text map and from the compiled map, along with the time to create the map image
+and the time per frame of play.
+"""
+def runScaling(mapsFolder, size):
+    mapPath = os.path.join(mapsFolder, SCALING_MAP + parser.MAP_EXTENSION)
+    mapgen.generateMap(mapPath, size, size)
+    parser.mapCache.clear()
+    parser.tileSetCache.clear()
+    textTime = timeit.timeit(lambda: parser.loadRpgMap(SCALING_MAP), number = 1)
+    mapformat.writeMapData(parser.parseMapFile(mapPath), mapformat.getCompiledPath(mapPath), mapPath)
+    # both loads start cold, so the compiled map doesn't get the text map's tile sets
+    parser.mapCache.clear()
+    parser.tileSetCache.clear()
+    compiledTime = timeit.timeit(lambda: parser.loadRpgMap(SCALING_MAP), number = 1)
+    rpgMap = parser.loadRpgMap(SCALING_MAP)
+    imageTime = timeit.timeit(rpgMap.initialiseMapImage, number = 1)
+    setupTime, frameTime = timeFrames(rpgMap)
+    result = {"size": size,
+              "area": size * size,
+              "sprites": len(rpgMap.mapSprites),
+              "load text (ms)": textTime * 1000,
+              "load compiled (ms)": compiledTime * 1000,
+              "map image (ms)": imageTime * 1000,
+              "sprite setup (ms)": setupTime * 1000,
+              "frame (ms)": frameTime * 1000,
+              "peak memory (MB)": getPeakMemory()}
+    # let go of the map before the next one is loaded
+    parser.mapCache.clear()
+    del rpgMap
+    gc.collect()
+    return result
+
+"""
+Runs the scaling benchmark for each of the given map sizes.  The load times are also
+printed per 1000 tiles, so costs that grow faster than the map area stand out as a
+rising column.  Peak memory is for the whole process, so the sizes are run smallest
+first - each one then shows the peak for the largest map so far.
+"""
+def runScalingSuite(sizes):
+    sizes = sorted(sizes)
+    mapsFolder = tempfile.mkdtemp()
+    mapsFolderWas = parser.MAPS_FOLDER
+    parser.MAPS_FOLDER = mapsFolder
+    results = []
+    try:
+        for size in sizes:
+            results.append(runScaling(mapsFolder, size))
+    finally:
+        parser.MAPS_FOLDER = mapsFolderWas
+        shutil.rmtree(mapsFolder)
+    print "%10s %8s %12s %12s %14s %10s %10s %10s" % ("size", "sprites", "text (ms)", "compiled (ms)",
+                                                    "text/1k tiles", "setup (ms)", "frame (ms)", "peak (MB)")
+    for result in results:
+        print "%10s %8s %12.1f %12.1f %14.2f %10.1f %10.2f %10.1f" % (
+            "%sx%s" % (result["size"], result["size"]), result["sprites"],
+            result["load text (ms)"], result["load compiled (ms)"],
+            result["load text (ms)"] * 1000 / result["area"], result["sprite setup (ms)"],
+            result["frame (ms)"], result["peak memory (MB)"])
+    with open(SCALING_OUTPUT, "w") as outputFile:
+        json.dump({"environment": getEnvironment(), "results": results}, outputFile,
+                  indent = 2, sort_keys = True)
+    print "results written to: %s" % os.path.abspath(SCALING_OUTPUT)
+
+def benchmarkMain(args):
+    if args and args[0] == "--scaling":
+        runScalingSuite([int(arg) for arg in args[1:]] or SCALING_SIZES)
+        return
+    if args and args[0] == "--json":
+        runSuite(args[1] if len(args) > 1 else SUITE_OUTPUT)
+        return
+    mapName = args[0] if args else "start"
+    benchmarkMovement(mapName)
+    benchmarkMasks(mapName)
+    benchmarkSpriteOrder()
+    benchmarkCollisions()
+
+# this calls the benchmarkMain function when this script is executed
+if __name__ == '__main__': benchmarkMain(sys.argv[1:])
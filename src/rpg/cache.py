@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+
+from collections import OrderedDict
+
+"""
+A least recently used cache that keeps track of the number of bytes held by its
+entries.  Once the total exceeds maxBytes the least recently used entries are
+evicted until we're back under budget - although the most recently added entry is
+never evicted, so a single oversized entry can still be cached.  The size of each
+entry is provided by the caller when it is added.
+
+Hit, miss and eviction counts are kept so we can see how well the cache is doing.
+"""
+class LruCache:
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        # entries are (value, size) tuples, ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            entry = self.entries.pop(key)
+            self.entries[key] = entry
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, value, size):
+        self.remove(key)
+        self.entries[key] = (value, size)
+        self.totalBytes += size
+        self.evict()
+
+    def remove(self, key):
+        if key in self.entries:
+            value, size = self.entries.pop(key)
+            self.totalBytes -= size
+            return value
+        return None
+
+    def evict(self):
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            key, (value, size) = self.entries.popitem(False)
+            self.totalBytes -= size
+            self.evictions += 1
+
+    def setMaxBytes(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.totalBytes = 0
+
+    def getStats(self):
+        return {"entries": len(self.entries),
+                "bytes": self.totalBytes,
+                "maxBytes": self.maxBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+
+from sprites import VELOCITY
+
+FRAMES_PER_SEC = 60 // VELOCITY
+
+# the game runs at FRAMES_PER_SEC ticks per second, however often the screen can be
+# drawn - if it falls behind, up to this many ticks are run before the screen is
+# drawn again, and after that the game slows down instead
+MAX_CATCH_UP_TICKS = 4
+
+"""
+Runs one tick of the given state and returns the state for the next tick.  States
+with a render method only draw when render is called, so the main loop can run
+several ticks for each frame drawn - the rest draw as they go.  Any sounds the
+tick set off are played through the given sound handler.
+"""
+def tickState(currentState, keyPresses, soundHandler):
+    # delegate key presses to the current state
+    if hasattr(currentState, "render"):
+        newState = currentState.update(keyPresses)
+    else:
+        newState = currentState.execute(keyPresses)
+    # flush sounds
+    soundHandler.flush()
+    # change state if necessary
+    if newState:
+        return newState
+    return currentState
+
+"""
+Keeps track of how far behind the game is, so the main loop can run a tick for
+every tick's worth of time that has passed and draw the screen just once after
+them.  The clock is a pygame.time.Clock, or anything with the same tick method.
+"""
+class TickClock:
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.tickMillis = 1000.0 / FRAMES_PER_SEC
+        # how far behind the game is, in milliseconds
+        self.lag = 0
+
+    # waits for the next tick and returns the number of ticks to run, to the nearest tick
+    def getTicks(self):
+        # there's no point drawing more often than the game ticks
+        self.lag += self.clock.tick(FRAMES_PER_SEC)
+        ticks = 0
+        while self.lag >= self.tickMillis / 2 and ticks < MAX_CATCH_UP_TICKS:
+            self.lag -= self.tickMillis
+            ticks += 1
+        if ticks == MAX_CATCH_UP_TICKS:
+            self.lag = 0
+        return ticks
@@ -0,0 +1,199 @@
+#! /usr/bin/env python
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the counts packed into each summed area table entry are this many bits wide
+COUNT_BITS = 32
+COUNT_MASK = (1 << COUNT_BITS) - 1
+
+"""
+Packed copies of the levels held by the tiles of a map, so that the movement checks
+in RpgMap can be answered for the window of tiles touched by a base rect without
+iterating over MapTile objects.  The rules are described
+in RpgMap.isSpanValid - the answers given here must be exactly the same.
+
+The grids are indexed on [level, x, y], where level is one of the whole number
+levels used by the map:
+
+passable - True if the level is one of the tile levels or it has a down level
+specials - the special level for the level, or 0 if there isn't one
+downs    - the down level for the level, or 0 if there isn't one
+events   - indexed on [x, y] only, True if the tile has any tile events
+
+Requires numpy - use createLevelGrid, which returns None if numpy is unavailable
+and RpgMap will fall back to iterating over the tiles.
+"""
+class LevelGrid:
+
+    def __init__(self, mapTiles):
+        self.mapTiles = mapTiles
+        cols, rows = len(mapTiles), len(mapTiles[0])
+        numLevels = getMaxLevel(mapTiles) + 1
+        self.passable = numpy.zeros((numLevels, cols, rows), numpy.bool_)
+        self.specials = numpy.zeros((numLevels, cols, rows), numpy.float64)
+        self.downs = numpy.zeros((numLevels, cols, rows), numpy.int32)
+        self.events = numpy.zeros((cols, rows), numpy.bool_)
+        self.empty = numpy.zeros((cols, rows), numpy.float64)
+        self.clearValidity()
+        for tiles in mapTiles:
+            for tile in tiles:
+                self.setTile(tile)
+
+    """
+    Copies the levels from the given tile into the grids - this must be called
+    whenever the levels of a tile are modified.
+    """
+    def updateTile(self, x, y):
+        tile = self.mapTiles[x][y]
+        maxLevel = getMaxLevel([[tile]])
+        if maxLevel >= len(self.passable):
+            self.addLevels(maxLevel + 1 - len(self.passable))
+        self.passable[:, x, y] = False
+        self.specials[:, x, y] = 0
+        self.downs[:, x, y] = 0
+        self.setTile(tile)
+        self.clearValidity()
+
+    def setTile(self, tile):
+        x, y = tile.x, tile.y
+        for level in tile.levels:
+            if level >= 0:
+                self.passable[level, x, y] = True
+        if tile.specialLevels:
+            for level, specialLevel in tile.specialLevels.items():
+                if level >= 0:
+                    self.specials[int(level), x, y] = specialLevel
+        if tile.downLevels:
+            for level, downLevel in tile.downLevels.items():
+                if downLevel and level >= 0:
+                    self.passable[int(level), x, y] = True
+                    self.downs[int(level), x, y] = downLevel
+        self.events[x, y] = bool(tile.events)
+
+    def clearValidity(self):
+        self.validity = {}
+
+    def addLevels(self, count):
+        cols, rows = self.events.shape
+        self.passable = numpy.concatenate((self.passable, numpy.zeros((count, cols, rows), numpy.bool_)))
+        self.specials = numpy.concatenate((self.specials, numpy.zeros((count, cols, rows), numpy.float64)))
+        self.downs = numpy.concatenate((self.downs, numpy.zeros((count, cols, rows), numpy.int32)))
+
+    def getGrid(self, grid, level):
+        if 0 <= level < len(grid):
+            return grid[level]
+        return self.empty
+
+    """
+    Returns the validity of every tile for the given sprite level - the equivalent of
+    calling MapTile.testValidity on each tile.  Validity is cached for each level.
+    """
+    def getValidity(self, level):
+        if level in self.validity:
+            return self.validity[level]
+        floor, ceil = int(math.floor(level)), int(math.ceil(level))
+        if floor == level:
+            passable = self.getGrid(self.passable, floor) != 0
+            downs = self.getGrid(self.downs, floor)
+        else:
+            passable = numpy.zeros(self.events.shape, numpy.bool_)
+            downs = self.empty
+        specials = self.getGrid(self.specials, floor)
+        if ceil != floor:
+            specials = numpy.where(specials != 0, specials, self.getGrid(self.specials, ceil))
+        # tiles that are passable at this level don't report a special level
+        specials = numpy.where(passable, 0, specials)
+        valid = passable | ((specials != 0) & (specials == level))
+        validity = Validity(valid, specials, downs, self.events)
+        self.validity[level] = validity
+        return validity
+
+    """
+    The equivalent of RpgMap.isSpanValid for the tiles from x1, y1 to x2, y2
+    inclusive.
+    """
+    def isSpanValid(self, level, x1, y1, x2, y2):
+        validity = self.validity.get(level) or self.getValidity(level)
+        # sums[x2 + 1][y2 + 1] - sums[x1][y2 + 1] - sums[x2 + 1][y1] + sums[x1][y1] is the
+        # count for the window x1, y1 to x2, y2 - see getSums
+        sums = validity.sums
+        counts = sums[x2 + 1][y2 + 1] - sums[x1][y2 + 1] - sums[x2 + 1][y1] + sums[x1][y1]
+        spanCount = (x2 - x1 + 1) * (y2 - y1 + 1)
+        if counts & COUNT_MASK == spanCount:
+            return True, level
+        if counts >> COUNT_BITS == spanCount:
+            spanSpecials = validity.specials[x1:x2 + 1, y1:y2 + 1]
+            minLevel = float(spanSpecials.min())
+            maxLevel = float(spanSpecials.max())
+            if maxLevel - minLevel < 1:
+                # ensure we return a whole number if possible
+                retLevel = maxLevel if int(maxLevel) == maxLevel else minLevel
+                return True, retLevel
+        return False, level
+
+    """
+    Returns True if any of the tiles from x1, y1 to x2, y2 inclusive has tile events,
+    along with the down level if every tile has a down level for the given level -
+    in which case the sprite should fall.
+    """
+    def getActions(self, level, x1, y1, x2, y2):
+        validity = self.validity.get(level) or self.getValidity(level)
+        sums = validity.actionSums
+        counts = sums[x2 + 1][y2 + 1] - sums[x1][y2 + 1] - sums[x2 + 1][y1] + sums[x1][y1]
+        downLevel = None
+        if counts >> COUNT_BITS == (x2 - x1 + 1) * (y2 - y1 + 1):
+            downLevel = validity.downs[x1][y1]
+        return counts & COUNT_MASK > 0, downLevel
+
+    def getByteSize(self):
+        return (self.passable.nbytes + self.specials.nbytes + self.downs.nbytes
+                + self.events.nbytes + self.empty.nbytes)
+
+"""
+The validity of every tile for a sprite level.  The number of valid tiles + tiles
+with a special level are held in a single summed area table, as are the number of
+tiles with events + tiles with a down level, so we can count the tiles in any window
+with just four lookups.
+"""
+class Validity:
+
+    def __init__(self, valid, specials, downs, events):
+        self.specials = specials
+        self.downs = downs.astype(numpy.int32).tolist()
+        self.sums = getSums(valid, specials != 0)
+        self.actionSums = getSums(events, downs != 0)
+
+"""
+Returns the summed area table for the given pair of boolean grids, as nested lists
+since they're much quicker to index than numpy arrays.  sums[x][y] holds the number
+of True values in low[:x, :y] in its bottom COUNT_BITS, and the number of True
+values in high[:x, :y] above that.
+"""
+def getSums(low, high):
+    cols, rows = low.shape
+    sums = numpy.zeros((cols + 1, rows + 1), numpy.int64)
+    counts = low.astype(numpy.int64) + (high.astype(numpy.int64) << COUNT_BITS)
+    sums[1:, 1:] = counts.cumsum(0).cumsum(1)
+    return sums.tolist()
+
+def getMaxLevel(mapTiles):
+    maxLevel = 0
+    for tiles in mapTiles:
+        for tile in tiles:
+            for level in tile.levels:
+                maxLevel = max(maxLevel, level)
+            if tile.specialLevels:
+                maxLevel = max([maxLevel] + tile.specialLevels.keys())
+            if tile.downLevels:
+                maxLevel = max([maxLevel] + tile.downLevels.keys())
+    return int(maxLevel)
+
+def createLevelGrid(mapTiles):
+    if numpy is None:
+        return None
+    return LevelGrid(mapTiles)
@@ -3,10 +3,39 @@
 from __future__ import with_statement
 
 import math
+import bisect
+import weakref
 import view
 import mapevents
+import cache
+import levelgrid
 
-from view import TILE_SIZE
+from pygame.locals import Rect
+
+from view import TILE_SIZE, VIEW_WIDTH, VIEW_HEIGHT
+
+# rough estimate of the memory held by each map tile, excluding the tile images
+MAP_TILE_BYTES = 400
+
+# the map image is split into square chunks of this many tiles
+CHUNK_TILES = 8
+
+# rendered chunks are dropped once they are this far from the view
+CHUNK_DROP_DISTANCE = CHUNK_TILES * TILE_SIZE // 2
+
+# composite tile images are shared by every map - see getCompositeImage
+COMPOSITE_CACHE_BYTES = 2 * 1024 * 1024
+
+compositeCache = cache.LruCache(COMPOSITE_CACHE_BYTES)
+
+# draw sprite masks from a pre-rendered overlay for each map, rather than masking
+# the sprite images - see MapOverlay
+MAP_OVERLAYS = False
+
+# returned by getMasks when no masks apply
+NO_MASKS = ()
+
+NO_EVENTS = ()
 
 MIN_SHUFFLE = (0, -1, -1, 1)
 MAX_SHUFFLE = (-1, 1, 0, -1)
@@ -26,30 +55,77 @@ class RpgMap:
         self.rows = len(mapTiles[0])
         self.mapSprites = mapSprites
         self.initialiseMapImage()
+        self.overlay = MapOverlay(mapTiles) if MAP_OVERLAYS else None
         self.initialiseEvents(mapEvents)
+        self.levelGrid = levelgrid.createLevelGrid(mapTiles)
+        self.baseWindow = None
         self.toRestore = None
         
     def initialiseMapImage(self):
-        self.mapImage = view.createRectangle((self.cols * TILE_SIZE, self.rows * TILE_SIZE),
-                                              view.BLACK)
-        for tiles in self.mapTiles:
-            for tile in tiles:
-                tileImage = tile.createTileImage()
-                if tileImage:
-                    self.mapImage.blit(tileImage, (tile.x * TILE_SIZE, tile.y * TILE_SIZE))
+        self.mapImage = MapImage(self.mapTiles, self.cols, self.rows)
         self.mapRect = self.mapImage.get_rect()
     
+    """
+    Returns an estimate of the memory held by this map, for the benefit of the map
+    cache.  This is dominated by the rendered chunks of the map image - tile images
+    are shared with the tile sets so they're not counted here.
+    """
+    def getByteSize(self):
+        byteSize = self.mapImage.getMaxByteSize() + self.cols * self.rows * MAP_TILE_BYTES
+        if self.levelGrid:
+            byteSize += self.levelGrid.getByteSize()
+        if self.overlay:
+            byteSize += self.overlay.getByteSize()
+        return byteSize
+    
+    """
+    Events are indexed so they can be looked up without searching:
+    
+    boundaryEvents - the events for each boundary, in map file order
+    boundaryIndex  - for each boundary, the events that include each tile, in map
+                     file order
+    tileEvents     - the first tile event for each x, y, level
+    fallingEvents  - a falling event for each down level used by the map
+    """
     def initialiseEvents(self, mapEvents):
         self.boundaryEvents = {}
+        self.boundaryIndex = {}
         self.tileEvents = {}
+        self.transitions = [event.transition for event in mapEvents]
         for event in mapEvents:
             if event.type == mapevents.TILE_EVENT:
                 self.mapTiles[event.x][event.y].addEvent(event)
+                key = (event.x, event.y, event.level)
+                if key not in self.tileEvents:
+                    self.tileEvents[key] = event
             elif event.type == mapevents.BOUNDARY_EVENT:
-                if event.boundary in self.boundaryEvents:
-                    self.boundaryEvents[event.boundary].append(event)
-                else:
-                    self.boundaryEvents[event.boundary] = [event]
+                self.boundaryEvents.setdefault(event.boundary, []).append(event)
+                boundaryIndex = self.boundaryIndex.setdefault(event.boundary, {})
+                for i in event.range:
+                    boundaryIndex.setdefault(i, []).append(event)
+        self.fallingEvents = {}
+        for tiles in self.mapTiles:
+            for tile in tiles:
+                if tile.downLevels:
+                    for downLevel in tile.downLevels.values():
+                        self.getFallingEvent(downLevel)
+    
+    def getFallingEvent(self, downLevel):
+        if downLevel not in self.fallingEvents:
+            self.fallingEvents[downLevel] = mapevents.FallingEvent(downLevel)
+        return self.fallingEvents[downLevel]
+    
+    """
+    Returns the names of the maps that can be reached from this map via its
+    boundary + tile events.
+    """
+    def getAdjacentMapNames(self):
+        mapNames = []
+        for transition in self.transitions:
+            mapName = transition.mapName
+            if mapName and mapName != self.name and mapName not in mapNames:
+                mapNames.append(mapName)
+        return mapNames
     
     """
     The map restricts movement via the following system:
@@ -86,6 +162,9 @@ class RpgMap:
     
     If movement is valid, the sprite level is made equal to the maximum tile level
     of the base tiles. This allows the sprite to move between one level and another.
+    
+    When numpy is available the same rules are applied by the level grid instead -
+    see levelgrid.LevelGrid.
     """
     def isSpanValid(self, level, spanTiles):
         sameLevelCount = 0
@@ -110,6 +189,12 @@ class RpgMap:
         return False, level
     
     def isMoveValid(self, level, baseRect):
+        if self.levelGrid:
+            baseWindow = self.getBaseRectWindow(baseRect)
+            if baseWindow:
+                # the window is cached for isVerticalValid + isHorizontalValid
+                self.baseWindow = baseWindow
+                return self.levelGrid.isSpanValid(level, *baseWindow)
         return self.isSpanValid(level, self.getBaseRectTiles(baseRect))
     
     def isStripeValid(self, level, stripes, min, max):
@@ -132,26 +217,66 @@ class RpgMap:
         valid, level = self.isSpanValid(level, stripe)
         return valid, level, shuffle2
                 
+    """
+    The level grid equivalent of isStripeValid, where the stripes are the first +
+    last columns or rows of the base window.
+    """
+    def isWindowStripeValid(self, level, first, last, firstStripe, lastStripe, min, max):
+        if last <= first:
+            return False, level, 0
+        minDiff = abs(first * TILE_SIZE - min)
+        maxDiff = abs((last + 1) * TILE_SIZE - max)
+        if minDiff < maxDiff:
+            stripe1, stripe2, shuffle = firstStripe, lastStripe, MIN_SHUFFLE
+        else:
+            stripe1, stripe2, shuffle = lastStripe, firstStripe, MAX_SHUFFLE
+        valid, level = self.levelGrid.isSpanValid(level, *stripe1)
+        if valid:
+            return valid, level, shuffle[1]
+        valid, level = self.levelGrid.isSpanValid(level, *stripe2)
+        return valid, level, shuffle[3]
+    
     def isVerticalValid(self, level, baseRect):
+        if self.baseWindow:
+            x1, y1, x2, y2 = self.baseWindow
+            return self.isWindowStripeValid(level, x1, x2, (x1, y1, x1, y2), (x2, y1, x2, y2),
+                                            baseRect.left, baseRect.right)
         return self.isStripeValid(level, self.verticals,
                                   baseRect.left, baseRect.right)
 
     def isHorizontalValid(self, level, baseRect):
+        if self.baseWindow:
+            x1, y1, x2, y2 = self.baseWindow
+            return self.isWindowStripeValid(level, y1, y2, (x1, y1, x2, y1), (x1, y2, x2, y2),
+                                            baseRect.top, baseRect.bottom)
         return self.isStripeValid(level, self.horizontals,
                                   baseRect.top, baseRect.bottom)
         
     """
+    Returns the masks for the given sprite as a tuple of (tile point, mask images)
+    pairs, one for each tile with masks that apply to the sprite.  Each tile looks
+    its masks up in tables built when it's created (see TileDefinition.getMaskIndex),
+    so if only one tile has masks for the sprite its own tuple is returned as it is.
+    
     The given sprite must contain mapRect, level, z and upright attributes.  Typically
     this object will be a real sprite, but for ease of unit testing it can be anything.
     """
     def getMasks(self, sprite):
-        spriteTiles = self.getSpanTiles(sprite.mapRect)
-        masks = {}
-        for tile in spriteTiles:
-            if tile:
-                tileMasks = tile.getMasks(sprite.level, sprite.z, sprite.upright)
-                if tileMasks:
-                    masks[(tile.x, tile.y)] = tileMasks
+        rect = sprite.mapRect
+        x1, y1 = self.convertTopLeft(rect.left, rect.top)
+        x2, y2 = self.convertBottomRight(rect.right - 1, rect.bottom - 1)
+        masks = NO_MASKS
+        # the same tiles as getSpanTiles, without building the list
+        for x in range(x1, x2 + 1):
+            for tile in self.mapTiles[x][y1:y2 + 1]:
+                if tile.maskPairs:
+                    tileMasks = tile.getMaskPairs(sprite.level, sprite.z, sprite.upright)
+                    if tileMasks:
+                        # a single tile's masks are returned as they are
+                        if masks is NO_MASKS:
+                            masks = tileMasks
+                        else:
+                            masks += tileMasks
         return masks
     
     """
@@ -172,6 +297,7 @@ class RpgMap:
     if the requested movement is invalid.
     """
     def getBaseRectTiles(self, rect):
+        self.baseWindow = None
         rectTiles = []
         x1, y1 = self.convertTopLeft(rect.left, rect.top)
         x2, y2 = self.convertBottomRight(rect.right - 1, rect.bottom - 1)
@@ -184,16 +310,35 @@ class RpgMap:
             self.horizontals[y] = [self.mapTiles[x][y] for x in range(x1, x2 + 1)]
         return rectTiles
     
+    """
+    The level grid equivalent of getBaseRectTiles - returns the window of tiles x1,
+    y1, x2, y2 touched by the given rectangle.  Returns None if the rectangle is
+    outside the map, since getBaseRectTiles has its own ideas about what that means.
+    """
+    def getBaseRectWindow(self, rect):
+        # convertTopLeft + convertBottomRight inlined, since this is called so often
+        x1, y1 = max(0, rect.left // TILE_SIZE), max(0, rect.top // TILE_SIZE)
+        x2 = min(self.cols - 1, (rect.right - 1) // TILE_SIZE)
+        y2 = min(self.rows - 1, (rect.bottom - 1) // TILE_SIZE)
+        if x2 < x1 or y2 < y1:
+            return None
+        return x1, y1, x2, y2
+    
     """
     Returns the boundary event for the given boundary + tile range. Returns
-    None if no such event exists.
+    None if no such event exists.  The tile range must be contiguous, as returned
+    by Player.getTileRange - event ranges are too, so the first event that includes
+    both ends of the tile range includes all of it.
     """    
     def getBoundaryEvent(self, boundary, tileRange):
-        if boundary in self.boundaryEvents:
-            for event in self.boundaryEvents[boundary]:
-                testList = [i in event.range for i in tileRange]
-                if all(testList):
-                    return event
+        if boundary not in self.boundaryEvents:
+            return None
+        if not tileRange:
+            return self.boundaryEvents[boundary][0]
+        last = tileRange[-1]
+        for event in self.boundaryIndex[boundary].get(tileRange[0], NO_EVENTS):
+            if event.min <= last <= event.max:
+                return event
         return None
     
     """
@@ -201,20 +346,36 @@ class RpgMap:
     been triggered.
     """
     def getActionEvent(self, level, baseRect):
+        baseWindow = self.levelGrid and self.getBaseRectWindow(baseRect)
+        if not baseWindow:
+            return self.getTileActionEvent(level, baseRect)
+        hasEvents, downLevel = self.levelGrid.getActions(level, *baseWindow)
+        # only look up the tile events if there are any
+        if hasEvents:
+            for tile in self.getSpanTiles(baseRect):
+                event = self.tileEvents.get((tile.x, tile.y, level))
+                if event:
+                    return event
+        if downLevel:
+            return self.getFallingEvent(downLevel)
+        return None
+    
+    def getTileActionEvent(self, level, baseRect):
         downLevels = []
         spanTiles = self.getSpanTiles(baseRect)
         for tile in spanTiles:
-            event = tile.getEvent(level)
-            if event:
-                return event
+            if tile.events:
+                event = self.tileEvents.get((tile.x, tile.y, level))
+                if event:
+                    return event
             downLevel = tile.getDownLevel(level)
             if downLevel:
                 downLevels.append(downLevel)
         # a falling event is returned only if all the span tiles have a down level
         if downLevels and len(downLevels) == len(spanTiles):
-            return mapevents.FallingEvent(downLevels[0])
+            return self.getFallingEvent(downLevels[0])
         return None
-            
+    
     def convertTopLeft(self, px, py):
         return max(0, px // TILE_SIZE), max(0, py // TILE_SIZE)
         
@@ -227,7 +388,25 @@ class RpgMap:
     def addLevel(self, x, y, level):
         if self.toRestore == None:
             self.toRestore = set()
-        self.toRestore.add(self.mapTiles[x][y].addNewLevel(level))
+        self.toRestore.add(self.addTileLevel(x, y, level))
+    
+    """
+    Adds a new level to the specified tile without storing it for restoration - the
+    caller is responsible for calling restoreTile.
+    """
+    def addTileLevel(self, x, y, level):
+        tile = self.mapTiles[x][y].addNewLevel(level)
+        self.updateLevelGrid(tile)
+        return tile
+    
+    def restoreTile(self, x, y):
+        tile = self.mapTiles[x][y]
+        tile.restore()
+        self.updateLevelGrid(tile)
+    
+    def updateLevelGrid(self, tile):
+        if self.levelGrid:
+            self.levelGrid.updateTile(tile.x, tile.y)
     
     """
     Restores any modified tiles to their original state.
@@ -237,80 +416,309 @@ class RpgMap:
             return self
         for tile in self.toRestore:
             tile.restore()
+            self.updateLevelGrid(tile)
         self.toRestore = None
         return self
 
 """
-A repository of named tile images.  Instances of this class are created and used
-whenever a new map is loaded from disk.
+The image for an RpgMap, split into chunks of CHUNK_TILES x CHUNK_TILES tiles.  A
+chunk is only rendered the first time some part of it is drawn, and chunks that
+are more than CHUNK_DROP_DISTANCE from the area being drawn are dropped again.  This
+means load time + memory depend on the size of the view rather than the size of
+the map.
+
+Use draw in place of blitting the whole map image, eg. to draw the view:
+mapImage.draw(surface, (0, 0), viewRect)
+"""
+class MapImage:
+    
+    def __init__(self, mapTiles, cols, rows):
+        self.mapTiles = mapTiles
+        self.cols, self.rows = cols, rows
+        self.chunkSize = CHUNK_TILES * TILE_SIZE
+        self.chunkCols = (cols + CHUNK_TILES - 1) // CHUNK_TILES
+        self.chunkRows = (rows + CHUNK_TILES - 1) // CHUNK_TILES
+        self.rect = Rect(0, 0, cols * TILE_SIZE, rows * TILE_SIZE)
+        # rendered chunks keyed on chunk x, y
+        self.chunks = {}
+        # sprite images drawn over the tiles, as (image, map rect) pairs in z order
+        self.bakedImages = []
+        
+    def get_rect(self):
+        return self.rect.copy()
+    
+    """
+    Draws the given area of the map image onto the surface at the given position -
+    the equivalent of surface.blit(mapImage, position, area).  Pass drop as False
+    when drawing a small part of the view so chunks elsewhere in the view are kept.
+    """
+    def draw(self, surface, position, area, drop = True):
+        mapArea = area.clip(self.rect)
+        if mapArea.width == 0 or mapArea.height == 0:
+            return
+        if drop:
+            self.dropChunks(mapArea)
+        cx1, cy1 = mapArea.left // self.chunkSize, mapArea.top // self.chunkSize
+        cx2, cy2 = (mapArea.right - 1) // self.chunkSize, (mapArea.bottom - 1) // self.chunkSize
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                chunk, chunkRect = self.getChunk(cx, cy)
+                chunkArea = mapArea.clip(chunkRect)
+                px = position[0] + chunkArea.left - area.left
+                py = position[1] + chunkArea.top - area.top
+                chunkArea.move_ip(-chunkRect.left, -chunkRect.top)
+                surface.blit(chunk, (px, py), chunkArea)
+    
+    def getChunk(self, cx, cy):
+        if (cx, cy) in self.chunks:
+            return self.chunks[(cx, cy)]
+        chunk = self.renderChunk(cx, cy)
+        self.chunks[(cx, cy)] = chunk
+        return chunk
+    
+    def renderChunk(self, cx, cy):
+        x1, y1 = cx * CHUNK_TILES, cy * CHUNK_TILES
+        x2, y2 = min(x1 + CHUNK_TILES, self.cols), min(y1 + CHUNK_TILES, self.rows)
+        chunkRect = Rect(x1 * TILE_SIZE, y1 * TILE_SIZE, (x2 - x1) * TILE_SIZE, (y2 - y1) * TILE_SIZE)
+        chunk = view.createRectangle(chunkRect.size, view.BLACK)
+        for x in range(x1, x2):
+            for tile in self.mapTiles[x][y1:y2]:
+                tileImage = tile.createTileImage()
+                if tileImage:
+                    chunk.blit(tileImage, ((x - x1) * TILE_SIZE, (tile.y - y1) * TILE_SIZE))
+        for image, rect in self.bakedImages:
+            if rect.colliderect(chunkRect):
+                chunk.blit(image, (rect.left - chunkRect.left, rect.top - chunkRect.top))
+        return chunk, chunkRect
+    
+    """
+    Sets the sprite images that are baked into the map image, as (image, map rect)
+    pairs in the order they should be drawn.  The chunks are rendered again if
+    these have changed since last time.
+    """
+    def setBakedImages(self, bakedImages):
+        if bakedImages != self.bakedImages:
+            self.bakedImages = bakedImages
+            self.chunks = {}
+    
+    def dropChunks(self, area):
+        keepRect = area.inflate(CHUNK_DROP_DISTANCE * 2, CHUNK_DROP_DISTANCE * 2)
+        for key, (chunk, chunkRect) in self.chunks.items():
+            if not keepRect.colliderect(chunkRect):
+                del self.chunks[key]
+    
+    """
+    Returns the most memory the rendered chunks can hold at once when drawing the
+    view, which is what we report to the map cache.
+    """
+    def getMaxByteSize(self):
+        chunkCols = (VIEW_WIDTH + CHUNK_DROP_DISTANCE * 2) // self.chunkSize + 2
+        chunkRows = (VIEW_HEIGHT + CHUNK_DROP_DISTANCE * 2) // self.chunkSize + 2
+        numChunks = min(chunkCols, self.chunkCols) * min(chunkRows, self.chunkRows)
+        return numChunks * self.chunkSize * self.chunkSize * view.getBytesPerPixel()
+    
+"""
+The mask tiles of a map, pre-rendered into strips so sprites can be masked by
+drawing over them on the screen rather than drawing on the sprite images.  Each
+row of tiles has a strip for each mask level + flat pair used in that row - all
+the masks in a strip have the same z, so a strip either masks a sprite or it
+doesn't (see TileDefinition.getMasks for the rules).  Tiles with more than one
+mask put each of them in a separate strip, so they're drawn in the same order.
+
+To get the same result as masking the sprite image, drawMasks must be called
+straight after the sprite is drawn.
+"""
+class MapOverlay:
+    
+    def __init__(self, mapTiles):
+        # mask images for each strip, keyed on (y, rank, level, flat) and then on x,
+        # where rank is the position of the mask in its tile's masks
+        stripMasks = {}
+        stripInfos = {}
+        for tiles in mapTiles:
+            for tile in tiles:
+                definition = tile.definition
+                if definition.masks:
+                    for rank, maskInfo in enumerate(definition.masks):
+                        key = tile.y, rank, maskInfo.level, maskInfo.flat
+                        stripInfos[key] = maskInfo
+                        tileMasks = stripMasks.setdefault(key, {}).setdefault(tile.x, [])
+                        tileMasks.append(definition.tiles[maskInfo.tileIndex])
+        # strips for each row, keyed on y - a tile's masks are in different strips
+        # in order of rank, so they're drawn in layer order like getMaskedFrame does
+        self.rows = {}
+        for key in sorted(stripMasks.keys()):
+            y = key[0]
+            strip = OverlayStrip(y, stripInfos[key], stripMasks[key])
+            self.rows.setdefault(y, []).append(strip)
+    
+    """
+    Draws the masks for the given sprite, which has just been drawn on the surface.
+    """
+    def drawMasks(self, surface, sprite):
+        mapRect = sprite.mapRect
+        maskRect = mapRect.clip(Rect(mapRect.topleft, sprite.image.get_size()))
+        if maskRect.width == 0 or maskRect.height == 0:
+            return
+        dx, dy = sprite.rect.left - mapRect.left, sprite.rect.top - mapRect.top
+        for y in range(maskRect.top // TILE_SIZE, (maskRect.bottom - 1) // TILE_SIZE + 1):
+            if y in self.rows:
+                for strip in self.rows[y]:
+                    if strip.isMasking(sprite.level, sprite.z, sprite.upright):
+                        strip.draw(surface, maskRect, dx, dy)
+    
+    def getByteSize(self):
+        return sum(strip.getByteSize() for strips in self.rows.values() for strip in strips)
+
+"""
+The masks with the same level + flat in a row of tiles.  Each run of neighbouring
+masks is rendered into a single image.
+"""
+class OverlayStrip:
+    
+    def __init__(self, y, maskInfo, tileMasks):
+        self.level = maskInfo.level
+        self.flat = maskInfo.flat
+        self.z = maskInfo.getZ(y)
+        # list of (rect, image) pairs for each run of masks
+        self.runs = []
+        xs = sorted(tileMasks.keys())
+        start = 0
+        for i in range(len(xs)):
+            if i + 1 == len(xs) or xs[i + 1] != xs[i] + 1:
+                runRect = Rect(xs[start] * TILE_SIZE, y * TILE_SIZE, (i + 1 - start) * TILE_SIZE, TILE_SIZE)
+                runImage = view.createTransparentRect(runRect.size)
+                for x in xs[start:i + 1]:
+                    for mask in tileMasks[x]:
+                        runImage.blit(mask, ((x - xs[start]) * TILE_SIZE, 0))
+                self.runs.append((runRect, runImage))
+                start = i + 1
+    
+    def isMasking(self, spriteLevel, spriteZ, spriteUpright):
+        if self.z > spriteZ:
+            return not (self.flat and self.level == spriteLevel)
+        return not (spriteUpright or self.flat or self.level < spriteLevel)
+    
+    """
+    Draws the part of the strip within maskRect (in map coordinates) onto the
+    surface, offset by dx, dy.
+    """
+    def draw(self, surface, maskRect, dx, dy):
+        for runRect, runImage in self.runs:
+            if runRect.colliderect(maskRect):
+                area = runRect.clip(maskRect)
+                position = area.left + dx, area.top + dy
+                area.move_ip(-runRect.left, -runRect.top)
+                surface.blit(runImage, position, area)
+    
+    def getByteSize(self):
+        return sum(view.getSurfaceBytes(runImage) for runRect, runImage in self.runs)
+    
+"""
+Returns a single image made by layering the given tile images in order.  The same
+stack of tile images (eg. a grass edge over water) turns up on hundreds of tiles,
+so composite images are cached on the tuple of tile images and each stack is only
+composited once across every map.
+"""
+def getCompositeImage(tiles):
+    tileImage = compositeCache.get(tiles)
+    if tileImage is None:
+        # we don't want to draw on any of the original images because that will
+        # affect every copy
+        tileImage = view.createRectangle((TILE_SIZE, TILE_SIZE), view.BLACK)
+        for image in tiles:
+            tileImage.blit(image, (0, 0))
+        compositeCache.put(tiles, tileImage, view.getSurfaceBytes(tileImage))
+    return tileImage
+
+"""
+Returns the stats for the composite image cache.  Every hit is a composite image
+we didn't have to create, so bytesSaved is the memory that deduplication saved.
+"""
+def getCompositeCacheStats():
+    stats = compositeCache.getStats()
+    stats["bytesSaved"] = stats["hits"] * TILE_SIZE * TILE_SIZE * view.getBytesPerPixel()
+    return stats
+
+"""
+A repository of named tile images cut from a single tile set image.  Tiles are
+extracted on first use as subsurfaces of the tile set image, so we only create the
+tiles a map actually uses and they share their pixels with the tile set image.
+Instances of this class are shared by every map - see parser.getTileSet.
 """
 class TileSet:
     
-    def __init__(self, tiles):
-        self.tiles = tiles
+    def __init__(self, tilesImage, tileRects):
+        self.tilesImage = tilesImage
+        self.tileRects = tileRects
+        self.tiles = {}
 
     def getTile(self, name):
         if name in self.tiles:
             return self.tiles[name]
+        if name in self.tileRects:
+            tile = self.tilesImage.subsurface(self.tileRects[name])
+            self.tiles[name] = tile
+            return tile
         return None
     
+    def getByteSize(self):
+        return view.getSurfaceBytes(self.tilesImage)
+    
 """
 Represents a single tile on an RpgMap.
 """
-class MapTile:
+class MapTile(object):
+    
+    __slots__ = ("x", "y", "point", "definition", "newLevels", "events", "maskPairs")
     
-    def __init__(self, x, y):
+    def __init__(self, x, y, definition = None):
         self.x, self.y = x, y
-        self.levels = []
-        self.tiles = []
-        self.originalLevels = None
-        self.specialLevels = None
-        self.downLevels = None
-        self.masks = None
+        self.point = (x, y)
+        self.definition = definition or emptyDefinition
+        # copy of the definition levels, only made when a new level is added
+        self.newLevels = None
         self.events = None
-        
-    def addLevel(self, level):
-        self.levels.append(level)
+        # the definition's mask lookup with each entry paired with this tile's point
+        self.maskPairs = None
+        if self.definition.masks:
+            self.maskPairs = self.createMaskPairs()
+    
+    @property
+    def levels(self):
+        if self.newLevels is None:
+            return self.definition.levels
+        return self.newLevels
+    
+    @property
+    def tiles(self):
+        return self.definition.tiles
+    
+    @property
+    def specialLevels(self):
+        return self.definition.specialLevels
+    
+    @property
+    def downLevels(self):
+        return self.definition.downLevels
+    
+    @property
+    def masks(self):
+        return self.definition.masks
     
     """
     If we add a new level (eg. when the player opens a door) we need to restore
-    the map to its original state when we next pull it from the cache - hence we
-    store the original levels before adding to them.
+    the map to its original state when we next pull it from the cache - the
+    definition is shared, so we add the level to a copy of its levels.
     """    
     def addNewLevel(self, level):
-        if self.originalLevels == None:
-            self.originalLevels = [l for l in self.levels]
-        self.addLevel(level)
+        if self.newLevels is None:
+            self.newLevels = list(self.definition.levels)
+        self.newLevels.append(level)
         return self
         
     def restore(self):
-        if self.originalLevels == None:
-            return
-        self.levels = self.originalLevels
-        self.originalLevels = None		
-        
-    def addTile(self, tile):
-        self.tiles.append(tile)
-        
-    def addSpecialLevel(self, level):
-        if not self.specialLevels:
-            self.specialLevels = {}
-        if int(level) == level:
-            self.specialLevels[level] = level
-        else:
-            self.specialLevels[math.floor(level)] = level
-            self.specialLevels[math.ceil(level)] = level
-    
-    def addDownLevel(self, level, downLevel):
-        # print "DOWN: %s %s" % (level, downLevel)
-        if not self.downLevels:
-            self.downLevels = {}
-        self.downLevels[level] = downLevel
-           
-    def addMask(self, tileIndex, level, flat = True):
-        if not self.masks:
-            self.masks = []
-        self.masks.append(MaskInfo(tileIndex, level, flat, self.y))
+        self.newLevels = None
         
     def addEvent(self, event):
         if not self.events:
@@ -318,16 +726,7 @@ class MapTile:
         self.events.append(event)
             
     def createTileImage(self):
-        if len(self.tiles) == 0:
-            return None
-        elif len(self.tiles) > 1:
-            # if we're layering more than one image we don't want to draw on any of
-            # the original images because that will affect every copy
-            tileImage = view.createRectangle((TILE_SIZE, TILE_SIZE), view.BLACK)
-            for image in self.tiles:
-                tileImage.blit(image, (0, 0))
-            return tileImage
-        return self.tiles[0]
+        return self.definition.createTileImage()
     
     def testValidity(self, level):
         if level in self.levels:
@@ -343,48 +742,53 @@ class MapTile:
         return 0, None
     
     def getSpecialLevel(self, level):
-        if not self.specialLevels:
+        specialLevels = self.definition.specialLevels
+        if not specialLevels:
             return None
-        if level in self.specialLevels:
-            return self.specialLevels[level]
+        if level in specialLevels:
+            return specialLevels[level]
         key = math.floor(level)
-        if key in self.specialLevels:
-            return self.specialLevels[key]
+        if key in specialLevels:
+            return specialLevels[key]
         key = math.ceil(level)
-        if key in self.specialLevels:
-            return self.specialLevels[key]
+        if key in specialLevels:
+            return specialLevels[key]
         return None
     
     def getDownLevel(self, level):
-        if not self.downLevels:
+        downLevels = self.definition.downLevels
+        if not downLevels:
             return None
-        if level in self.downLevels:
-            return self.downLevels[level]
+        if level in downLevels:
+            return downLevels[level]
     
-    def getEvent(self, level):
-        if not self.events:
+    """
+    Returns a tuple of the mask images that apply to a sprite with the given level, z
+    + upright attributes, or None if there aren't any.
+    """
+    def getMasks(self, spriteLevel, spriteZ, spriteUpright):
+        if not self.definition.masks:
             return None
-        for event in self.events:
-            if event.level == level:
-                return event
-        return None
+        return self.definition.getMasks(spriteLevel, spriteZ - self.y * TILE_SIZE,
+                                        spriteUpright)
     
-    def getMasks(self, spriteLevel, spriteZ, spriteUpright):
-        if not self.masks:
+    """
+    As getMasks, but returns a tuple holding a single (tile point, mask images) pair,
+    which is the same tuple every time - see RpgMap.getMasks.
+    """
+    def getMaskPairs(self, spriteLevel, spriteZ, spriteUpright):
+        if self.maskPairs is None:
             return None
-        masks = []
-        for maskInfo in self.masks:
-            if maskInfo.z > spriteZ:
-                if maskInfo.flat and maskInfo.level == spriteLevel:
-                    continue
-                masks.append(self.tiles[maskInfo.tileIndex])
-            else:
-                if spriteUpright or maskInfo.flat or maskInfo.level < spriteLevel:
-                    continue
-                masks.append(self.tiles[maskInfo.tileIndex])
-        if len(masks) > 0:
-            return masks
-        return None
+        index = self.definition.getMaskIndex(spriteLevel, spriteZ - self.y * TILE_SIZE,
+                                             spriteUpright)
+        return self.maskPairs[index]
+    
+    def createMaskPairs(self):
+        pairs = {}
+        for masks in self.definition.maskLookup:
+            if masks and masks not in pairs:
+                pairs[masks] = ((self.point, masks),)
+        return tuple(pairs.get(masks) for masks in self.definition.maskLookup)
         
     def __str__(self):
         result = "<MapTile:\
@@ -397,14 +801,143 @@ class MapTile:
         return result
 
 """
-Encapsulates information required for masking. 
+The parts of a map tile that never change - its levels, special levels, down levels,
+tile images and masks.  Most tiles are identical to plenty of others apart from
+their position, so definitions are interned by getTileDefinition and shared by all
+the tiles that use them, across every map.  Don't modify them.
 """
-class MaskInfo:
-    def __init__(self, tileIndex, level, flat, y):
+class TileDefinition(object):
+    
+    __slots__ = ("levels", "specialLevels", "downLevels", "tiles", "masks",
+                 "maskZs", "maskLevels", "maskLookup", "__weakref__")
+    
+    def __init__(self, levels, specials, downs, tiles, masks):
+        self.levels = levels
+        self.specialLevels = None
+        for level in specials:
+            self.addSpecialLevel(level)
+        self.downLevels = None
+        for i in range(0, len(downs), 2):
+            self.addDownLevel(downs[i], downs[i + 1])
+        self.tiles = tiles
+        self.masks = None
+        if masks:
+            self.masks = tuple(MaskInfo(masks[i], masks[i + 1], masks[i + 2] == 1)
+                               for i in range(0, len(masks), 3))
+            self.maskZs = sorted(set(maskInfo.getZ(0) for maskInfo in self.masks))
+            self.maskLevels = sorted(set(maskInfo.level for maskInfo in self.masks))
+            self.maskLookup = self.createMaskLookup()
+        
+    def addSpecialLevel(self, level):
+        if not self.specialLevels:
+            self.specialLevels = {}
+        if int(level) == level:
+            self.specialLevels[level] = level
+        else:
+            self.specialLevels[math.floor(level)] = level
+            self.specialLevels[math.ceil(level)] = level
+    
+    def addDownLevel(self, level, downLevel):
+        if not self.downLevels:
+            self.downLevels = {}
+        self.downLevels[level] = downLevel
+    
+    def createTileImage(self):
+        if len(self.tiles) == 0:
+            return None
+        elif len(self.tiles) > 1:
+            return getCompositeImage(self.tiles)
+        return self.tiles[0]
+    
+    """
+    Returns the mask images that apply to a sprite, where z is relative to a tile at
+    y = 0, as a tuple from the mask lookup - or None if there aren't any.
+    """
+    def getMasks(self, spriteLevel, spriteZ, spriteUpright):
+        return self.maskLookup[self.getMaskIndex(spriteLevel, spriteZ, spriteUpright)]
+    
+    """
+    Returns the index in the mask lookup for a sprite, where z is relative to a tile
+    at y = 0.  Masks are either in front of or behind the sprite depending on their
+    z, so the z of the sprite is reduced to the number of mask z values it is in
+    front of (or level with).  Masks only compare their level with the sprite level,
+    so the sprite level is reduced to its rank among the mask levels - odd ranks are
+    the mask levels themselves and even ranks are the levels in between.
+    """
+    def getMaskIndex(self, spriteLevel, spriteZ, spriteUpright):
+        maskLevels = self.maskLevels
+        i = bisect.bisect_left(maskLevels, spriteLevel)
+        if i < len(maskLevels) and maskLevels[i] == spriteLevel:
+            levelRank = i * 2 + 1
+        else:
+            levelRank = i * 2
+        zRank = bisect.bisect_right(self.maskZs, spriteZ)
+        index = (zRank * (len(maskLevels) * 2 + 1) + levelRank) * 2
+        if spriteUpright:
+            return index + 1
+        return index
+    
+    """
+    Works out the masks for every z rank, level rank + upright flag when the
+    definition is created, in getMaskIndex order.  Combinations with the same masks
+    share the same tuple.
+    """
+    def createMaskLookup(self):
+        zRanks = [self.maskZs.index(maskInfo.getZ(0)) for maskInfo in self.masks]
+        levelRanks = [self.maskLevels.index(maskInfo.level) * 2 + 1 for maskInfo in self.masks]
+        maskSets = {}
+        lookup = []
+        for zRank in range(len(self.maskZs) + 1):
+            for levelRank in range(len(self.maskLevels) * 2 + 1):
+                for spriteUpright in (False, True):
+                    masks = []
+                    for i, maskInfo in enumerate(self.masks):
+                        if zRanks[i] >= zRank:
+                            # the mask is in front of the sprite
+                            if maskInfo.flat and levelRanks[i] == levelRank:
+                                continue
+                            masks.append(self.tiles[maskInfo.tileIndex])
+                        else:
+                            if spriteUpright or maskInfo.flat or levelRanks[i] < levelRank:
+                                continue
+                            masks.append(self.tiles[maskInfo.tileIndex])
+                    masks = tuple(masks) or None
+                    lookup.append(maskSets.setdefault(masks, masks))
+        return tuple(lookup)
+
+# interned tile definitions, which are dropped once no map is using them
+tileDefinitions = weakref.WeakValueDictionary()
+
+"""
+Returns the interned tile definition for the given levels, specials, downs, tile
+images and masks - all of which must be tuples.  Downs are pairs of level + down
+level, and masks are triples of tile index, level + flat (1 or 0).
+"""
+def getTileDefinition(levels, specials, downs, tiles, masks):
+    key = levels, specials, downs, tiles, masks
+    definition = tileDefinitions.get(key)
+    if definition is None:
+        definition = TileDefinition(levels, specials, downs, tiles, masks)
+        tileDefinitions[key] = definition
+    return definition
+
+emptyDefinition = getTileDefinition((), (), (), (), ())
+
+"""
+Encapsulates information required for masking.  Mask info is shared by every tile
+with the same definition, so the z order depends on the tile it is applied to.
+"""
+class MaskInfo(object):
+    
+    __slots__ = ("tileIndex", "level", "flat")
+    
+    def __init__(self, tileIndex, level, flat):
         self.level = level
         self.flat = flat
         self.tileIndex = tileIndex
-        self.z = (y + 1) * TILE_SIZE + level * TILE_SIZE - 1
+    
+    def getZ(self, y):
+        return (y + 1) * TILE_SIZE + self.level * TILE_SIZE - 1
 
 """
 Sprite placeholder that is later used to construct a real sprite.
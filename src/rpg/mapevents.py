@@ -59,6 +59,7 @@ class BoundaryEvent(MapEvent):
             self.range = range(min, max + 1)
         else:
             self.range = [min]
+        self.min, self.max = min, max if max else min
 
 """
 Transition base class.
@@ -0,0 +1,244 @@
+#! /usr/bin/env python
+
+import os
+import mmap
+import struct
+
+"""
+Compiled map format.  A compiled map holds exactly the same information as the
+text map file it was built from, but the level, special level, down level, tile
+and mask data is stored as packed arrays.  Most tiles are identical to others
+apart from their position, so this data is only stored once for each distinct tile
+definition, along with the definition ID of every tile in tile order (x major,
+then y).  Tile references (eg. grass:n1) along with sprite and event tokens are
+stored as integer IDs into a single string table.
+
+Compiled maps are written by compilemaps.py and are loaded by parser.loadRpgMap
+in preference to the text format, as long as they are not stale.  The header
+records the modified time + size of the source map so we can tell.
+"""
+
+COMPILED_EXTENSION = ".mapc"
+
+MAGIC = "ULMC"
+VERSION = 3
+NO_STRING = -1
+
+# magic, version, source mtime, source size, cols, rows, music string id - the
+# mtime is kept to the fraction of a second, as a map can be edited within a second
+# of being compiled
+HEADER = struct.Struct("<4sHdqIIi")
+COUNT = struct.Struct("<I")
+STRING_LENGTH = struct.Struct("<H")
+
+# typecodes for the index and values of each packed table, in file order
+INDEX_TYPE = "I"
+LEVELS_TYPE = "h"
+SPECIALS_TYPE = "d"
+DOWNS_TYPE = "h"
+LAYERS_TYPE = "I"
+MASKS_TYPE = "h"
+TOKENS_TYPE = "I"
+
+def getCompiledPath(mapPath):
+    return os.path.splitext(mapPath)[0] + COMPILED_EXTENSION
+
+def getSourceInfo(sourcePath):
+    try:
+        st = os.stat(sourcePath)
+        return st.st_mtime, st.st_size
+    except OSError:
+        return None
+
+"""
+A table of variable length rows packed into a single flat list of values.  Row i
+occupies values[index[i]:index[i + 1]].
+"""
+class PackedTable:
+
+    def __init__(self, index = None, values = None):
+        self.index = index if index is not None else [0]
+        self.values = values if values is not None else []
+
+    def addRow(self, row):
+        self.values.extend(row)
+        self.index.append(len(self.values))
+
+    def getRow(self, i):
+        return self.values[self.index[i]:self.index[i + 1]]
+
+    def __len__(self):
+        return len(self.index) - 1
+
+"""
+Everything required to build an RpgMap, independent of where it was loaded from.
+Tile definitions are stored in the packed tables with one row per definition, and
+tiles holds the definition ID for each tile, where tile x, y is at x * rows + y.
+The rows are laid out as follows:
+
+levels   - level, ...
+specials - special level, ...
+downs    - level, down level, ...
+layers   - tile reference string id, ...
+masks    - tile index, level, flat, ...
+sprites  - token string id, ... (one row per sprite line)
+events   - token string id, ... (one row per event line)
+"""
+class MapData:
+
+    def __init__(self, cols = 0, rows = 0, music = None):
+        self.cols, self.rows = cols, rows
+        self.music = music
+        self.strings = []
+        self.stringIds = {}
+        self.levels = PackedTable()
+        self.specials = PackedTable()
+        self.downs = PackedTable()
+        self.layers = PackedTable()
+        self.masks = PackedTable()
+        self.sprites = PackedTable()
+        self.events = PackedTable()
+        self.tiles = []
+        self.definitionIds = {}
+
+    def getStringId(self, value):
+        if value in self.stringIds:
+            return self.stringIds[value]
+        stringId = len(self.strings)
+        self.strings.append(value)
+        self.stringIds[value] = stringId
+        return stringId
+
+    def addTile(self, levels, specials, downs, layers, masks):
+        layers = [self.getStringId(layer) for layer in layers]
+        key = tuple(levels), tuple(specials), tuple(downs), tuple(layers), tuple(masks)
+        if key not in self.definitionIds:
+            self.definitionIds[key] = len(self.levels)
+            self.levels.addRow(levels)
+            self.specials.addRow(specials)
+            self.downs.addRow(downs)
+            self.layers.addRow(layers)
+            self.masks.addRow(masks)
+        self.tiles.append(self.definitionIds[key])
+
+    def addSprite(self, tokens):
+        self.sprites.addRow([self.getStringId(token) for token in tokens])
+
+    def addEvent(self, tokens):
+        self.events.addRow([self.getStringId(token) for token in tokens])
+
+    def getLines(self, table):
+        return [[self.strings[i] for i in table.getRow(row)] for row in range(len(table))]
+
+    def getSpriteData(self):
+        return self.getLines(self.sprites)
+
+    def getEventData(self):
+        return self.getLines(self.events)
+
+def writeTable(mapFile, table, valuesType):
+    writeArray(mapFile, table.index, INDEX_TYPE)
+    writeArray(mapFile, table.values, valuesType)
+
+def writeArray(mapFile, values, typecode):
+    mapFile.write(COUNT.pack(len(values)))
+    mapFile.write(struct.pack("<%d%s" % (len(values), typecode), *values))
+
+"""
+Writes the given map data to the compiled path, stamping it with the modified time
++ size of the source map.
+"""
+def writeMapData(mapData, compiledPath, sourcePath):
+    mtime, size = getSourceInfo(sourcePath)
+    music = NO_STRING
+    if mapData.music:
+        music = mapData.getStringId(mapData.music)
+    with open(compiledPath, "wb") as mapFile:
+        mapFile.write(HEADER.pack(MAGIC, VERSION, mtime, size,
+                                  mapData.cols, mapData.rows, music))
+        mapFile.write(COUNT.pack(len(mapData.strings)))
+        for value in mapData.strings:
+            mapFile.write(STRING_LENGTH.pack(len(value)))
+            mapFile.write(value)
+        writeTable(mapFile, mapData.levels, LEVELS_TYPE)
+        writeTable(mapFile, mapData.specials, SPECIALS_TYPE)
+        writeTable(mapFile, mapData.downs, DOWNS_TYPE)
+        writeTable(mapFile, mapData.layers, LAYERS_TYPE)
+        writeTable(mapFile, mapData.masks, MASKS_TYPE)
+        writeArray(mapFile, mapData.tiles, INDEX_TYPE)
+        writeTable(mapFile, mapData.sprites, TOKENS_TYPE)
+        writeTable(mapFile, mapData.events, TOKENS_TYPE)
+
+"""
+Reads packed values sequentially from a memory mapped compiled map.
+"""
+class MapReader:
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def unpack(self, packer):
+        values = packer.unpack_from(self.buffer, self.offset)
+        self.offset += packer.size
+        return values
+
+    def readCount(self):
+        return self.unpack(COUNT)[0]
+
+    def readString(self):
+        length = self.unpack(STRING_LENGTH)[0]
+        value = self.buffer[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+    def readArray(self, typecode):
+        count = self.readCount()
+        fmt = "<%d%s" % (count, typecode)
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def readTable(self, valuesType):
+        index = self.readArray(INDEX_TYPE)
+        values = self.readArray(valuesType)
+        return PackedTable(index, values)
+
+"""
+Returns the map data held in the compiled path, or None if the compiled map is
+missing, unreadable or stale with respect to the source map.  If the source map
+does not exist the compiled map is used as is.
+"""
+def readMapData(compiledPath, sourcePath):
+    try:
+        with open(compiledPath, "rb") as mapFile:
+            buffer = mmap.mmap(mapFile.fileno(), 0, access = mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return None
+    try:
+        return readBuffer(buffer, getSourceInfo(sourcePath))
+    except (struct.error, IndexError):
+        return None
+    finally:
+        buffer.close()
+
+def readBuffer(buffer, sourceInfo):
+    reader = MapReader(buffer)
+    magic, version, mtime, size, cols, rows, music = reader.unpack(HEADER)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if sourceInfo and sourceInfo != (mtime, size):
+        return None
+    mapData = MapData(cols, rows)
+    mapData.strings = [reader.readString() for i in range(reader.readCount())]
+    if music != NO_STRING:
+        mapData.music = mapData.strings[music]
+    mapData.levels = reader.readTable(LEVELS_TYPE)
+    mapData.specials = reader.readTable(SPECIALS_TYPE)
+    mapData.downs = reader.readTable(DOWNS_TYPE)
+    mapData.layers = reader.readTable(LAYERS_TYPE)
+    mapData.masks = reader.readTable(MASKS_TYPE)
+    mapData.tiles = reader.readArray(INDEX_TYPE)
+    mapData.sprites = reader.readTable(TOKENS_TYPE)
+    mapData.events = reader.readTable(TOKENS_TYPE)
+    return mapData
@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+
+from __future__ import with_statement
+
+import os
+import sys
+import random
+
+"""
+Generates synthetic maps in the text map format, so we can see how the game copes
+with maps far bigger than the ones it ships with.  Like benchmark.py this is run
+from the rpg folder:
+
+$ python mapgen.py <cols> <rows> [sprite density] [map path]
+
+The map is made up of blocks of BLOCK_TILES x BLOCK_TILES tiles, each of which is
+open ground, a raised plateau with stairs down the front (and sometimes a pit),
+a copse of trees or water.  Sprites are scattered over the open ground - sprite
+density is the number of sprites per 100 tiles of open ground.  Some open ground
+has a tile event that takes the player elsewhere on the map, and every boundary
+wraps around to the opposite side.  The same arguments always give the same map.
+"""
+
+BLOCK_TILES = 8
+SPRITE_DENSITY = 1.0
+RANDOM_SEED = 1
+
+FIELD, PLATEAU, TREES, WATER = range(4)
+
+# each kind of block is chosen in proportion to its weight
+BLOCK_WEIGHTS = ((FIELD, 9), (PLATEAU, 7), (TREES, 2), (WATER, 2))
+
+PIT_CHANCE = 0.5
+TILE_EVENT_CHANCE = 0.1
+
+# plain ground, with the odd variation
+GROUND_TILES = ("grass:n1",) * 6 + ("grass:n2", "grass:n3", "grass:n4", "grass:n5", "grass:n6")
+
+PLATEAU_TILE = "[2] grass:light"
+# the front edge of a plateau, with the cliff top masking sprites below it
+CLIFF_TILE = "[2,1] grass:n1 grass:t2:2"
+# stairs down the front of a plateau, from top to bottom
+STAIR_TILES = ("[S2] grass:bb", "[S1.5] grass:light wood:st2", "[S1] grass:st2")
+STAIR_X = 3
+PIT_TILE = "[D2-1] earth:drop"
+PIT_X = 5
+TREE_TILE = "[1] grass:n1 objects:tree_mr1:V2"
+WATER_TILE = "water:w1"
+
+SPRITE_TYPES = ("beetle", "beetle", "coin", "rock", "flames", "wasp", "chest")
+# sprites are placed so a beetle's path fits inside the block
+BEETLE_PATH = ((0, 0), (2, 0), (2, 2), (0, 2))
+
+"""
+Returns the kind of each block, indexed on block x, y.  Blocks that don't fit
+inside the map are always open ground.
+"""
+def createBlocks(cols, rows, rnd):
+    kinds = []
+    for kind, weight in BLOCK_WEIGHTS:
+        kinds += [kind] * weight
+    blockCols = (cols + BLOCK_TILES - 1) // BLOCK_TILES
+    blockRows = (rows + BLOCK_TILES - 1) // BLOCK_TILES
+    blocks = []
+    for bx in range(blockCols):
+        column = []
+        for by in range(blockRows):
+            if isFullBlock(bx, by, cols, rows):
+                kind = rnd.choice(kinds)
+                pit = kind == PLATEAU and rnd.random() < PIT_CHANCE
+                column.append((kind, pit))
+            else:
+                column.append((FIELD, False))
+        blocks.append(column)
+    return blocks
+
+def isFullBlock(bx, by, cols, rows):
+    return (bx + 1) * BLOCK_TILES <= cols and (by + 1) * BLOCK_TILES <= rows
+
+def getGroundTile(rnd):
+    return "[1] %s" % rnd.choice(GROUND_TILES)
+
+"""
+Returns the tile bits for the tile at the given position within a block.
+"""
+def getTileBits(kind, pit, lx, ly, rnd):
+    if kind == WATER:
+        return WATER_TILE
+    if kind == TREES and (lx + ly) % 3 == 0:
+        return TREE_TILE
+    if kind == PLATEAU and 1 <= lx < BLOCK_TILES - 1:
+        if lx == STAIR_X and ly >= BLOCK_TILES - 3:
+            return STAIR_TILES[ly - BLOCK_TILES + 3]
+        if ly == BLOCK_TILES - 3:
+            return CLIFF_TILE
+        if 1 <= ly < BLOCK_TILES - 3:
+            if pit and lx == PIT_X and 2 <= ly <= 3:
+                return PIT_TILE
+            return PLATEAU_TILE
+    return getGroundTile(rnd)
+
+def getFieldBlocks(blocks, cols, rows):
+    return [(bx, by) for bx, column in enumerate(blocks) for by, (kind, pit) in enumerate(column)
+            if kind == FIELD and isFullBlock(bx, by, cols, rows)]
+
+def getSpriteLines(fieldBlocks, spriteDensity, rnd):
+    spritesPerBlock = spriteDensity * BLOCK_TILES * BLOCK_TILES / 100.0
+    lines = []
+    for bx, by in fieldBlocks:
+        count = int(spritesPerBlock)
+        if rnd.random() < spritesPerBlock - count:
+            count += 1
+        for i in range(count):
+            x = bx * BLOCK_TILES + rnd.randint(0, BLOCK_TILES - 3)
+            y = by * BLOCK_TILES + rnd.randint(0, BLOCK_TILES - 3)
+            type = rnd.choice(SPRITE_TYPES)
+            if type == "beetle":
+                points = " ".join("%s,%s" % (x + px, y + py) for px, py in BEETLE_PATH)
+            else:
+                points = "%s,%s" % (x, y)
+            lines.append("sprite %s 1 %s" % (type, points))
+    return lines
+
+"""
+Returns tile events that take the player from the middle of some of the open ground
+blocks to the middle of another, along with boundary events for every block along
+each boundary that take the player to the opposite boundary.
+"""
+def getEventLines(mapName, fieldBlocks, cols, rows, rnd):
+    lines = []
+    middle = BLOCK_TILES // 2
+    for bx, by in fieldBlocks:
+        if rnd.random() < TILE_EVENT_CHANCE:
+            tx, ty = rnd.choice(fieldBlocks)
+            lines.append("event tile %s,%s 1 : transition %s %s,%s 1 down" % (
+                bx * BLOCK_TILES + middle, by * BLOCK_TILES + middle, mapName,
+                tx * BLOCK_TILES + middle, ty * BLOCK_TILES + middle + 1))
+    for boundary, numTiles in (("up", cols), ("down", cols), ("left", rows), ("right", rows)):
+        for first in range(0, numTiles, BLOCK_TILES):
+            last = min(first + BLOCK_TILES, numTiles) - 1
+            lines.append("event boundary %s %s-%s : boundary %s %s 0" % (boundary, first, last,
+                                                                        mapName, boundary))
+    return lines
+
+"""
+Writes a map of the given size to mapPath.  The map is named after the file, as
+its events refer to the map by name.
+"""
+def generateMap(mapPath, cols, rows, spriteDensity = SPRITE_DENSITY, seed = RANDOM_SEED):
+    rnd = random.Random(seed)
+    mapName = os.path.splitext(os.path.basename(mapPath))[0]
+    blocks = createBlocks(cols, rows, rnd)
+    with open(mapPath, "w") as mapFile:
+        for y in range(rows):
+            by, ly = divmod(y, BLOCK_TILES)
+            for x in range(cols):
+                bx, lx = divmod(x, BLOCK_TILES)
+                kind, pit = blocks[bx][by]
+                mapFile.write("%s,%s %s\n" % (x, y, getTileBits(kind, pit, lx, ly, rnd)))
+        fieldBlocks = getFieldBlocks(blocks, cols, rows)
+        mapFile.write("\n")
+        for line in getSpriteLines(fieldBlocks, spriteDensity, rnd):
+            mapFile.write(line + "\n")
+        mapFile.write("\n")
+        for line in getEventLines(mapName, fieldBlocks, cols, rows, rnd):
+            mapFile.write(line + "\n")
+        mapFile.write("\nmusic main\n")
+
+def mapGenMain(args):
+    if len(args) < 2:
+        print "usage: python mapgen.py <cols> <rows> [sprite density] [map path]"
+        return
+    cols, rows = int(args[0]), int(args[1])
+    spriteDensity = float(args[2]) if len(args) > 2 else SPRITE_DENSITY
+    mapPath = args[3] if len(args) > 3 else "synthetic-%sx%s.map" % (cols, rows)
+    generateMap(mapPath, cols, rows, spriteDensity)
+    print "generated: %s" % os.path.abspath(mapPath)
+
+# this calls the mapGenMain function when this script is executed
+if __name__ == '__main__': mapGenMain(sys.argv[1:])
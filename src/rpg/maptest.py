@@ -1,13 +1,32 @@
 #! /usr/bin/env python
 
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import pygame
 import parser
+import mapformat
 import view
+import map
+import levelgrid
+import renderers
+import sprites
+import othersprites
+import scheduler
+import spatialhash
+import replay
+import mapgen
+import registry
+import eventbus
+import gameclock
 
 from pygame.locals import Rect
 
-from view import TILE_SIZE
+from view import TILE_SIZE, VIEW_WIDTH, VIEW_HEIGHT, LEFT
 
 # initialize everything
 pygame.init()
@@ -16,6 +35,7 @@ screen = pygame.display.set_mode((1, 1))
 # this feels a bit hacky - is there a better way to do it?
 parser.MAPS_FOLDER = "../maps"
 parser.TILES_FOLDER = "../tiles"
+othersprites.SPRITES_FOLDER = "../sprites"
 
 rpgMap = parser.loadRpgMap("unit")
 
@@ -31,6 +51,13 @@ class MockSprite:
         # pseudo z order that is used to test if one sprite is behind another
         self.z = int(self.mapRect.bottom + self.level * TILE_SIZE)
         
+class MockFrames:
+    
+    def __init__(self, image):
+        self.image = image
+        
+    def advanceFrame(self, increment, **metadata):
+        return self.image, 0
 
 class GetMasksTest(unittest.TestCase):
     
@@ -110,6 +137,18 @@ class GetMasksTest(unittest.TestCase):
         spriteInfo.move(0, TILE_SIZE)
         self.assertEqual(0, len(rpgMap.getMasks(spriteInfo)))
 
+    def testShared(self):
+        rect = Rect(6 * TILE_SIZE + 2, 1 * TILE_SIZE - 24, 28, 48)
+        spriteInfo = MockSprite(rect, 1)
+        spriteInfo.move(0, 0)
+        self.assertTrue(rpgMap.getMasks(spriteInfo) is map.NO_MASKS)
+        spriteInfo.move(0, TILE_SIZE)
+        tilePoint, tileMasks = rpgMap.getMasks(spriteInfo)[0]
+        self.assertTrue(tileMasks is rpgMap.getMasks(spriteInfo)[0][1])
+        # masks from a single tile are that tile's own tuple
+        self.assertEqual(1, len(rpgMap.getMasks(spriteInfo)))
+        self.assertTrue(rpgMap.getMasks(spriteInfo) is rpgMap.getMasks(spriteInfo))
+
 class MovementValidTest(unittest.TestCase):
 
     def testSpan1_1(self):
@@ -384,5 +423,717 @@ class MovementValidTest(unittest.TestCase):
         self.assertEqual((True, 1), rpgMap.isMoveValid(1, baseRect))
         self.assertEqual((False, 2), rpgMap.isMoveValid(2, baseRect))
         
+class TileSetCacheTest(unittest.TestCase):
+
+    def testShared(self):
+        # unit map is already loaded, so water + grass are in the cache
+        tileSet = parser.getTileSet("grass")
+        self.assertTrue(tileSet is parser.getTileSet("grass"))
+        self.assertTrue(tileSet.getTile("n1") is tileSet.getTile("n1"))
+        # only the tiles that have been used are extracted
+        self.assertTrue(len(tileSet.tiles) < len(tileSet.tileRects))
+        self.assertEqual(None, tileSet.getTile("unknown"))
+        
+    def testEviction(self):
+        tileSetCache = parser.tileSetCache
+        maxBytes = tileSetCache.maxBytes
+        try:
+            tileSetCache.setMaxBytes(parser.getTileSet("water").getByteSize())
+            self.assertEqual(1, len(tileSetCache))
+            self.assertTrue("water" in tileSetCache)
+        finally:
+            tileSetCache.setMaxBytes(maxBytes)
+
+"""
+Checks that the level grid gives exactly the same answers as the tiles, by making
+the same movement checks on each map with the level grid and without it.
+"""
+@unittest.skipIf(levelgrid.numpy is None, "the level grid requires numpy")
+class LevelGridTest(unittest.TestCase):
+
+    def getMapNames(self):
+        return sorted(fileName[:-len(parser.MAP_EXTENSION)] for fileName in os.listdir(parser.MAPS_FOLDER)
+                      if fileName.endswith(parser.MAP_EXTENSION))
+
+    def getInterestingTiles(self, gridMap):
+        return [tile for tiles in gridMap.mapTiles for tile in tiles
+                if tile.specialLevels or tile.downLevels or tile.events or len(tile.levels) > 1]
+
+    """
+    Returns a random base rect + level - half of the rects touch a tile with special
+    levels, down levels, events or more than one level, and half of the levels are
+    taken from the tile itself.
+    """
+    def getRandomMove(self, gridMap, tiles, rnd):
+        width, height = rnd.choice(((24, 12), (32, 16), (20, 8), (4, 4), (TILE_SIZE * 2, TILE_SIZE)))
+        if tiles and rnd.random() < 0.5:
+            tile = rnd.choice(tiles)
+            x = tile.x * TILE_SIZE + rnd.randint(-width + 1, TILE_SIZE - 1)
+            y = tile.y * TILE_SIZE + rnd.randint(-height + 1, TILE_SIZE - 1)
+        else:
+            tile = None
+            x = rnd.randint(-width // 2, gridMap.mapRect.width - width // 2)
+            y = rnd.randint(-height // 2, gridMap.mapRect.height - height // 2)
+        tileLevels = []
+        if tile and rnd.random() < 0.5:
+            tileLevels = list(tile.levels)
+            tileLevels += (tile.specialLevels or {}).keys() + (tile.specialLevels or {}).values()
+            tileLevels += (tile.downLevels or {}).keys()
+        level = rnd.choice(tileLevels or [0, 1, 2, 3, 4, 5, 6, 1.5, 2.5, 3.5, 4.5, 5.5])
+        return level, Rect(x, y, width, height)
+
+    def getMoveResults(self, gridMap, level, baseRect):
+        valid = gridMap.isMoveValid(level, baseRect)
+        return (valid, gridMap.isVerticalValid(level, baseRect), gridMap.isHorizontalValid(level, baseRect),
+                gridMap.getActionEvent(level, baseRect))
+
+    def assertSameResults(self, gridMap, level, baseRect):
+        levelGrid = gridMap.levelGrid
+        gridResults = self.getMoveResults(gridMap, level, baseRect)
+        gridMap.levelGrid = None
+        try:
+            tileResults = self.getMoveResults(gridMap, level, baseRect)
+        finally:
+            gridMap.levelGrid = levelGrid
+        self.assertEqual(tileResults, gridResults, "%s level %s %s" % (gridMap.name, level, baseRect))
+
+    def testSameAsTiles(self):
+        rnd = random.Random(1)
+        for mapName in self.getMapNames():
+            gridMap = parser.loadRpgMap(mapName)
+            self.assertTrue(gridMap.levelGrid)
+            tiles = self.getInterestingTiles(gridMap)
+            for i in range(2000):
+                self.assertSameResults(gridMap, *self.getRandomMove(gridMap, tiles, rnd))
+
+    def testUpdates(self):
+        rnd = random.Random(2)
+        for mapName in self.getMapNames():
+            gridMap = parser.loadRpgMap(mapName)
+            tiles = self.getInterestingTiles(gridMap)
+            for i in range(20):
+                x, y = rnd.randrange(gridMap.cols), rnd.randrange(gridMap.rows)
+                # include levels above any the map uses, which adds levels to the grid
+                gridMap.addTileLevel(x, y, rnd.choice([1, 2, 3, 4, 5, 7]))
+                nearby = [gridMap.mapTiles[x][y]] + tiles
+                for j in range(50):
+                    self.assertSameResults(gridMap, *self.getRandomMove(gridMap, nearby, rnd))
+                gridMap.restoreTile(x, y)
+                for j in range(50):
+                    self.assertSameResults(gridMap, *self.getRandomMove(gridMap, nearby, rnd))
+
+class CompositeCacheTest(unittest.TestCase):
+
+    def testShared(self):
+        water = parser.getTileImage("water:w1")
+        grass = parser.getTileImage("grass:n1")
+        hits = map.getCompositeCacheStats()["hits"]
+        tileImage = map.getCompositeImage((water, grass))
+        self.assertTrue(tileImage is map.getCompositeImage((water, grass)))
+        self.assertFalse(tileImage is map.getCompositeImage((grass, water)))
+        self.assertTrue(map.getCompositeCacheStats()["hits"] > hits)
+
+class TileDefinitionTest(unittest.TestCase):
+
+    def testShared(self):
+        definitions = set(tile.definition for tiles in rpgMap.mapTiles for tile in tiles)
+        self.assertTrue(len(definitions) < rpgMap.cols * rpgMap.rows)
+        definition = map.getTileDefinition((1,), (), (), (), ())
+        self.assertTrue(definition is map.getTileDefinition((1,), (), (), (), ()))
+        
+    def testNewLevel(self):
+        definition = map.getTileDefinition((1,), (), (), (), ())
+        tile1, tile2 = map.MapTile(0, 0, definition), map.MapTile(1, 0, definition)
+        tile1.addNewLevel(2)
+        self.assertEqual([1, 2], tile1.levels)
+        self.assertEqual((1,), tile2.levels)
+        tile1.restore()
+        self.assertEqual((1,), tile1.levels)
+
+    # the masks for a sprite, worked out from the mask info without the lookup
+    def getMasks(self, definition, spriteLevel, spriteZ, spriteUpright):
+        masks = []
+        for maskInfo in definition.masks:
+            if maskInfo.getZ(0) > spriteZ:
+                if maskInfo.flat and maskInfo.level == spriteLevel:
+                    continue
+            elif spriteUpright or maskInfo.flat or maskInfo.level < spriteLevel:
+                continue
+            masks.append(definition.tiles[maskInfo.tileIndex])
+        return tuple(masks) or None
+
+    def testMaskLookup(self):
+        definitions = set()
+        for fileName in os.listdir(parser.MAPS_FOLDER):
+            if fileName.endswith(parser.MAP_EXTENSION):
+                mapTiles = parser.loadRpgMap(fileName[:-len(parser.MAP_EXTENSION)]).mapTiles
+                definitions.update(tile.definition for tiles in mapTiles for tile in tiles
+                                   if tile.definition.masks)
+        self.assertTrue(definitions)
+        levels = [0.5, 1, 1.5, 2, 2.25, 2.5, 3, 3.5, 4, 5, 6]
+        for definition in definitions:
+            zs = [z + offset for z in definition.maskZs for offset in (-1, 0, 1)]
+            for spriteLevel in levels:
+                for spriteZ in zs:
+                    for spriteUpright in (False, True):
+                        self.assertEqual(self.getMasks(definition, spriteLevel, spriteZ, spriteUpright),
+                                         definition.getMasks(spriteLevel, spriteZ, spriteUpright))
+
+class MapCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maxBytes = parser.mapCache.maxBytes
+        
+    def tearDown(self):
+        parser.mapCache.setMaxBytes(self.maxBytes)
+        
+    def testRestore(self):
+        # the unit map is cached, so we get the same map back with its tiles restored
+        levels = list(rpgMap.mapTiles[0][0].levels)
+        baseRect = Rect(0, 0, TILE_SIZE, TILE_SIZE)
+        rpgMap.addLevel(0, 0, 7)
+        self.assertEqual(levels + [7], rpgMap.mapTiles[0][0].levels)
+        self.assertEqual((True, 7), rpgMap.isMoveValid(7, baseRect))
+        self.assertTrue(rpgMap is parser.loadRpgMap("unit"))
+        self.assertEqual(levels, list(rpgMap.mapTiles[0][0].levels))
+        self.assertEqual((False, 7), rpgMap.isMoveValid(7, baseRect))
+        
+    def testEviction(self):
+        mapCache = parser.mapCache
+        # only room for one map at a time
+        parser.loadRpgMap("unit")
+        mapCache.setMaxBytes(rpgMap.getByteSize())
+        stats = parser.getMapCacheStats()
+        try:
+            otherMap = parser.loadRpgMap("smallcave")
+            self.assertFalse("unit" in mapCache)
+            self.assertTrue("smallcave" in mapCache)
+            # an evicted map is reloaded in its original state
+            otherMap.addLevel(0, 0, 7)
+            parser.loadRpgMap("unit")
+            reloadedMap = parser.loadRpgMap("smallcave")
+            self.assertFalse(reloadedMap is otherMap)
+            self.assertFalse(7 in reloadedMap.mapTiles[0][0].levels)
+            newStats = parser.getMapCacheStats()
+            self.assertEqual(stats["misses"] + 3, newStats["misses"])
+            self.assertEqual(stats["evictions"] + 3, newStats["evictions"])
+        finally:
+            # put the original unit map back for the other tests
+            mapCache.setMaxBytes(self.maxBytes)
+            mapCache.put("unit", rpgMap, rpgMap.getByteSize())
+
+class MapImageTest(unittest.TestCase):
+
+    def testChunks(self):
+        startMap = parser.loadRpgMap("start")
+        mapImage = startMap.mapImage
+        mapImage.chunks.clear()
+        surface = view.createRectangle((VIEW_WIDTH, VIEW_HEIGHT))
+        # chunks are rendered as they come into view
+        viewRect = Rect(0, 0, VIEW_WIDTH, VIEW_HEIGHT)
+        mapImage.draw(surface, (0, 0), viewRect)
+        self.assertEqual(set([(0, 0), (1, 0), (0, 1), (1, 1)]), set(mapImage.chunks.keys()))
+        # ...and dropped once they are far enough away
+        viewRect.bottomright = startMap.mapRect.bottomright
+        mapImage.draw(surface, (0, 0), viewRect)
+        self.assertFalse((0, 0) in mapImage.chunks)
+        self.assertEqual(4, len(mapImage.chunks))
+
+class DisplayRectTest(unittest.TestCase):
+
+    def testWholeMultiples(self):
+        dimensions = (256, 160)
+        self.assertEqual(Rect(0, 0, 256, 160), view.getDisplayRect(dimensions, (256, 160)))
+        self.assertEqual(Rect(0, 0, 512, 320), view.getDisplayRect(dimensions, (512, 320)))
+        self.assertEqual(Rect(0, 0, 1024, 640), view.getDisplayRect(dimensions, (1024, 640)))
+
+    def testLetterbox(self):
+        dimensions = (256, 160)
+        # the biggest whole multiple that fits is centred, rounding down
+        self.assertEqual(Rect(44, 40, 512, 320), view.getDisplayRect(dimensions, (600, 400)))
+        self.assertEqual(Rect(16, 60, 768, 480), view.getDisplayRect(dimensions, (800, 600)))
+        self.assertEqual(Rect(171, 64, 1024, 640), view.getDisplayRect(dimensions, (1366, 768)))
+        self.assertEqual(Rect(192, 60, 1536, 960), view.getDisplayRect(dimensions, (1920, 1080)))
+        # a tall display is limited by its width
+        self.assertEqual(Rect(22, 420, 256, 160), view.getDisplayRect(dimensions, (300, 1000)))
+        # and a screen drawn at the scaled up size
+        self.assertEqual(Rect(44, 40, 512, 320), view.getDisplayRect((512, 320), (600, 400)))
+        
+class DirtyRectRendererTest(unittest.TestCase):
+
+    def testDirtyRects(self):
+        startMap = parser.loadRpgMap("start")
+        surface = view.createRectangle((VIEW_WIDTH, VIEW_HEIGHT))
+        fixedSprite = pygame.sprite.Sprite()
+        fixedSprite.image = view.createRectangle((8, 8), view.BLACK)
+        fixedSprite.rect = Rect(4, 4, 8, 8)
+        fixedSprites = pygame.sprite.Group(fixedSprite)
+        renderer = renderers.DirtyRectRenderer(startMap.mapImage, sprites.RpgSprites(), fixedSprites)
+        viewRect = Rect(0, 0, VIEW_WIDTH, VIEW_HEIGHT)
+        # the whole view is drawn to start with, and then nothing until something changes
+        self.assertEqual([surface.get_rect()], renderer.draw(surface, viewRect))
+        self.assertEqual([], renderer.draw(surface, viewRect))
+        fixedSprite.rect = Rect(20, 4, 8, 8)
+        self.assertEqual([Rect(4, 4, 8, 8), Rect(20, 4, 8, 8)], renderer.draw(surface, viewRect))
+        # the whole view is drawn again once it has scrolled
+        viewRect.move_ip(2, 0)
+        self.assertEqual([surface.get_rect()], renderer.draw(surface, viewRect))
+
+class ScrollBufferTest(unittest.TestCase):
+
+    def testScroll(self):
+        startMap = parser.loadRpgMap("start")
+        scrollBuffer = renderers.ScrollBuffer(startMap.mapImage, (VIEW_WIDTH, VIEW_HEIGHT))
+        surface1 = view.createRectangle((VIEW_WIDTH, VIEW_HEIGHT))
+        surface2 = view.createRectangle((VIEW_WIDTH, VIEW_HEIGHT))
+        viewRect = Rect(0, 0, VIEW_WIDTH, VIEW_HEIGHT)
+        # the view should look the same as it does when drawn from the map image
+        for dx, dy in [(0, 0), (2, 0), (6, 4), (-2, 10), (0, VIEW_HEIGHT + 2), (20, -4)]:
+            viewRect.move_ip(dx, dy)
+            scrollBuffer.draw(surface1, (0, 0), viewRect)
+            startMap.mapImage.draw(surface2, (0, 0), viewRect)
+            self.assertEqual(pygame.image.tostring(surface1, "RGB"), pygame.image.tostring(surface2, "RGB"))
+        # ...and the same for a smaller part of it
+        area = Rect(viewRect.left + 50, viewRect.top + 30, 40, 40)
+        scrollBuffer.draw(surface1, (0, 0), area, False)
+        startMap.mapImage.draw(surface2, (0, 0), area, False)
+        self.assertEqual(pygame.image.tostring(surface1, "RGB"), pygame.image.tostring(surface2, "RGB"))
+
+class RpgSpritesTest(unittest.TestCase):
+
+    def testOrder(self):
+        image = view.createRectangle((TILE_SIZE, TILE_SIZE))
+        sprite1, sprite2, sprite3 = [sprites.RpgSprite(MockFrames(image)) for i in range(3)]
+        sprite1.setPixelPosition(10, 30, 1)
+        sprite2.setPixelPosition(10, 20, 1)
+        sprite3.setPixelPosition(10, 10, 2)
+        group = sprites.RpgSprites(sprite1, sprite2, sprite3)
+        self.assertEqual((sprite2, sprite1, sprite3), group.sprites())
+        self.assertTrue(group.sprites() is group.sprites())
+        # only the sprites that move are put back in order
+        sprite2.doMove(0, 20)
+        self.assertEqual((sprite1, sprite2, sprite3), group.sprites())
+        sprite3.kill()
+        self.assertEqual((sprite1, sprite2), group.sprites())
+        self.assertEqual(set([sprite1, sprite2]), set(group.unordered()))
+
+    def testBaked(self):
+        image = view.createRectangle((TILE_SIZE, TILE_SIZE))
+        sprite1, sprite2, baked = [sprites.RpgSprite(MockFrames(image)) for i in range(3)]
+        sprite1.setPixelPosition(10, 10, 1)
+        sprite2.setPixelPosition(100, 30, 1)
+        baked.setPixelPosition(10, 20, 1)
+        group = sprites.RpgSprites(sprite1, sprite2)
+        group.addBaked(baked)
+        self.assertTrue(baked in group.getNearbySprites(baked.baseRect))
+        # baked sprites are only drawn over the sprites behind them
+        self.assertEqual((sprite1, baked, sprite2), tuple(group.getDrawnSprites()))
+        sprite1.doMove(0, 40)
+        self.assertEqual((sprite2, sprite1), tuple(group.getDrawnSprites()))
+
+    def testNearbyOrder(self):
+        image = view.createRectangle((TILE_SIZE, TILE_SIZE))
+        groupSprites = [sprites.RpgSprite(MockFrames(image)) for i in range(8)]
+        # several sprites share a z, and all of them share a spatial hash cell
+        for i, sprite in enumerate(groupSprites):
+            sprite.setPixelPosition(10 + i, 10 + (i % 3) * 2, 1)
+        group = sprites.RpgSprites(*groupSprites)
+        baseRect = groupSprites[0].baseRect
+        def getExpected():
+            nearby = group.getNearbySprites(baseRect)
+            return [sprite for sprite in group.sprites() if sprite in nearby]
+        self.assertEqual(getExpected(), group.getNearbySprites(baseRect))
+        groupSprites[0].doMove(0, 2)
+        groupSprites[5].doMove(0, -2)
+        self.assertEqual(getExpected(), group.getNearbySprites(baseRect))
+
+class MaskedFrameTest(unittest.TestCase):
+
+    def testCache(self):
+        frame = view.createRectangle((28, 48))
+        rect = Rect(6 * TILE_SIZE + 2, 2 * TILE_SIZE - 24, 28, 48)
+        spriteInfo = MockSprite(rect, 1)
+        spriteInfo.move(0, 0)
+        masks = rpgMap.getMasks(spriteInfo)
+        maskedFrame = sprites.getMaskedFrame(frame, rect.topleft, masks)
+        self.assertFalse(maskedFrame is frame)
+        # the same frame behind the same masks is only masked once
+        self.assertTrue(maskedFrame is sprites.getMaskedFrame(frame, rect.topleft, masks))
+        spriteInfo.move(2, 0)
+        otherFrame = sprites.getMaskedFrame(frame, rect.topleft, rpgMap.getMasks(spriteInfo))
+        self.assertFalse(maskedFrame is otherFrame)
+
+class MapOverlayTest(unittest.TestCase):
+
+    def testDrawMasks(self):
+        overlay = map.MapOverlay(rpgMap.mapTiles)
+        frame = view.createRectangle((28, 48), view.RED)
+        rect = Rect(6 * TILE_SIZE + 2, 2 * TILE_SIZE - 24, 28, 48)
+        spriteInfo = MockSprite(rect, 1)
+        spriteInfo.move(0, 0)
+        spriteInfo.image, spriteInfo.rect = frame, Rect(10, 10, 28, 48)
+        masks = rpgMap.getMasks(spriteInfo)
+        self.assertEqual(1, len(masks))
+        # drawing the masks over the sprite is the same as drawing the masked sprite
+        surface1 = view.createRectangle((64, 64), view.BLUE)
+        surface1.blit(sprites.getMaskedFrame(frame, rect.topleft, masks), spriteInfo.rect)
+        surface2 = view.createRectangle((64, 64), view.BLUE)
+        surface2.blit(frame, spriteInfo.rect)
+        overlay.drawMasks(surface2, spriteInfo)
+        self.assertEqual(pygame.image.tostring(surface1, "RGB"), pygame.image.tostring(surface2, "RGB"))
+        surface3 = view.createRectangle((64, 64), view.BLUE)
+        surface3.blit(frame, spriteInfo.rect)
+        self.assertNotEqual(pygame.image.tostring(surface2, "RGB"), pygame.image.tostring(surface3, "RGB"))
+
+    def testLayerOrder(self):
+        # two masks on one tile, with the higher level in the lower layer
+        ground, mask1, mask2 = [view.createRectangle((TILE_SIZE, TILE_SIZE), colour)
+                                for colour in (view.BLACK, view.RED, view.BLUE)]
+        definition = map.getTileDefinition((1,), (), (), (ground, mask1, mask2), (1, 3, 0, 2, 2, 0))
+        mapTiles = [[map.MapTile(x, y, definition if (x, y) == (0, 1) else None) for y in range(2)]
+                    for x in range(2)]
+        maskedMap = map.RpgMap("masks", None, mapTiles, [], [])
+        frame = view.createRectangle((16, 24), (255, 255, 255))
+        rect = Rect(4, TILE_SIZE - 8, 16, 24)
+        spriteInfo = MockSprite(rect, 1)
+        spriteInfo.move(0, 0)
+        spriteInfo.image, spriteInfo.rect = frame, Rect(10, 10, 16, 24)
+        masks = maskedMap.getMasks(spriteInfo)
+        self.assertEqual(2, len(masks[0][1]))
+        surface1 = view.createRectangle((64, 64), view.BLACK)
+        surface1.blit(sprites.getMaskedFrame(frame, rect.topleft, masks), spriteInfo.rect)
+        surface2 = view.createRectangle((64, 64), view.BLACK)
+        surface2.blit(frame, spriteInfo.rect)
+        map.MapOverlay(mapTiles).drawMasks(surface2, spriteInfo)
+        self.assertEqual(pygame.image.tostring(surface1, "RGB"), pygame.image.tostring(surface2, "RGB"))
+        # the mask in the top layer wins
+        self.assertEqual(view.BLUE, tuple(surface2.get_at((12, 20)))[:3])
+
+"""
+Checks that sprites put to sleep by ScheduledSprites end up exactly where they'd
+have been if they'd been updated every tick.
+"""
+class ScheduledSpritesTest(unittest.TestCase):
+
+    # a view that's nowhere near any of the sprites
+    farView = Rect(-100 * TILE_SIZE, -100 * TILE_SIZE, VIEW_WIDTH, VIEW_HEIGHT)
+    
+    # a loop, a path that doubles back on itself + a path that turns on the spot
+    beetlePaths = [[(13, 22), (11, 22), (11, 24), (12, 24), (12, 25), (14, 25), (14, 23), (13, 23)],
+                   [(17, 27), (20, 27), (20, 28), (23, 28), (20, 28), (20, 27)],
+                   [(3, 3), (5, 3), (5, 3), (5, 4)]]
+    
+    def setUp(self):
+        self.startMap = parser.loadRpgMap("start")
+        self.eventBus = eventbus.EventBus()
+        self.visibleSprites = sprites.RpgSprites()
+        
+    def setupSprite(self, sprite, level, tilePoints):
+        sprite.setup("test", self.startMap, self.eventBus)
+        sprite.initMovement(level, tilePoints)
+        return sprite
+    
+    def update(self, sprite, ticks, viewRect = None):
+        for i in range(ticks):
+            sprite.update(None, self.visibleSprites, viewRect or self.farView, 1)
+    
+    def testBeetleCatchUp(self):
+        for tilePoints in self.beetlePaths:
+            pathTicks = self.setupSprite(othersprites.Beetle(), 4, tilePoints).pathTicks
+            for skipTicks in [0, 1, 2, 5, pathTicks - 1, pathTicks, pathTicks + 1, 3 * pathTicks + 7]:
+                for startTicks in [1, 3, pathTicks // 2]:
+                    beetle1 = self.setupSprite(othersprites.Beetle(), 4, tilePoints)
+                    beetle2 = self.setupSprite(othersprites.Beetle(), 4, tilePoints)
+                    self.update(beetle1, startTicks + skipTicks)
+                    self.update(beetle2, startTicks)
+                    beetle2.catchUp(skipTicks)
+                    self.assertEqual(beetle1.mapRect.topleft, beetle2.mapRect.topleft)
+                    self.assertTrue(beetle2.getActivityRect().contains(beetle2.mapRect))
+                    # and they keep moving in step
+                    for i in range(pathTicks + 2):
+                        self.update(beetle1, 1)
+                        self.update(beetle2, 1)
+                        self.assertEqual(beetle1.mapRect.topleft, beetle2.mapRect.topleft)
+    
+    def testWakeAtBoundary(self):
+        tilePoints = self.beetlePaths[0]
+        beetle = self.setupSprite(othersprites.Beetle(), 4, tilePoints)
+        reference = self.setupSprite(othersprites.Beetle(), 4, tilePoints)
+        group = scheduler.ScheduledSprites(beetle)
+        activityRect = beetle.getActivityRect()
+        # a view whose active rect touches the activity rect without overlapping it
+        touchingView = Rect(0, 0, VIEW_WIDTH, VIEW_HEIGHT)
+        touchingView.left = activityRect.right + scheduler.ACTIVE_DISTANCE
+        touchingView.centery = activityRect.centery
+        for i in range(37):
+            group.update(None, self.visibleSprites, self.farView, 1)
+            self.update(reference, 1)
+        self.assertEqual(0, group.getAwakeCount())
+        for i in range(5):
+            group.update(None, self.visibleSprites, touchingView, 1)
+            self.update(reference, 1)
+        self.assertEqual(0, group.getAwakeCount())
+        # one pixel closer wakes it up, and it's updated on the same tick
+        overlappingView = touchingView.move(-1, 0)
+        group.update(None, self.visibleSprites, overlappingView, 1)
+        self.update(reference, 1)
+        self.assertEqual(1, group.getAwakeCount())
+        self.assertEqual(reference.mapRect.topleft, beetle.mapRect.topleft)
+        for i in range(50):
+            group.update(None, self.visibleSprites, overlappingView, 1)
+            self.update(reference, 1)
+            self.assertEqual(reference.mapRect.topleft, beetle.mapRect.topleft)
+    
+    def testNeverSleeps(self):
+        boat = self.setupSprite(othersprites.Boat(), 0, [(-2, 27), (7, 27)])
+        movingWasp = self.setupSprite(othersprites.Wasp(), 2, [(14, 5)])
+        movingWasp.direction = LEFT
+        wasp = self.setupSprite(othersprites.Wasp(), 2, [(14, 5)])
+        group = scheduler.ScheduledSprites(boat, movingWasp, wasp)
+        for i in range(5):
+            group.update(None, self.visibleSprites, self.farView, 1)
+            self.assertTrue(boat in group.awakeSprites)
+            self.assertTrue(movingWasp in group.awakeSprites)
+            self.assertFalse(wasp in group.awakeSprites)
+
+class SpatialHashTest(unittest.TestCase):
+
+    def testQuery(self):
+        spatialHash = spatialhash.SpatialHash(TILE_SIZE)
+        spatialHash.add("a", Rect(0, 0, 8, 8))
+        spatialHash.add("b", Rect(TILE_SIZE + 4, 0, 8, 8))
+        self.assertEqual(["a"], spatialHash.query(Rect(4, 4, 4, 4)))
+        self.assertEqual(set(["a", "b"]), set(spatialHash.query(Rect(4, 0, TILE_SIZE, 4))))
+        self.assertEqual(["b"], spatialHash.query(Rect(TILE_SIZE, 0, 4, 4)))
+        spatialHash.move("a", Rect(TILE_SIZE * 4, 0, 8, 8))
+        self.assertEqual([], spatialHash.query(Rect(4, 4, 4, 4)))
+        spatialHash.remove("b")
+        self.assertEqual([], spatialHash.query(Rect(TILE_SIZE, 0, 4, 4)))
+        self.assertEqual(1, len(spatialHash))
+
+class MapEventsTest(unittest.TestCase):
+
+    def testBoundaryEvent(self):
+        startMap = parser.loadRpgMap("start")
+        event = startMap.getBoundaryEvent(view.LEFT, range(8, 10))
+        self.assertEqual("drops", event.transition.mapName)
+        self.assertTrue(event is startMap.getBoundaryEvent(view.LEFT, range(9, 11)))
+        self.assertEqual(None, startMap.getBoundaryEvent(view.LEFT, range(10, 12)))
+        self.assertEqual(None, startMap.getBoundaryEvent(view.UP, range(10, 12)))
+        
+    def testTileEvent(self):
+        startMap = parser.loadRpgMap("start")
+        baseRect = Rect(20 * TILE_SIZE + 4, 20 * TILE_SIZE + 4, 24, 12)
+        event = startMap.getActionEvent(4, baseRect)
+        self.assertEqual("smallcave", event.transition.mapName)
+        self.assertEqual(None, startMap.getActionEvent(3, baseRect))
+
+class AdjacentMapsTest(unittest.TestCase):
+
+    def testAdjacentMapNames(self):
+        startMap = parser.loadRpgMap("start")
+        self.assertEqual(["lowercave", "smallcave", "uppercave", "drops", "forest"],
+                         startMap.getAdjacentMapNames())
+        self.assertEqual([], rpgMap.getAdjacentMapNames())
+        
+    def testPrefetch(self):
+        # already cached, so nothing to prefetch
+        self.assertEqual(None, parser.prefetchRpgMap("unit"))
+
+class PreloadSpritesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.processMovementFrames = view.processMovementFrames
+        self.framesImage = othersprites.Beetle.framesImage
+        self.animationFrames = othersprites.Beetle.animationFrames
+        othersprites.Beetle.framesImage = None
+        othersprites.Beetle.animationFrames = None
+
+    def tearDown(self):
+        view.processMovementFrames = self.processMovementFrames
+        othersprites.Beetle.framesImage = self.framesImage
+        othersprites.Beetle.animationFrames = self.animationFrames
+
+    def testCreatedWhilePreloading(self):
+        processing = threading.Event()
+        # hold the preload part way through setting up the frames
+        def slowMovementFrames(*args):
+            processing.set()
+            time.sleep(0.2)
+            return self.processMovementFrames(*args)
+        view.processMovementFrames = slowMovementFrames
+        preload = threading.Thread(target = othersprites.Beetle)
+        preload.start()
+        processing.wait()
+        # waits for the frames rather than finding them half set up
+        beetle = othersprites.Beetle()
+        preload.join()
+        self.assertTrue(othersprites.Beetle.animationFrames is not None)
+        self.assertTrue(beetle.image)
+
+class CompiledMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempFolder = tempfile.mkdtemp()
+        self.mapPath = parser.getMapPath("unit")
+        self.compiledPath = os.path.join(self.tempFolder, "unit" + mapformat.COMPILED_EXTENSION)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempFolder)
+        
+    def testRoundTrip(self):
+        mapData = parser.parseMapFile(self.mapPath)
+        mapformat.writeMapData(mapData, self.compiledPath, self.mapPath)
+        compiledData = mapformat.readMapData(self.compiledPath, self.mapPath)
+        self.assertEqual((mapData.cols, mapData.rows), (compiledData.cols, compiledData.rows))
+        self.assertEqual(mapData.music, compiledData.music)
+        for name in ["levels", "specials", "downs", "layers", "masks", "sprites", "events"]:
+            table, compiledTable = getattr(mapData, name), getattr(compiledData, name)
+            self.assertEqual(list(table.index), list(compiledTable.index))
+            self.assertEqual(list(table.values), list(compiledTable.values))
+        self.assertEqual(list(mapData.tiles), list(compiledData.tiles))
+        self.assertEqual(mapData.getSpriteData(), compiledData.getSpriteData())
+        self.assertEqual(mapData.getEventData(), compiledData.getEventData())
+        
+    def testStale(self):
+        mapData = parser.parseMapFile(self.mapPath)
+        mapformat.writeMapData(mapData, self.compiledPath, self.mapPath)
+        # a source map with a different size means the compiled map is stale
+        otherPath = parser.getMapPath("start")
+        self.assertEqual(None, mapformat.readMapData(self.compiledPath, otherPath))
+        # no source map means the compiled map is used as is
+        missingPath = os.path.join(self.tempFolder, "unit" + parser.MAP_EXTENSION)
+        self.assertNotEqual(None, mapformat.readMapData(self.compiledPath, missingPath))
+        
+    def testEditedWithinSecond(self):
+        sourcePath = os.path.join(self.tempFolder, "unit" + parser.MAP_EXTENSION)
+        shutil.copy(self.mapPath, sourcePath)
+        os.utime(sourcePath, (1000000000.25, 1000000000.25))
+        mapformat.writeMapData(parser.parseMapFile(sourcePath), self.compiledPath, sourcePath)
+        self.assertNotEqual(None, mapformat.readMapData(self.compiledPath, sourcePath))
+        # same size, edited later within the same second
+        os.utime(sourcePath, (1000000000.75, 1000000000.75))
+        self.assertEqual(None, mapformat.readMapData(self.compiledPath, sourcePath))
+        
+    def testMissing(self):
+        self.assertEqual(None, mapformat.readMapData(self.compiledPath, self.mapPath))
+        
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempFolder = tempfile.mkdtemp()
+        self.recordingPath = os.path.join(self.tempFolder, "test" + replay.RECORDING_EXTENSION)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempFolder)
+        
+    def testRoundTrip(self):
+        recording = replay.Recording(registry.Registry("unit", (4, 6), 1))
+        keyBits = [0, 0, 0, 1, 1, 17, 0]
+        for bits in keyBits:
+            recording.record(replay.getKeyPresses(bits))
+        # ticks with the same keys pressed are stored as one run
+        self.assertEqual([[0, 3], [1, 2], [17, 1], [0, 1]], recording.runs)
+        recording.save(self.recordingPath)
+        loaded = replay.loadRecording(self.recordingPath)
+        self.assertEqual(recording.runs, loaded.runs)
+        self.assertEqual(("unit", (4, 6), 1), (loaded.registry.mapName, loaded.registry.playerPosition,
+                                               loaded.registry.playerLevel))
+        self.assertTrue(loaded.isMapSetCurrent())
+        self.assertEqual(keyBits, [replay.getKeyBits(keyPresses) for keyPresses in loaded.playBack()])
+        
+class MapGenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempFolder = tempfile.mkdtemp()
+        self.mapPath = os.path.join(self.tempFolder, "synthetic" + parser.MAP_EXTENSION)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempFolder)
+        
+    def testGeneratedMap(self):
+        mapgen.generateMap(self.mapPath, 60, 44, 5)
+        mapData = parser.parseMapFile(self.mapPath)
+        self.assertEqual((60, 44), (mapData.cols, mapData.rows))
+        rpgMap = map.RpgMap("synthetic", mapData.music, parser.createMapTiles(mapData),
+                            parser.createMapSprites(mapData.getSpriteData(), "synthetic"),
+                            parser.createMapEvents(mapData.getEventData()))
+        tiles = [tile for tiles in rpgMap.mapTiles for tile in tiles]
+        self.assertTrue([tile for tile in tiles if tile.specialLevels])
+        self.assertTrue([tile for tile in tiles if tile.downLevels])
+        self.assertTrue([tile for tile in tiles if tile.masks])
+        self.assertTrue(rpgMap.mapSprites)
+        self.assertTrue(rpgMap.tileEvents)
+        # every event leads back onto the same map
+        self.assertEqual(set(["synthetic"]), set(transition.mapName for transition in rpgMap.transitions))
+        self.assertEqual(rpgMap.getBoundaryEvent(view.LEFT, [43]).max, 43)
+        # the same arguments always give the same map
+        with open(self.mapPath) as mapFile:
+            mapText = mapFile.read()
+        mapgen.generateMap(self.mapPath, 60, 44, 5)
+        with open(self.mapPath) as mapFile:
+            self.assertEqual(mapText, mapFile.read())
+        
+class MockClock:
+
+    def __init__(self, frameMillis):
+        self.frameMillis = frameMillis
+        self.frames = 0
+
+    # returns the time taken by the next frame, as if the screen was drawn then
+    def tick(self, framerate = 0):
+        millis = self.frameMillis[self.frames]
+        self.frames += 1
+        return millis
+
+class MockState:
+
+    def __init__(self):
+        self.updates = 0
+        self.renders = 0
+
+    def update(self, keyPresses):
+        self.updates += 1
+
+    def render(self):
+        self.renders += 1
+
+class MockSoundHandler:
+
+    def flush(self):
+        pass
+
+class TickClockTest(unittest.TestCase):
+
+    # runs the main loop as play.py does, for a frame of each of the given lengths
+    def runFrames(self, frameMillis):
+        currentState = MockState()
+        tickClock = gameclock.TickClock(MockClock(frameMillis))
+        soundHandler = MockSoundHandler()
+        for millis in frameMillis:
+            ticks = tickClock.getTicks()
+            for i in range(ticks):
+                currentState = gameclock.tickState(currentState, replay.getKeyPresses(0), soundHandler)
+            if ticks > 0:
+                currentState.render()
+        return currentState
+
+    def testRenderRates(self):
+        # two seconds at 60, 100, 40, 30 and 20 frames per second
+        for frameMillis in ([17, 16, 17] * 40, [10] * 200, [25] * 80, [33, 33, 34] * 20, [50] * 40):
+            currentState = self.runFrames(frameMillis)
+            self.assertEqual(gameclock.FRAMES_PER_SEC * 2, currentState.updates)
+            # the screen is only drawn after a tick
+            self.assertEqual(min(len(frameMillis), currentState.updates), currentState.renders)
+
+    def testCatchUpCapped(self):
+        # the game doesn't try to catch up with the rest of the second
+        currentState = self.runFrames([1000, 0, 0])
+        self.assertEqual(gameclock.MAX_CATCH_UP_TICKS, currentState.updates)
+        self.assertEqual(1, currentState.renders)
+        currentState = self.runFrames([1000, 0, 17, 16])
+        self.assertEqual(gameclock.MAX_CATCH_UP_TICKS + 2, currentState.updates)
+        self.assertEqual(3, currentState.renders)
+        
 if __name__ == "__main__":
     unittest.main()   
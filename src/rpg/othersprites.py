@@ -36,15 +36,17 @@ BLADES_COUNTDOWN = 24 // VELOCITY
 class Beetle(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (12 * SCALAR, 12 * SCALAR)
     
     def __init__(self):
-        if Beetle.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "beetle-frames.png")
-            Beetle.framesImage = view.loadScaledImage(imagePath)        
-        animationFrames = view.processMovementFrames(Beetle.framesImage, 2)
-        spriteFrames = DirectionalFrames(animationFrames, BEETLE_FRAME_SKIP)
+        with framesLock:
+            if Beetle.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "beetle-frames.png")
+                Beetle.framesImage = view.loadScaledImage(imagePath)        
+                Beetle.animationFrames = view.copyMovementFrames(view.processMovementFrames(Beetle.framesImage, 2))
+        spriteFrames = DirectionalFrames(Beetle.animationFrames, BEETLE_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames)
         self.upright = False
 
@@ -62,6 +64,12 @@ class Beetle(OtherSprite):
         self.numPoints = len(tilePoints)
         self.currentPathPoint = self.pathPoints[0]
         self.pathPointIndex = 0
+        # the rect covering the whole path + the number of ticks to go round it
+        self.pathRect = self.mapRect.unionall([self.mapRect.move(px - self.mapRect.left, py - self.mapRect.top)
+                                               for px, py in self.pathPoints])
+        self.pathTicks = 0
+        for i in range(self.numPoints):
+            self.pathTicks += max(1, self.getPathDistance(self.pathPoints[i - 1], self.pathPoints[i]))
             
     def getMovement(self, player, trigger):
         currentPosition = self.mapRect.topleft
@@ -83,6 +91,45 @@ class Beetle(OtherSprite):
         # otherwise there is nowhere to move to
         return NO_MOVEMENT
     
+    """
+    Jumps along the path to wherever getMovement would have taken the beetle in
+    the given number of ticks.  Each tick moves the beetle one unit along the path,
+    horizontally first and then vertically, except that it takes a tick to turn
+    around on the spot if two path points are the same.
+    """
+    def catchUp(self, ticks):
+        x, y = self.mapRect.topleft
+        lapped = False
+        while ticks > 0:
+            distance = self.getPathDistance((x, y), self.currentPathPoint)
+            if distance == 0:
+                # we're at a path point, so any whole laps of the path can be skipped
+                if not lapped:
+                    ticks, lapped = ticks % self.pathTicks, True
+                    continue
+                self.pathPointIndex = (self.pathPointIndex + 1) % self.numPoints
+                self.currentPathPoint = self.pathPoints[self.pathPointIndex]
+                distance = self.getPathDistance((x, y), self.currentPathPoint)
+                if distance == 0:
+                    ticks -= 1
+                    continue
+            steps = min(ticks, distance)
+            ticks -= steps
+            x, y = self.stepTowards(x, y, self.currentPathPoint, steps * MOVE_UNIT)
+        self.doMove(x - self.mapRect.left, y - self.mapRect.top)
+        
+    def getPathDistance(self, point1, point2):
+        return (abs(point2[0] - point1[0]) + abs(point2[1] - point1[1])) // MOVE_UNIT
+    
+    def stepTowards(self, x, y, point, distance):
+        dx = max(-distance, min(distance, point[0] - x))
+        distance -= abs(dx)
+        dy = max(-distance, min(distance, point[1] - y))
+        return x + dx, y + dy
+    
+    def getActivityRect(self):
+        return self.pathRect
+    
     def playSound(self, frameIndex):
         if frameIndex == 1:
             self.eventBus.dispatchBeetleCrawlingEvent(BeetleCrawlingEvent())
@@ -90,15 +137,17 @@ class Beetle(OtherSprite):
 class Wasp(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (9 * SCALAR, 12 * SCALAR)    
 
     def __init__(self):
-        if Wasp.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "wasp-frames.png")
-            Wasp.framesImage = view.loadScaledImage(imagePath)        
-        animationFrames = view.processMovementFrames(Wasp.framesImage, 2)
-        spriteFrames = DirectionalFrames(animationFrames, WASP_FRAME_SKIP)
+        with framesLock:
+            if Wasp.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "wasp-frames.png")
+                Wasp.framesImage = view.loadScaledImage(imagePath)        
+                Wasp.animationFrames = view.copyMovementFrames(view.processMovementFrames(Wasp.framesImage, 2))
+        spriteFrames = DirectionalFrames(Wasp.animationFrames, WASP_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames)
         
     def processCollision(self, player):
@@ -122,6 +171,10 @@ class Wasp(OtherSprite):
         self.zooming = False
         self.direction = None # this is also used to detect if the sprite has 'seen' the player
     
+    # once the wasp has seen the player it has to keep moving
+    def canSleep(self):
+        return not self.direction
+    
     def getMovement(self, player, trigger):
         if self.zooming:
             # print "zooming"
@@ -148,15 +201,17 @@ class Wasp(OtherSprite):
 class Blades(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (TILE_SIZE, TILE_SIZE)    
 
     def __init__(self):
-        if Blades.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "blades-frames.png")
-            Blades.framesImage = view.loadScaledImage(imagePath)        
-        animationFrames = view.processStaticFrames(Blades.framesImage, 10)
-        spriteFrames = StaticFrames(animationFrames, BLADES_FRAME_SKIP)
+        with framesLock:
+            if Blades.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "blades-frames.png")
+                Blades.framesImage = view.loadScaledImage(imagePath)        
+                Blades.animationFrames = view.copyStaticFrames(view.processStaticFrames(Blades.framesImage, 10))
+        spriteFrames = StaticFrames(Blades.animationFrames, BLADES_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (0, -14))
         self.deactivate()
 
@@ -188,26 +243,26 @@ class Blades(OtherSprite):
         self.countdown = BLADES_COUNTDOWN;
         self.active = False
         if level:
-            self.getMapTile().addNewLevel(level)
+            x, y = self.tilePosition
+            self.rpgMap.addTileLevel(x, y, level)
 
     def activate(self):
         self.active = True
-        self.getMapTile().restore()
-        
-    def getMapTile(self):
-        x, y = self.tilePosition[0], self.tilePosition[1]
-        return self.rpgMap.mapTiles[x][y]
+        x, y = self.tilePosition
+        self.rpgMap.restoreTile(x, y)
             
 class Boat(OtherSprite):
     
     framesImage = None
+    animationFrames = None
 
     def __init__(self):
-        if Boat.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "boat.png")
-            Boat.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Boat.framesImage, 1)
-        spriteFrames = StaticFrames(animationFrames, BOAT_FRAME_SKIP)
+        with framesLock:
+            if Boat.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "boat.png")
+                Boat.framesImage = view.loadScaledImage(imagePath, None)        
+                Boat.animationFrames = view.copyStaticFrames(view.processStaticFrames(Boat.framesImage, 1))
+        spriteFrames = StaticFrames(Boat.animationFrames, BOAT_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (-10, 1))
         self.upright = False
         self.ticks = 0
@@ -215,6 +270,10 @@ class Boat(OtherSprite):
     # override this so boats can never mask other sprites         
     def calculateZ(self):
         return 0
+    
+    # boats are triggered from off screen, so they're always kept awake
+    def canSleep(self):
+        return False
         
     def initMovement(self, level, tilePoints):
         OtherSprite.initMovement(self, level, tilePoints)
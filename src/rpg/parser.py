@@ -3,8 +3,11 @@
 from __future__ import with_statement
 
 import os
+import threading
 import view
 import map
+import mapformat
+import cache
 
 from pygame.locals import Rect
 
@@ -14,6 +17,7 @@ from view import UP, DOWN, LEFT, RIGHT
 TILES_FOLDER = "tiles"
 MAPS_FOLDER = "maps"
 #MAPS_FOLDER = "maps093"
+MAP_EXTENSION = ".map"
 OPEN_SQ_BRACKET = "["
 CLOSE_SQ_BRACKET = "]"
 SPECIAL_LEVEL = "S"
@@ -28,7 +32,18 @@ DASH = "-"
 
 BOUNDARIES = {"up": UP, "down": DOWN, "left": LEFT, "right": RIGHT}
 
-mapCache = {}
+# least recently used maps are evicted once this is exceeded
+MAP_CACHE_BYTES = 16 * 1024 * 1024
+
+# tile sets are shared by all maps - whole tile sets are evicted once this is exceeded
+TILE_SET_CACHE_BYTES = 4 * 1024 * 1024
+
+mapCache = cache.LruCache(MAP_CACHE_BYTES)
+
+tileSetCache = cache.LruCache(TILE_SET_CACHE_BYTES)
+
+# maps may be loaded by the prefetcher thread as well as the main thread
+loadLock = threading.RLock()
 
 def getXY(xyStr, delimiter = COMMA):
     return [int(n) for n in xyStr.split(delimiter)]
@@ -39,18 +54,70 @@ def getTilePoints(xyList, delimiter = COMMA):
         tilePoints.append(getXY(xy, delimiter))
     return tilePoints
     
+"""
+Returns the named map.  Maps are cached, so if the map has been loaded before any
+tiles modified since then are restored.  Maps evicted from the cache are simply
+reloaded from disk, which gives us a map in its original state anyway.
+"""
 def loadRpgMap(name):
-    # check cache first
-    if name in mapCache:
-        return mapCache[name].restore()
+    with loadLock:
+        # check cache first
+        rpgMap = mapCache.get(name)
+        if rpgMap:
+            return rpgMap.restore()
+        return createRpgMap(name)
+
+"""
+Loads the named map into the cache if it's not already there.  Returns the map if
+it was loaded, otherwise None.
+"""
+def prefetchRpgMap(name):
+    with loadLock:
+        if name in mapCache:
+            return None
+        return createRpgMap(name)
+
+def createRpgMap(name):
+    mapData = loadMapData(name)
+    # create map tiles, sprites, events + music
+    mapTiles = createMapTiles(mapData)
+    mapSprites = createMapSprites(mapData.getSpriteData(), name)
+    mapEvents = createMapEvents(mapData.getEventData())
+    # create map and return
+    myMap = map.RpgMap(name, mapData.music, mapTiles, mapSprites, mapEvents)
+    mapCache.put(name, myMap, myMap.getByteSize())
+    return myMap
+
+"""
+Returns the hit, miss + eviction counts for the map cache, along with its size.
+"""
+def getMapCacheStats():
+    return mapCache.getStats()
+
+def getMapPath(name):
+    return os.path.join(MAPS_FOLDER, name + MAP_EXTENSION)
+
+"""
+Returns the map data for the named map.  The compiled map is used if it exists and
+is up to date - otherwise we fall back to parsing the text map.
+"""
+def loadMapData(name):
+    mapPath = getMapPath(name)
+    compiledPath = mapformat.getCompiledPath(mapPath)
+    mapData = mapformat.readMapData(compiledPath, mapPath)
+    if mapData:
+        print "loading: %s" % compiledPath
+        return mapData
+    print "loading: %s" % mapPath
+    return parseMapFile(mapPath)
+
+def parseMapFile(mapPath):
     # tileData is keyed on an x,y tuple
     tileData = {}
     spriteData = []
     eventData = []
     music = None
     # parse map file - each line represents one map tile        
-    mapPath = os.path.join(MAPS_FOLDER, name + ".map")
-    print "loading: %s" % mapPath
     with open(mapPath) as mapFile:
         # eg. 10,4 [1] water:dark grass:l2 wood:lrs_supp:3
         maxX, maxY = 0, 0
@@ -78,64 +145,89 @@ def loadRpgMap(name):
                                 tileData[(x, y)] = bits[1:]
             except ValueError:
                 pass
-    # create map tiles, sprites, events + music
-    mapTiles = createMapTiles(maxX + 1, maxY + 1, tileData)
-    mapSprites = createMapSprites(spriteData, name)
-    mapEvents = createMapEvents(eventData)
-    # create map and return
-    myMap = map.RpgMap(name, music, mapTiles, mapSprites, mapEvents)
-    mapCache[name] = myMap
-    return myMap
+    # pack everything into map data
+    mapData = mapformat.MapData(maxX + 1, maxY + 1, music)
+    for x in range(mapData.cols):
+        for y in range(mapData.rows):
+            if (x, y) in tileData:
+                mapData.addTile(*parseTileBits(tileData[(x, y)]))
+            else:
+                mapData.addTile([], [], [], [], [])
+    for spriteBits in spriteData:
+        mapData.addSprite(spriteBits)
+    for eventBits in eventData:
+        mapData.addEvent(eventBits)
+    return mapData
+
+"""
+Splits the bits for a single tile into lists of levels, special levels, down levels
+(as level, down level pairs), tile references and masks (as tile index, level, flat
+triples).
+"""
+def parseTileBits(bits):
+    levels, specials, downs, layers, masks = [], [], [], [], []
+    startIndex = 0
+    if bits[0][0] == OPEN_SQ_BRACKET and bits[0][-1] == CLOSE_SQ_BRACKET:
+        # levels
+        startIndex = 1
+        for level in bits[0][1:-1].split(COMMA):
+            if level[0] == SPECIAL_LEVEL:
+                specials.append(float(level[1:]))
+            elif level[0] == DOWN_LEVEL:
+                levelBits = level[1:].split(DASH)
+                downs += [int(levelBits[0]), int(levelBits[1])]
+            else:
+                levels.append(int(level))
+    # tiles images
+    for tileIndex, tiles in enumerate(bits[startIndex:]):
+        tileBits = tiles.split(COLON)
+        if len(tileBits) > 1:
+            layers.append(tileBits[0] + COLON + tileBits[1])
+            # masks
+            if len(tileBits) > 2:
+                maskLevel = tileBits[2]
+                if maskLevel[0] == VERTICAL_MASK:
+                    masks += [tileIndex, int(maskLevel[1:]), 0]
+                else:    
+                    masks += [tileIndex, int(maskLevel), 1]
+    return levels, specials, downs, layers, masks
 
-def createMapTiles(cols, rows, tileData):
+def createMapTiles(mapData):
+    # create the tile definitions
+    tileImages = {}
+    definitions = []
+    for i in range(len(mapData.levels)):
+        layers = mapData.layers.getRow(i)
+        for tileRef in layers:
+            if tileRef not in tileImages:
+                tileImages[tileRef] = getTileImage(mapData.strings[tileRef])
+        definitions.append(map.getTileDefinition(tuple(mapData.levels.getRow(i)),
+                                                 tuple(mapData.specials.getRow(i)),
+                                                 tuple(mapData.downs.getRow(i)),
+                                                 tuple(tileImages[tileRef] for tileRef in layers),
+                                                 tuple(mapData.masks.getRow(i))))
     # create the map tiles
-    mapTiles = [[map.MapTile(x, y) for y in range(rows)] for x in range(cols)]
-    # iterate through the tile data and set the map tiles
-    tileSets = {}     
-    for tilePoint in tileData.keys():
-        bits = tileData[tilePoint]
-        x, y = tilePoint[0], tilePoint[1]
-        mapTile = mapTiles[x][y]
-        # print bits
-        startIndex = 0
-        if bits[0][0] == OPEN_SQ_BRACKET and bits[0][-1] == CLOSE_SQ_BRACKET:
-            # levels
-            startIndex = 1
-            levels = bits[0][1:-1].split(COMMA)
-            for level in levels:
-                if level[0] == SPECIAL_LEVEL:
-                    mapTile.addSpecialLevel(float(level[1:]))
-                elif level[0] == DOWN_LEVEL:
-                    levelBits = level[1:].split(DASH)
-                    mapTile.addDownLevel(int(levelBits[0]), int(levelBits[1]))
-                else:
-                    mapTile.addLevel(int(level))
-        # tiles images
-        for tileIndex, tiles in enumerate(bits[startIndex:]):
-            tileBits = tiles.split(COLON)
-            if len(tileBits) > 1:
-                tileSetName = tileBits[0]
-                if tileSetName in tileSets:
-                    tileSet = tileSets[tileSetName]
-                else:
-                    tileSet = loadTileSet(tileSetName)
-                    tileSets[tileSetName] = tileSet
-                tileName = tileBits[1]
-                mapTile.addTile(tileSet.getTile(tileName))
-                # masks
-                if len(tileBits) > 2:
-                    maskLevel = tileBits[2]
-                    # mapTile.addMaskTile(maskLevel, tileSet.getTile(tileName))
-                    if maskLevel[0] == VERTICAL_MASK:
-                        mapTile.addMask(tileIndex, int(maskLevel[1:]), False)
-                    else:    
-                        mapTile.addMask(tileIndex, int(maskLevel))
-    return mapTiles
+    rows, tiles = mapData.rows, mapData.tiles
+    return [[map.MapTile(x, y, definitions[tiles[x * rows + y]]) for y in range(rows)]
+            for x in range(mapData.cols)]
+
+def getTileImage(tileRef):
+    tileSetName, tileName = tileRef.split(COLON)
+    return getTileSet(tileSetName).getTile(tileName)
+
+"""
+Returns the named tile set from the tile set cache, loading it if required.
+"""
+def getTileSet(name):
+    tileSet = tileSetCache.get(name)
+    if tileSet is None:
+        tileSet = loadTileSet(name)
+        tileSetCache.put(name, tileSet, tileSet.getByteSize())
+    return tileSet
 
 def loadTileSet(name):
     # print "load tileset: %s" % (name)
-    # tileSet = map.TileSet()
-    tiles = {}
+    tileRects = {}
     # load tile set image
     imagePath = os.path.join(TILES_FOLDER, name + ".png")
     tilesImage = view.loadScaledImage(imagePath, view.TRANSPARENT_COLOUR)
@@ -151,14 +243,11 @@ def loadTileSet(name):
                     # print "%s -> %s" % (tileRef, tileName)
                     x, y = tilePoint.split(COMMA)
                     px, py = int(x) * view.TILE_SIZE, int(y) * view.TILE_SIZE
-                    tileRect = Rect(px, py, view.TILE_SIZE, view.TILE_SIZE)
-                    tileImage = tilesImage.subsurface(tileRect).copy()
-                    tiles[tileName] = tileImage
-                    # self.maskTiles[tileName] = view.createMaskTile(tileImage)
+                    tileRects[tileName] = Rect(px, py, view.TILE_SIZE, view.TILE_SIZE)
             except ValueError:
                 pass
-    # create tile set and return
-    return map.TileSet(tiles)
+    # create tile set and return - tiles are extracted as they are needed
+    return map.TileSet(tilesImage, tileRects)
 
 def createMapSprites(spriteData, mapName):
     mapSprites = []
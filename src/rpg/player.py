@@ -106,12 +106,12 @@ class Player(RpgSprite):
         # have we triggered any events?
         self.update(gameSprites)
         # have we collided with any sprites?
-        self.processCollisions(visibleSprites.sprites())
+        self.processCollisions(visibleSprites.getNearbySprites(self.baseRect))
         # go ahead and handle user input
         directionBits, action = self.processKeyPresses(keyPresses)
         self.handleMovement(directionBits)
         if action:
-            self.processActions(visibleSprites.sprites())
+            self.processActions(visibleSprites.getNearbySprites(self.baseRect))
     
     """
     Takes the given key presses and converts them into direction bits + a boolean
@@ -369,8 +369,8 @@ class Player(RpgSprite):
     Processes collisions with other sprites in the given sprite collection.
     """
     def processCollisions(self, sprites):
-        # if there are less than two sprites then self is the only sprite
-        if len(sprites) < 2:
+        # nothing to do if there are no sprites other than self
+        if len(sprites) == 0 or (len(sprites) == 1 and sprites[0] is self):
             return
         for sprite in sprites:
             if sprite.isIntersecting(self):
@@ -380,8 +380,8 @@ class Player(RpgSprite):
     Processes interactions with other sprites in the given sprite collection.
     """
     def processActions(self, sprites):
-        # if there are less than two sprites then self is the only sprite
-        if len(sprites) < 2:
+        # nothing to do if there are no sprites other than self
+        if len(sprites) == 0 or (len(sprites) == 1 and sprites[0] is self):
             return
         for sprite in sprites:
             if sprite.isIntersecting(self):
@@ -425,18 +425,20 @@ class Ulmo(Player):
     
     movingFramesImage = None
     fallingFramesImage = None
+    movingAnimationFrames = None
+    fallingAnimationFrames = None
     
     def __init__(self):
         if Ulmo.movingFramesImage is None:          
             imagePath = os.path.join(SPRITES_FOLDER, "ulmo-frames.png")
             Ulmo.movingFramesImage = view.loadScaledImage(imagePath)
+            Ulmo.movingAnimationFrames = view.copyMovementFrames(view.processMovementFrames(Ulmo.movingFramesImage))
         if Ulmo.fallingFramesImage is None:          
             imagePath = os.path.join(SPRITES_FOLDER, "ulmo-falling.png")
             Ulmo.fallingFramesImage = view.loadScaledImage(imagePath)
-        animationFrames = view.processMovementFrames(Ulmo.movingFramesImage)
-        movingFrames = DirectionalFrames(animationFrames, ULMO_FRAME_SKIP)
-        animationFrames = view.processStaticFrames(Ulmo.fallingFramesImage)
-        fallingFrames = StaticFrames(animationFrames)
+            Ulmo.fallingAnimationFrames = view.copyStaticFrames(view.processStaticFrames(Ulmo.fallingFramesImage))
+        movingFrames = DirectionalFrames(Ulmo.movingAnimationFrames, ULMO_FRAME_SKIP)
+        fallingFrames = StaticFrames(Ulmo.fallingAnimationFrames)
         Player.__init__(self, movingFrames, fallingFrames, (1, -12))
 
 """
@@ -446,13 +448,14 @@ For this reason it lives with the player class.
 class Shadow(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     def __init__(self):
         if Shadow.framesImage is None:    
             imagePath = os.path.join(SPRITES_FOLDER, "shadow.png")
             Shadow.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Shadow.framesImage, 1)
-        spriteFrames = StaticFrames(animationFrames)
+            Shadow.animationFrames = view.copyStaticFrames(view.processStaticFrames(Shadow.framesImage, 1))
+        spriteFrames = StaticFrames(Shadow.animationFrames)
         OtherSprite.__init__(self, spriteFrames, (4, 2))
         self.upright = False
         
@@ -0,0 +1,43 @@
+#! /usr/bin/env python
+
+import threading
+import Queue
+import parser
+import spritebuilder
+
+"""
+Loads the maps adjacent to the current map on a background thread, so by the time
+the player walks off the edge of the map or into a cave the next map is already in
+the map cache and the transition doesn't stall while it's loaded.  The sprite frame
+images used by those maps are loaded at the same time.
+
+Adjacent maps are found via the boundary + tile event transitions of the current
+map.  Note that parser.loadRpgMap waits for any map the prefetcher is part way
+through loading, rather than loading it twice, and creating a sprite waits for any
+sprite frames it's part way through setting up (see sprites.framesLock).
+"""
+class MapPrefetcher:
+    
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = None
+        
+    def prefetchAdjacentMaps(self, rpgMap):
+        for mapName in rpgMap.getAdjacentMapNames():
+            if mapName not in parser.mapCache:
+                self.queue.put(mapName)
+        if self.thread is None and not self.queue.empty():
+            self.thread = threading.Thread(target = self.run, name = "prefetcher")
+            self.thread.daemon = True
+            self.thread.start()
+            
+    def run(self):
+        while True:
+            mapName = self.queue.get()
+            try:
+                rpgMap = parser.prefetchRpgMap(mapName)
+                if rpgMap:
+                    spritebuilder.preloadSprites(rpgMap)
+            except Exception, e:
+                # the map will be loaded as normal when it's needed
+                print "cannot prefetch %s: %s" % (mapName, e)
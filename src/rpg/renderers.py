@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+
+import view
+
+from pygame.locals import Rect
+
+ORIGIN = (0, 0)
+
+"""
+Draws the map view for the play state by only redrawing the parts of the screen
+that have changed since the last frame, rather than the whole view.  This relies
+on the surface still holding the last frame drawn by this renderer, so the play
+state must call invalidate whenever something else might have drawn on it.
+
+The whole view is redrawn if the view has scrolled.  Otherwise the changed areas
+are:
+
+- where every visible sprite was drawn on the last frame + where it is now - we
+  can't tell if a sprite's image has changed so these are always redrawn (this
+  includes any baked sprites drawn over them, see RpgSprites.getDrawnSprites)
+- where any fixed sprite was drawn + where it is now, if its image or position
+  has changed, or if it overlaps any other changed area
+
+The background is redrawn under each changed area, then the sprites are drawn over
+the top, and draw returns the changed areas so they can be passed to
+view.updateDisplay.
+"""
+class DirtyRectRenderer:
+
+    def __init__(self, background, visibleSprites, fixedSprites):
+        # the map image, or a scroll buffer for it
+        self.background = background
+        self.visibleSprites = visibleSprites
+        self.fixedSprites = fixedSprites
+        self.invalidate()
+
+    def invalidate(self):
+        self.viewPosition = None
+        # the rect each sprite was drawn at on the last frame
+        self.spriteRects = {}
+        # the image + rect each fixed sprite was drawn with on the last frame
+        self.fixedStates = {}
+
+    """
+    Draws the view onto the surface and returns the list of rects that have
+    changed.  Sprites should be updated before calling this.
+    """
+    def draw(self, surface, viewRect):
+        if viewRect.topleft != self.viewPosition:
+            return self.drawView(surface, viewRect)
+        surfaceRect = surface.get_rect()
+        dirtyRects = self.spriteRects.values()
+        dirtyRects += [sprite.rect for sprite in self.visibleSprites.getDrawnSprites()]
+        fixedSprites = self.getDirtyFixedSprites(dirtyRects)
+        dirtyRects = [rect.clip(surfaceRect) for rect in dirtyRects]
+        dirtyRects = [rect for rect in dirtyRects if rect.width and rect.height]
+        if len(dirtyRects) == 0:
+            return dirtyRects
+        for rect in dirtyRects:
+            self.background.draw(surface, rect.topleft, rect.move(viewRect.topleft), False)
+        self.visibleSprites.draw(surface)
+        for sprite in fixedSprites:
+            surface.blit(sprite.image, sprite.rect)
+        self.recordRects()
+        return dirtyRects
+
+    def drawView(self, surface, viewRect):
+        self.viewPosition = viewRect.topleft
+        self.background.draw(surface, ORIGIN, viewRect)
+        self.visibleSprites.draw(surface)
+        self.fixedSprites.draw(surface)
+        self.recordRects()
+        return [surface.get_rect()]
+
+    """
+    Returns the fixed sprites that need to be redrawn, adding the areas they cover
+    to the given dirty rects.  A fixed sprite that overlaps a dirty rect is redrawn
+    in full, so the whole area it covers must be cleared first.
+    """
+    def getDirtyFixedSprites(self, dirtyRects):
+        dirtySprites, cleanSprites = set(), []
+        fixedStates = dict(self.fixedStates)
+        for sprite in self.fixedSprites:
+            image, rect = fixedStates.pop(sprite, (None, None))
+            if sprite.image is image and sprite.rect == rect:
+                cleanSprites.append(sprite)
+                continue
+            if rect:
+                dirtyRects.append(rect)
+            dirtyRects.append(sprite.rect)
+            dirtySprites.add(sprite)
+        # fixed sprites that have been removed
+        dirtyRects += [rect for image, rect in fixedStates.values()]
+        # redrawing a fixed sprite may clear part of another one, so keep going until
+        # none of the remaining fixed sprites overlap a dirty rect
+        overlapping = True
+        while overlapping:
+            overlapping = [sprite for sprite in cleanSprites if sprite.rect.collidelist(dirtyRects) >= 0]
+            for sprite in overlapping:
+                cleanSprites.remove(sprite)
+                dirtyRects.append(sprite.rect)
+                dirtySprites.add(sprite)
+        # keep to the order the group would draw them in
+        return [sprite for sprite in self.fixedSprites if sprite in dirtySprites]
+
+    def recordRects(self):
+        self.spriteRects = dict((sprite, sprite.rect.copy()) for sprite in self.visibleSprites.getDrawnSprites())
+        self.fixedStates = dict((sprite, (sprite.image, sprite.rect.copy())) for sprite in self.fixedSprites)
+
+"""
+Keeps the part of the map image in view in a buffer the same size as the view, so
+only the strips that come into view need to be drawn from the map image when the
+view scrolls.  The buffer wraps around - the pixel at map x, y is kept at x % width,
+y % height - so nothing in it ever has to move, and any area of the view can be
+drawn from it with at most four blits.
+
+This can be used in place of the map image, as draw works the same way.  Drawing
+the whole view (with drop as True) scrolls the buffer to it first, and drawing a
+smaller part of the view is done straight from the buffer.
+"""
+class ScrollBuffer:
+    
+    def __init__(self, mapImage, size):
+        self.mapImage = mapImage
+        self.width, self.height = size
+        self.buffer = view.createRectangle(size, view.BLACK)
+        # the area of the map held in the buffer
+        self.viewRect = None
+        
+    def draw(self, surface, position, area, drop = True):
+        if drop:
+            self.scroll(area)
+        if self.viewRect is None or not self.viewRect.contains(area):
+            self.mapImage.draw(surface, position, area, drop)
+            return
+        px, py = position
+        for bufferPosition, part in self.getBufferParts(area):
+            bufferArea = Rect(bufferPosition, part.size)
+            surface.blit(self.buffer, (px + part.left - area.left, py + part.top - area.top), bufferArea)
+            
+    """
+    Fills the buffer with the given area of the map, drawing only the parts that
+    weren't in the buffer already.
+    """
+    def scroll(self, viewRect):
+        if viewRect.width > self.width or viewRect.height > self.height:
+            self.viewRect = None
+            return
+        lastRect, self.viewRect = self.viewRect, viewRect.copy()
+        if lastRect is None or not lastRect.colliderect(viewRect) or lastRect.size != viewRect.size:
+            self.drawArea(viewRect)
+            self.mapImage.dropChunks(viewRect)
+            return
+        dx, dy = viewRect.left - lastRect.left, viewRect.top - lastRect.top
+        if dx == 0 and dy == 0:
+            return
+        if dx > 0:
+            self.drawArea(Rect(lastRect.right, viewRect.top, dx, viewRect.height))
+        elif dx < 0:
+            self.drawArea(Rect(viewRect.left, viewRect.top, -dx, viewRect.height))
+        if dy > 0:
+            self.drawArea(Rect(viewRect.left, lastRect.bottom, viewRect.width, dy))
+        elif dy < 0:
+            self.drawArea(Rect(viewRect.left, viewRect.top, viewRect.width, -dy))
+        self.mapImage.dropChunks(viewRect)
+        
+    def drawArea(self, area):
+        for bufferPosition, part in self.getBufferParts(area):
+            self.mapImage.draw(self.buffer, bufferPosition, part, False)
+            
+    """
+    Splits the given area of the map where it wraps around the edges of the buffer,
+    returning the position in the buffer of each part along with the part itself.
+    """
+    def getBufferParts(self, area):
+        bx, by = area.left % self.width, area.top % self.height
+        widths = [min(area.width, self.width - bx)]
+        if widths[0] < area.width:
+            widths.append(area.width - widths[0])
+        heights = [min(area.height, self.height - by)]
+        if heights[0] < area.height:
+            heights.append(area.height - heights[0])
+        parts = []
+        x, px = area.left, bx
+        for width in widths:
+            y, py = area.top, by
+            for height in heights:
+                parts.append(((px, py), Rect(x, y, width, height)))
+                y, py = y + height, 0
+            x, px = x + width, 0
+        return parts
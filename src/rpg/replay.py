@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+
+from __future__ import with_statement
+
+import os
+import struct
+import pickle
+import hashlib
+import pygame
+import parser
+
+from pygame.locals import K_UP, K_DOWN, K_LEFT, K_RIGHT, K_SPACE
+
+"""
+Records the keys pressed on every tick so the same game can be played back later,
+eg. to compare performance across builds.  The game only ever looks at a handful of
+keys, so the keys pressed on each tick are stored as a bitset of RECORDED_KEYS, and
+the bitsets are run length encoded - a key tends to be held down for many ticks.
+
+A recording starts in the play state from a given registry (see states.playFrom),
+which is stored in the recording along with a hash of the map files it was made
+with.  The game is deterministic, so playing back the same keys from the same
+registry on the same maps always gives the same game.
+"""
+
+RECORDING_EXTENSION = ".ulmr"
+
+MAGIC = "ULMR"
+VERSION = 1
+
+# the keys that are recorded - the bit for each key is its index in this list
+RECORDED_KEYS = [K_UP, K_DOWN, K_LEFT, K_RIGHT, K_SPACE]
+
+# magic, version, map set hash, registry length
+HEADER = struct.Struct("<4sH20sI")
+COUNT = struct.Struct("<I")
+# key bits, number of ticks
+RUN = struct.Struct("<BI")
+
+def getKeyBits(keyPresses):
+    keyBits = 0
+    for i, key in enumerate(RECORDED_KEYS):
+        if keyPresses[key]:
+            keyBits |= 1 << i
+    return keyBits
+
+"""
+Returns key presses in the same form as pygame.key.get_pressed for the given key
+bits.  This must be called after pygame has been initialised.
+"""
+def getKeyPresses(keyBits):
+    keyPresses = [0] * len(pygame.key.get_pressed())
+    for i, key in enumerate(RECORDED_KEYS):
+        if keyBits & (1 << i):
+            keyPresses[key] = 1
+    return keyPresses
+
+"""
+Returns a hash of the source files for every map in parser.MAPS_FOLDER, so we can
+tell if a recording was made with a different set of maps.
+"""
+def getMapSetHash():
+    mapSetHash = hashlib.sha1()
+    for fileName in sorted(os.listdir(parser.MAPS_FOLDER)):
+        if fileName.endswith(parser.MAP_EXTENSION):
+            mapSetHash.update(fileName)
+            with open(os.path.join(parser.MAPS_FOLDER, fileName), "rb") as mapFile:
+                mapSetHash.update(mapFile.read())
+    return mapSetHash.digest()
+
+class Recording:
+
+    def __init__(self, registry, mapSetHash = None, runs = None):
+        # the registry is changed as the game is played, so keep a copy
+        self.registry = registry.takeSnapshot()
+        self.mapSetHash = mapSetHash if mapSetHash is not None else getMapSetHash()
+        # [key bits, number of ticks] for each run of ticks with the same keys pressed
+        self.runs = runs if runs is not None else []
+
+    def record(self, keyPresses):
+        keyBits = getKeyBits(keyPresses)
+        if self.runs and self.runs[-1][0] == keyBits:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([keyBits, 1])
+
+    """
+    Generates the recorded key presses for each tick in turn.
+    """
+    def playBack(self):
+        for keyBits, ticks in self.runs:
+            keyPresses = getKeyPresses(keyBits)
+            for i in range(ticks):
+                yield keyPresses
+
+    def getTickCount(self):
+        return sum(ticks for keyBits, ticks in self.runs)
+
+    def isMapSetCurrent(self):
+        return self.mapSetHash == getMapSetHash()
+
+    def save(self, recordingPath):
+        registryData = pickle.dumps(self.registry, pickle.HIGHEST_PROTOCOL)
+        with open(recordingPath, "wb") as recordingFile:
+            recordingFile.write(HEADER.pack(MAGIC, VERSION, self.mapSetHash, len(registryData)))
+            recordingFile.write(registryData)
+            recordingFile.write(COUNT.pack(len(self.runs)))
+            for keyBits, ticks in self.runs:
+                recordingFile.write(RUN.pack(keyBits, ticks))
+
+"""
+Loads the recording at the given path, or returns None if it isn't a recording we
+can read.
+"""
+def loadRecording(recordingPath):
+    with open(recordingPath, "rb") as recordingFile:
+        data = recordingFile.read()
+    try:
+        magic, version, mapSetHash, registryLength = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            print "Cannot read recording: ", os.path.abspath(recordingPath)
+            return None
+        offset = HEADER.size
+        registry = pickle.loads(data[offset:offset + registryLength])
+        offset += registryLength
+        numRuns, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        runs = []
+        for i in range(numRuns):
+            runs.append(list(RUN.unpack_from(data, offset)))
+            offset += RUN.size
+    except (struct.error, pickle.UnpicklingError, EOFError):
+        print "Cannot read recording: ", os.path.abspath(recordingPath)
+        return None
+    return Recording(registry, mapSetHash, runs)
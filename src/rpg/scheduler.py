@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+
+import pygame
+
+from view import TILE_SIZE, VIEW_WIDTH
+from spatialhash import SpatialHash
+
+# sprites are kept awake while they're within this distance of the view
+ACTIVE_DISTANCE = 4 * TILE_SIZE
+
+# cell size for the spatial hash of sleeping sprites
+SLEEPING_CELL_SIZE = VIEW_WIDTH // 2
+
+"""
+Sprite group that only updates the sprites near the view.  A sprite that is out
+of view and more than ACTIVE_DISTANCE from the view is put to sleep once it has
+been updated, as long as its canSleep method says that's ok.  Sleeping sprites
+are not updated - they're kept in a spatial hash on their activity rect, and woken
+up again once that comes within ACTIVE_DISTANCE of the view.  A sprite that wakes
+up is told how many updates it missed through its catchUp method before it is
+updated as normal.
+
+The activity rect must cover anywhere a sprite could get to while it is asleep,
+so it can't wander into view before it's woken up.  For most sprites this is just
+their map rect, as they don't move at all when they're out of view.
+
+This means the cost of updating the sprites depends on the number of sprites near
+the view, rather than the number of sprites on the map.
+"""
+class ScheduledSprites(pygame.sprite.Group):
+
+    def __init__(self, *sprites):
+        pygame.sprite.AbstractGroup.__init__(self)
+        self.ticks = 0
+        self.awakeSprites = set()
+        self.sleepingSprites = SpatialHash(SLEEPING_CELL_SIZE)
+        # the tick each sleeping sprite was last updated on
+        self.sleepTicks = {}
+        self.add(*sprites)
+
+    def add_internal(self, sprite):
+        pygame.sprite.AbstractGroup.add_internal(self, sprite)
+        self.awakeSprites.add(sprite)
+
+    def remove_internal(self, sprite):
+        pygame.sprite.AbstractGroup.remove_internal(self, sprite)
+        self.awakeSprites.discard(sprite)
+        if sprite in self.sleepTicks:
+            del self.sleepTicks[sprite]
+            self.sleepingSprites.remove(sprite)
+
+    def update(self, player, visibleSprites, viewRect, increment, trigger = 1):
+        self.ticks += 1
+        activeRect = viewRect.inflate(ACTIVE_DISTANCE * 2, ACTIVE_DISTANCE * 2)
+        self.wakeSprites(activeRect)
+        # updating a sprite may remove it from the group
+        for sprite in list(self.awakeSprites):
+            sprite.update(player, visibleSprites, viewRect, increment, trigger)
+            if sprite in self.awakeSprites and self.canSleep(sprite, activeRect):
+                self.sleepSprite(sprite)
+
+    def wakeSprites(self, activeRect):
+        for sprite in self.sleepingSprites.query(activeRect):
+            if sprite.getActivityRect().colliderect(activeRect):
+                self.sleepingSprites.remove(sprite)
+                sprite.catchUp(self.ticks - 1 - self.sleepTicks.pop(sprite))
+                self.awakeSprites.add(sprite)
+
+    def canSleep(self, sprite, activeRect):
+        if sprite.inView or not sprite.canSleep():
+            return False
+        return not sprite.getActivityRect().colliderect(activeRect)
+
+    def sleepSprite(self, sprite):
+        self.awakeSprites.remove(sprite)
+        self.sleepTicks[sprite] = self.ticks
+        self.sleepingSprites.add(sprite, sprite.getActivityRect())
+
+    def getAwakeCount(self):
+        return len(self.awakeSprites)
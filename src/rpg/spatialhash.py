@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+
+from pygame.locals import Rect
+
+NO_CELLS = ()
+
+"""
+Uniform grid of cells that keeps track of which sprites have a rect touching each
+cell, so we can find the sprites near a rect without testing every sprite.  Cells
+are cellSize pixels square and keyed on cell x, y.
+
+The rect for each sprite is given when the sprite is added or moved - query
+returns every sprite whose rect touches the same cells as the given rect, so the
+caller still needs to test the sprites it gets back.
+"""
+class SpatialHash:
+
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        # the sprites in each cell, keyed on cell x, y
+        self.cells = {}
+        # the range of cells for each sprite as cx1, cy1, cx2, cy2
+        self.spriteCells = {}
+        # the area covered by those cells, in pixels
+        self.spriteBounds = {}
+
+    def add(self, sprite, rect):
+        cellRange = self.getCellRange(rect)
+        cx1, cy1, cx2, cy2 = cellRange
+        cellSize = self.cellSize
+        self.spriteCells[sprite] = cellRange
+        self.spriteBounds[sprite] = Rect(cx1 * cellSize, cy1 * cellSize,
+                                         (cx2 + 1 - cx1) * cellSize, (cy2 + 1 - cy1) * cellSize)
+        for cell in self.getCells(cellRange):
+            if cell in self.cells:
+                self.cells[cell].add(sprite)
+            else:
+                self.cells[cell] = set([sprite])
+
+    def remove(self, sprite):
+        cellRange = self.spriteCells.pop(sprite, None)
+        self.spriteBounds.pop(sprite, None)
+        for cell in self.getCells(cellRange):
+            cellSprites = self.cells[cell]
+            cellSprites.discard(sprite)
+            if not cellSprites:
+                del self.cells[cell]
+
+    """
+    Updates the cells for a sprite that has moved.  This is called a lot so the
+    cells are only recalculated once the rect leaves the area they cover - a
+    sprite may be left in a cell it no longer touches until then, which is fine
+    as query can return extra sprites anyway.
+    """
+    def move(self, sprite, rect):
+        bounds = self.spriteBounds.get(sprite)
+        if bounds is None or not bounds.contains(rect):
+            self.remove(sprite)
+            self.add(sprite, rect)
+
+    """
+    Returns a list of the sprites in the cells touched by the given rect.
+    """
+    def query(self, rect):
+        cells = self.getCells(self.getCellRange(rect))
+        if len(cells) == 1:
+            return list(self.cells.get(cells[0], NO_CELLS))
+        sprites = set()
+        for cell in cells:
+            if cell in self.cells:
+                sprites.update(self.cells[cell])
+        return list(sprites)
+
+    def getCellRange(self, rect):
+        cellSize = self.cellSize
+        # rects with no width/height still touch the cell they're in
+        return (rect.left // cellSize, rect.top // cellSize,
+                max(rect.left, rect.right - 1) // cellSize,
+                max(rect.top, rect.bottom - 1) // cellSize)
+
+    def getCells(self, cellRange):
+        if cellRange is None:
+            return NO_CELLS
+        cx1, cy1, cx2, cy2 = cellRange
+        return [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+
+    def __len__(self):
+        return len(self.spriteCells)
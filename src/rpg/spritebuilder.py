@@ -4,6 +4,13 @@ import pygame
 
 from othersprites import Beetle, Wasp, Blades, Boat
 from staticsprites import Flames, Coin, Key, Chest, Rock, Door, Checkpoint
+from scheduler import ScheduledSprites
+
+# only update the sprites that are near the view - see ScheduledSprites
+SCHEDULE_SPRITES = True
+
+# draw sprites that never change on the map image - see bakeSprites
+BAKE_SPRITES = True
 
 # map of sprite classes keyed on name, as they appear in the map files 
 spriteClasses = {"flames": Flames,
@@ -44,13 +51,48 @@ def createSprite(mapSprite, rpgMap, eventBus, registry):
 
 """
 Returns a sprite group for the given map.  This excludes any sprites that are
-removed from the map.
+removed from the map.  If visibleSprites is given, sprites that can be baked are
+baked into the map image and left out of the group (see bakeSprites).
 """
-def createSpritesForMap(rpgMap, eventBus, registry):
-    gameSprites = pygame.sprite.Group()
+def createSpritesForMap(rpgMap, eventBus, registry, visibleSprites = None):
+    gameSprites = ScheduledSprites() if SCHEDULE_SPRITES else pygame.sprite.Group()
+    bakedSprites = []
     if rpgMap.mapSprites:
         for mapSprite in rpgMap.mapSprites:
             sprite = createSprite(mapSprite, rpgMap, eventBus, registry)
             if sprite:
-                gameSprites.add(sprite)
+                if BAKE_SPRITES and visibleSprites is not None and sprite.canBake():
+                    bakedSprites.append(sprite)
+                else:
+                    gameSprites.add(sprite)
+    if visibleSprites is not None:
+        bakeSprites(rpgMap, bakedSprites, visibleSprites)
     return gameSprites
+
+"""
+Bakes the given sprites into the map image, so they're drawn along with the map
+rather than updated + drawn every frame.  Each sprite is kept as its own collision
+proxy - it's added to visibleSprites as a baked sprite, which keeps its base rect
+in the spatial hash and draws it again if another sprite is drawn under it.
+
+The map image may be cached, so this replaces any sprites baked last time.
+"""
+def bakeSprites(rpgMap, sprites, visibleSprites):
+    sprites = sorted(sprites, key = lambda sprite: sprite.z)
+    for sprite in sprites:
+        sprite.bake()
+    rpgMap.mapImage.setBakedImages([(sprite.image, sprite.mapRect.copy()) for sprite in sprites])
+    visibleSprites.addBaked(*sprites)
+
+"""
+Creates a throwaway instance of each sprite type used by the given map.  Sprite
+classes load their frame images on first use, so this means they're usually ready
+by the time the map is shown.  If not, creating a sprite of that type waits on
+sprites.framesLock until the frames are set up.
+"""
+def preloadSprites(rpgMap):
+    if rpgMap.mapSprites:
+        types = set(mapSprite.type for mapSprite in rpgMap.mapSprites)
+        for type in types:
+            if type in spriteClasses:
+                spriteClasses[type]()
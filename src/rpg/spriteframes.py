@@ -1,11 +1,14 @@
 #!/usr/bin/env python
 
-import view
-
 from view import DOWN
 
 DIRECTION = "direction"
 
+"""
+Base class for the animation frames of a sprite.  The frames are shared by every
+instance of a sprite class, so they must never be drawn on - RpgSprite.applyMasks
+uses a masked copy of the current frame instead.
+"""
 class SpriteFrames:
     
     def __init__(self, frameSkip = None):
@@ -21,9 +24,6 @@ class SpriteFrames:
                 return self.frameIndex
         return None
     
-    def repairCurrentFrame(self):
-        pass
-    
     def advanceFrame(self, increment = 1, **kwargs):
         pass
 
@@ -38,14 +38,9 @@ class StaticFrames(SpriteFrames):
     
     def __init__(self, animationFrames, frameSkip = None):
         SpriteFrames.__init__(self, frameSkip)
-        self.virginAnimationFrames = animationFrames
-        self.animationFrames = view.copyStaticFrames(animationFrames)
+        self.animationFrames = animationFrames
         self.numFrames = len(self.animationFrames)
 
-    def repairCurrentFrame(self):
-        lastImage = self.animationFrames[self.frameIndex]
-        lastImage.blit(self.virginAnimationFrames[self.frameIndex], (0, 0))
-
     def advanceFrame(self, increment = 1, **kwargs):
         newFrameIndex = self.advanceFrameIndex(increment)
         return self.animationFrames[self.frameIndex], newFrameIndex
@@ -54,14 +49,9 @@ class DirectionalFrames(SpriteFrames):
     
     def __init__(self, animationFrames, frameSkip = None):
         SpriteFrames.__init__(self, frameSkip)
-        self.virginAnimationFrames = animationFrames
-        self.animationFrames = view.copyMovementFrames(animationFrames)
+        self.animationFrames = animationFrames
         self.numFrames = len(animationFrames[DOWN])
         self.direction = DOWN
-
-    def repairCurrentFrame(self):
-        lastImage = self.animationFrames[self.direction][self.frameIndex]
-        lastImage.blit(self.virginAnimationFrames[self.direction][self.frameIndex], (0, 0))
         
     def advanceFrame(self, increment = 1, **kwargs):
         newFrameIndex = self.advanceFrameIndex(increment)
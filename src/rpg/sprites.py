@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 
 import os
+import bisect
+import threading
 import pygame
 import view
+import cache
 
 from pygame.locals import Rect
 from view import SCALAR, TILE_SIZE
+from spatialhash import SpatialHash
 
 VELOCITY = 1
 MOVE_UNIT = VELOCITY * SCALAR
@@ -19,6 +23,15 @@ SPRITES_FOLDER = "sprites"
 NO_METADATA = {}
 NO_MOVEMENT = (0, 0, NO_METADATA)
 
+# masked frames are shared by every sprite - see getMaskedFrame
+MASKED_FRAME_CACHE_BYTES = 1024 * 1024
+
+maskedFrameCache = cache.LruCache(MASKED_FRAME_CACHE_BYTES)
+
+# sprite classes set up their frames on first use, which the prefetcher thread can
+# be part way through while the main thread creates a sprite - see spritebuilder.preloadSprites
+framesLock = threading.RLock()
+
 """
 Base sprite class that supports being masked by the map.
 """
@@ -30,12 +43,18 @@ class RpgSprite(pygame.sprite.Sprite):
         self.spriteFrames = spriteFrames
         self.position = [i * SCALAR for i in position]
         self.image, temp = self.spriteFrames.advanceFrame(0)
+        # pseudo z order - see doMove
+        self.z = None
+        # the RpgSprites groups that need to know when this sprite moves
+        self.rpgGroups = []
         # indicates if this sprite stands upright
         self.upright = True
         # indicates if this sprite is currently visible
         self.inView = False
         # indicates if this sprite is currently masked by any map tiles
         self.masked = False
+        # the image before it was masked
+        self.unmaskedImage = None
         # indicates if this sprite should be removed on next update
         self.toRemove = False
         
@@ -61,6 +80,9 @@ class RpgSprite(pygame.sprite.Sprite):
             self.level = level
         if px > 0 or py > 0:
             self.doMove(px, py)
+        # the base rect has been replaced
+        for group in self.rpgGroups:
+            group.spriteMoved(self, False)
         
     def initBaseRect(self):
         baseRectWidth = self.mapRect.width 
@@ -80,7 +102,11 @@ class RpgSprite(pygame.sprite.Sprite):
         self.mapRect.move_ip(px, py)
         self.baseRect.move_ip(px, py)
         # a pseudo z order is used to test if one sprite is behind another
-        self.z = self.calculateZ()
+        z = self.calculateZ()
+        zChanged = z != self.z
+        self.z = z
+        for group in self.rpgGroups:
+            group.spriteMoved(self, zChanged)
 
     def calculateZ(self):
         return int(self.mapRect.bottom + self.level * TILE_SIZE)
@@ -88,17 +114,18 @@ class RpgSprite(pygame.sprite.Sprite):
     def clearMasks(self):
         if self.masked:
             self.masked = False
-            self.spriteFrames.repairCurrentFrame()
+            self.image = self.unmaskedImage
         
     def applyMasks(self):
-        # masks is a map of lists, keyed on the associated tile points
+        # the masks are drawn by RpgSprites if the map has an overlay
+        if self.rpgMap.overlay:
+            return
+        # masks is a tuple of tile point, mask images pairs
         masks = self.rpgMap.getMasks(self)
         if len(masks) > 0:
             self.masked = True
-            for tilePoint in masks:
-                px = tilePoint[0] * view.TILE_SIZE - self.mapRect.left
-                py = tilePoint[1] * view.TILE_SIZE - self.mapRect.top
-                [self.image.blit(mask, (px, py)) for mask in masks[tilePoint]]
+            self.unmaskedImage = self.image
+            self.image = getMaskedFrame(self.image, self.mapRect.topleft, masks)
                 
     def advanceFrame(self, increment, metadata):
         self.image, frameIndex = self.spriteFrames.advanceFrame(increment, **metadata)
@@ -167,23 +194,207 @@ class OtherSprite(RpgSprite):
     # base movement method - this is sufficient for static sprites only        
     def getMovement(self, player, trigger):
         return NO_MOVEMENT
+    
+    # the following are used by ScheduledSprites to put the sprite to sleep while
+    # it's far from the view - by default it can sleep as long as it doesn't move
+    def canSleep(self):
+        return True
+    
+    # catches up with the given number of updates missed while asleep
+    def catchUp(self, ticks):
+        pass
+    
+    # returns a rect covering anywhere the sprite can move to while asleep
+    def getActivityRect(self):
+        return self.mapRect
+    
+    # sprites that never move or animate can be baked into the map image instead
+    # of being updated + drawn every frame - see spritebuilder.bakeSprites
+    def canBake(self):
+        return False
+    
+    # applies the masks to the sprite image for good, ready to be baked
+    def bake(self):
+        self.clearMasks()
+        masks = self.rpgMap.getMasks(self)
+        if len(masks) > 0:
+            self.image = getMaskedFrame(self.image, self.mapRect.topleft, masks)
                                    
+"""
+Returns a copy of the given frame with the given masks applied, for a sprite at
+the given map position.  Masked frames are cached on the frame + the masks with
+their positions relative to the sprite, so a sprite that stays behind the same
+masks (or a stationary sprite, eg. a rock) is only masked once.
+"""
+def getMaskedFrame(frame, position, masks):
+    left, top = position
+    key = (frame,) + tuple(((tilePoint[0] * TILE_SIZE - left, tilePoint[1] * TILE_SIZE - top), tileMasks)
+                           for tilePoint, tileMasks in masks)
+    maskedFrame = maskedFrameCache.get(key)
+    if maskedFrame is None:
+        # we don't want to draw on the frame itself because it's used unmasked too
+        maskedFrame = frame.copy()
+        for maskPosition, tileMasks in key[1:]:
+            for mask in tileMasks:
+                maskedFrame.blit(mask, maskPosition)
+        maskedFrameCache.put(key, maskedFrame, view.getSurfaceBytes(maskedFrame))
+    return maskedFrame
+
 """
 Sprite group that ensures pseudo z ordering for the sprites.  This works
 because internally AbstractGroup calls self.sprites() to get a list of sprites
 before it draws them.  I've overidden the sprites() method to return the
 sprites in the correct order - this works, but I might be in trouble if the
 internals of AbstractGroup ever changes.
+
+Rather than sorting every time sprites() is called, the sprites are kept in z
+order as they are added.  RpgSprite.doMove tells the group when the z of one of
+its sprites changes, and only those sprites are moved to their new place on the
+next call to sprites() - which otherwise returns the same tuple as last time.  Use
+unordered() where the order doesn't matter.
+
+The group also keeps a spatial hash of the sprites' base rects, so getNearbySprites
+can be used to find the sprites that might be intersecting a base rect, eg. for
+collision checks.
+
+Baked sprites (see spritebuilder.bakeSprites) are already drawn on the map image,
+so they aren't members of the group.  They're still kept in the spatial hash for
+collision checks, and a baked sprite is only drawn again when another sprite it
+overlaps is drawn before it - otherwise that sprite would end up on top.
 """
 class RpgSprites(pygame.sprite.Group):
     
     def __init__(self, *sprites):
         pygame.sprite.AbstractGroup.__init__(self)
+        # the sprites in z order, along with the z each one was inserted at
+        self.ordered = []
+        self.orderedZs = []
+        self.insertedZs = {}
+        # sprites whose z has changed since they were inserted
+        self.moved = set()
+        self.orderedView = None
+        # the z + insertion count for each sprite, which puts sprites in the same
+        # order as self.ordered - see getNearbySprites
+        self.orderKeys = {}
+        self.insertCount = 0
+        self.spatialHash = SpatialHash(TILE_SIZE)
+        # baked sprites, keyed on their map rects
+        self.bakedSprites = SpatialHash(TILE_SIZE)
         self.add(*sprites)
         
+    def add_internal(self, sprite):
+        pygame.sprite.AbstractGroup.add_internal(self, sprite)
+        sprite.rpgGroups.append(self)
+        self.insertSprite(sprite)
+        self.spatialHash.add(sprite, sprite.baseRect)
+        
+    def remove_internal(self, sprite):
+        pygame.sprite.AbstractGroup.remove_internal(self, sprite)
+        sprite.rpgGroups.remove(self)
+        self.moved.discard(sprite)
+        self.deleteSprite(sprite)
+        del self.orderKeys[sprite]
+        self.spatialHash.remove(sprite)
+        
+    def insertSprite(self, sprite):
+        z = sprite.z
+        i = bisect.bisect_right(self.orderedZs, z)
+        self.ordered.insert(i, sprite)
+        self.orderedZs.insert(i, z)
+        self.insertedZs[sprite] = z
+        self.insertCount += 1
+        self.orderKeys[sprite] = (z, self.insertCount)
+        self.orderedView = None
+        
+    def deleteSprite(self, sprite):
+        z = self.insertedZs.pop(sprite)
+        i = self.ordered.index(sprite, bisect.bisect_left(self.orderedZs, z))
+        del self.ordered[i]
+        del self.orderedZs[i]
+        self.orderedView = None
+        
+    def spriteMoved(self, sprite, zChanged):
+        if zChanged:
+            self.moved.add(sprite)
+        self.spatialHash.move(sprite, sprite.baseRect)
+        
     def sprites(self):
-        # return the sprites sorted on their z field to ensure 
-        # that they appear in the correct 'z' order
-        return sorted(self.spritedict.keys(),
-                      lambda sprite1, sprite2: sprite1.z - sprite2.z)
+        # return the sprites in the correct 'z' order
+        if self.moved:
+            for sprite in self.moved:
+                self.deleteSprite(sprite)
+                self.insertSprite(sprite)
+            self.moved.clear()
+        if self.orderedView is None:
+            self.orderedView = tuple(self.ordered)
+        return self.orderedView
+    
+    """
+    Draws the sprites in z order, along with their masks if the map has an overlay.
+    """
+    def draw(self, surface):
+        sprites = self.getDrawnSprites()
+        if len(sprites) == 0:
+            return
+        overlay = sprites[0].rpgMap.overlay
+        spritedict = self.spritedict
+        for sprite in sprites:
+            rect = surface.blit(sprite.image, sprite.rect)
+            # baked sprites are masked already
+            if sprite in spritedict:
+                spritedict[sprite] = rect
+                if overlay:
+                    overlay.drawMasks(surface, sprite)
+        self.lostsprites = []
+    
+    """
+    Returns the sprites that draw will draw, in z order.  This is the sprites in
+    the group plus any baked sprites that need to be drawn over them - which is
+    any baked sprite with a higher z than a sprite being drawn that it overlaps.
+    """
+    def getDrawnSprites(self):
+        sprites = self.sprites()
+        if len(self.bakedSprites) == 0 or len(sprites) == 0:
+            return sprites
+        drawnBaked = set()
+        pending = list(sprites)
+        while pending:
+            sprite = pending.pop()
+            for baked in self.bakedSprites.query(sprite.mapRect):
+                if baked.z > sprite.z and baked not in drawnBaked and baked.mapRect.colliderect(sprite.mapRect):
+                    drawnBaked.add(baked)
+                    pending.append(baked)
+        if not drawnBaked:
+            return sprites
+        # baked sprites aren't updated, so make their rects relative to the view here
+        dx, dy = sprites[0].rect.left - sprites[0].mapRect.left, sprites[0].rect.top - sprites[0].mapRect.top
+        for baked in drawnBaked:
+            baked.rect.topleft = (baked.mapRect.left + dx, baked.mapRect.top + dy)
+        # the sort is stable, so sprites with the same z keep their order
+        return sorted(sprites + tuple(drawnBaked), key = lambda sprite: sprite.z)
+    
+    def addBaked(self, *sprites):
+        for sprite in sprites:
+            self.bakedSprites.add(sprite, sprite.mapRect)
+            self.spatialHash.add(sprite, sprite.baseRect)
+            self.insertCount += 1
+            self.orderKeys[sprite] = (sprite.z, self.insertCount)
+    
+    def unordered(self):
+        return self.spritedict.keys()
+    
+    """
+    Returns the sprites whose base rects share a spatial hash cell with the given
+    rect - it's up to the caller to check if they actually intersect.  The sprites
+    are in z order, same as sprites(), so when several of them intersect the rect
+    they're always dealt with in the same order.
+    """
+    def getNearbySprites(self, baseRect):
+        nearby = self.spatialHash.query(baseRect)
+        if len(nearby) > 1:
+            # bring the order keys of any moved sprites up to date
+            if self.moved:
+                self.sprites()
+            nearby.sort(key = self.orderKeys.__getitem__)
+        return nearby
         
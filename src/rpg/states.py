@@ -20,9 +20,10 @@ from registry import RegistryHandler, Registry
 from player import Ulmo
 from sounds import SoundHandler
 from music import MusicPlayer
+from prefetch import MapPrefetcher
+from renderers import DirtyRectRenderer, ScrollBuffer
 from fixedsprites import FixedCoin, CoinCount, KeyCount, Lives, CheckpointIcon
-
-FRAMES_PER_SEC = 60 // VELOCITY
+from gameclock import FRAMES_PER_SEC
 
 THIRTY_TWO = 32 // VELOCITY
 SIXTY_FOUR = 64 // VELOCITY
@@ -42,11 +43,21 @@ DOORWAY_TICKS = {UP: 16 // VELOCITY,
                  LEFT: 16 // VELOCITY,
                  RIGHT: 16 // VELOCITY}
 
+# load adjacent maps in the background so map transitions don't stall
+PREFETCH_MAPS = True
+
+# only redraw + update the parts of the screen that change while playing - see
+# DirtyRectRenderer.  Off by default, as whether it pays depends on the display driver
+DIRTY_RECTS = False
+
+# keep the map image in view in a scroll buffer - see ScrollBuffer
+SCROLL_BUFFER = False
+
 PLAYER_OFF_SCREEN_START = (-2, 27)
 PLAYER_ON_SCREEN_START = (7, 27)
 
 pygame.display.set_caption("Ulmo's Adventure")
-screen = pygame.display.set_mode(DIMENSIONS)
+screen = view.setDisplayMode(DIMENSIONS)
 
 blackRect = view.createRectangle(DIMENSIONS)
 
@@ -58,6 +69,7 @@ eventBus = None
 soundHandler = None
 registryHandler = None
 musicPlayer = None
+prefetcher = None
 fixedSprites = None
 player = None
 
@@ -94,6 +106,10 @@ def setup():
     global musicPlayer
     musicPlayer = MusicPlayer()
 
+    global prefetcher
+    if PREFETCH_MAPS:
+        prefetcher = MapPrefetcher()
+
 def showTitle(newGame = False):
     if newGame:
         setup()
@@ -131,6 +147,14 @@ def startGame(cont = False, registry = None):
     # return the play state
     return PlayState()
 
+"""
+Starts the game in the play state from the given registry, skipping the title
+screen and the start sequence - eg. to play back a recording (see replay.py).
+"""
+def playFrom(registry):
+    setup()
+    return startGame(False, registry).start()
+
 def getRegistry(cont, registry):
     if cont:
         registryHandler.switchToSnapshot()
@@ -168,14 +192,14 @@ def sceneZoomIn(screenImage, ticks):
     screen.blit(blackRect, ORIGIN)
     extract = Rect(xBorder, yBorder, VIEW_WIDTH - xBorder * 2, VIEW_HEIGHT - yBorder * 2)
     screen.blit(screenImage, (xBorder, yBorder), extract)
-    pygame.display.flip()
+    view.flipDisplay()
 
 def sceneZoomOut(screenImage, ticks):
     xBorder = (THIRTY_TWO - (ticks + 1)) * X_MULT
     yBorder = xBorder * Y_X_RATIO
     extract = Rect(xBorder, yBorder, VIEW_WIDTH - xBorder * 2, VIEW_HEIGHT - yBorder * 2)
     screen.blit(screenImage, (xBorder, yBorder), extract)
-    pygame.display.flip()
+    view.flipDisplay()
 
 """
 The title state brings the title screen into view, loading the first map and
@@ -210,11 +234,11 @@ class TitleState:
                 musicPlayer.playTrack("title")
             x, y = 0, self.ticks * MOVE_UNIT // 2
             screen.blit(self.backgroundImage, ORIGIN, Rect(x, y, VIEW_WIDTH, VIEW_HEIGHT))        
-            pygame.display.flip()
+            view.flipDisplay()
         elif self.ticks == self.titleTicks + THIRTY_TWO:
             x, y = (VIEW_WIDTH - self.titleImage.get_width()) // 2, 26 * SCALAR
             screen.blit(self.titleImage, (x, y))
-            pygame.display.flip()
+            view.flipDisplay()
             eventBus.dispatchTitleShownEvent(TitleShownEvent());
         elif self.ticks == self.titleTicks + SIXTY_FOUR:
             self.screenImage = screen.copy()
@@ -245,7 +269,7 @@ class TitleState:
             screen.blit(playLine, (x, y))
         else:
             screen.blit(self.screenImage, ORIGIN)
-        pygame.display.flip()
+        view.flipDisplay()
         
 
 """
@@ -277,7 +301,7 @@ class StartState:
             if self.viewRect.top == player.viewRect.top:
                 return ShowBoatState(self.playState)
                 #return self.playState.start() // SKIP SHOW BOAT
-        pygame.display.flip()
+        view.flipDisplay()
         self.ticks += 1
 
     def screenWipeUp(self, sliceHeight):
@@ -312,7 +336,7 @@ class ShowBoatState:
                                 player.spriteFrames.direction,
                                 px, py, 0)
         self.playState.drawMapView(screen, player.viewRect, trigger = 1)
-        pygame.display.flip()
+        view.flipDisplay()
         
     def boatStopped(self, boatStoppedEvent):
         self.boatStoppedEvent = boatStoppedEvent
@@ -330,7 +354,14 @@ class PlayState:
         # add the player to the visible group
         self.visibleSprites = sprites.RpgSprites(player)
         # create more sprites
-        self.gameSprites = spritebuilder.createSpritesForMap(player.rpgMap, eventBus, registryHandler.registry)
+        self.gameSprites = spritebuilder.createSpritesForMap(player.rpgMap, eventBus, registryHandler.registry,
+                                                              self.visibleSprites)
+        self.background = player.rpgMap.mapImage
+        if SCROLL_BUFFER:
+            self.background = ScrollBuffer(self.background, DIMENSIONS)
+        self.renderer = None
+        if DIRTY_RECTS:
+            self.renderer = DirtyRectRenderer(self.background, self.visibleSprites, fixedSprites)
         
     # listen for map transition, life lost and end game events
     def start(self):
@@ -341,17 +372,38 @@ class PlayState:
         eventBus.addMapTransitionListener(self)
         eventBus.addLifeLostListener(self)
         eventBus.addEndGameListener(self)
+        # other states have drawn on the screen since we last did
+        if self.renderer:
+            self.renderer.invalidate()
         musicPlayer.playTrack(player.rpgMap.music)
+        if prefetcher:
+            prefetcher.prefetchAdjacentMaps(player.rpgMap)
         return self
                              
     def execute(self, keyPresses):
+        nextState = self.update(keyPresses)
+        if nextState:
+            return nextState
+        self.render()
+    
+    """
+    Advances the game by one tick without drawing anything - the main loop may
+    call this more than once before calling render if it needs to catch up.
+    """
+    def update(self, keyPresses):
         nextState = self.handleEvents()
         if nextState:
             return nextState
         player.handleInteractions(keyPresses, self.gameSprites, self.visibleSprites)
-        # draw the player map view to the screen
+        self.updateSprites(player.viewRect)
+    
+    # draws the player map view to the screen
+    def render(self):
+        if self.renderer:
+            view.updateDisplay(self.renderer.draw(screen, player.viewRect))
+            return
         self.drawPlayerMapView(screen)
-        pygame.display.flip()
+        view.flipDisplay()
         
     def handleEvents(self):
         if not self.eventCaptured:
@@ -370,15 +422,20 @@ class PlayState:
         if self.endGameEvent:
             return EndGameState()    
     
+    # sprites should be updated before calling this
     def drawPlayerMapView(self, surface):
-        self.drawMapView(surface, player.viewRect)
+        self.background.draw(surface, ORIGIN, player.viewRect)
+        self.visibleSprites.draw(surface)
         fixedSprites.draw(surface)
            
     def drawMapView(self, surface, viewRect, increment = 1, trigger = 0):
-        surface.blit(player.rpgMap.mapImage, ORIGIN, viewRect)
+        self.background.draw(surface, ORIGIN, viewRect)
+        self.updateSprites(viewRect, increment, trigger)
+        self.visibleSprites.draw(surface)
+    
+    def updateSprites(self, viewRect, increment = 1, trigger = 0):
         # if the sprite being updated is in view it will be added to visibleSprites as a side-effect
         self.gameSprites.update(player, self.visibleSprites, viewRect, increment, trigger)
-        self.visibleSprites.draw(surface)
     
     def lifeLostTransition(self):
         registryHandler.switchToSnapshot()
@@ -476,7 +533,7 @@ class BoundaryTransitionState:
                 self.screenWipeRight(sliceWidth)
             else: # self.boundary == RIGHT
                 self.screenWipeLeft(sliceWidth)
-            pygame.display.flip()
+            view.flipDisplay()
         else:
             return ShowPlayerState(self.boundary, self.playState, BOUNDARY_TICKS[self.boundary])
         self.ticks += 1
@@ -541,7 +598,7 @@ class ShowPlayerState:
                             player.spriteFrames.direction,
                             px, py)
         self.playState.drawMapView(screen, player.viewRect)
-        pygame.display.flip()
+        view.flipDisplay()
 
 """
 The game over state provides a 'continue' option before either starting the game
@@ -582,13 +639,13 @@ class GameOverState:
                 screen.blit(self.topLine3, (x, y))
                 # set the countdown topleft for later
                 self.countdownTopleft = (x, y)
-            pygame.display.flip()
+            view.flipDisplay()
         elif self.ticks == SIXTY_FOUR:
             x, y = (VIEW_WIDTH - self.lowLine1.get_width()) // 2, VIEW_HEIGHT - 42 * SCALAR
             screen.blit(self.lowLine1, (x, y))
             x, y = (VIEW_WIDTH - self.lowLine2.get_width()) // 2, VIEW_HEIGHT - 30 * SCALAR
             screen.blit(self.lowLine2, (x, y))
-            pygame.display.flip()
+            view.flipDisplay()
             if self.continueOffered:
                 self.countdown = 10
         elif self.ticks > SIXTY_FOUR:
@@ -602,7 +659,7 @@ class GameOverState:
         screen.blit(self.blackRect, self.countdownTopleft)
         if self.countdown > 0:
             screen.blit(countdownLine, self.countdownTopleft)
-            pygame.display.flip()
+            view.flipDisplay()
 
 """
 The end game state provides an ending (of sorts!) before going back to the title screen. 
@@ -628,11 +685,11 @@ class EndGameState:
             screen.blit(self.topLine2, (x, y))
             x, y = (VIEW_WIDTH - self.topLine3.get_width()) // 2, 56 * SCALAR
             screen.blit(self.topLine3, (x, y))
-            pygame.display.flip()
+            view.flipDisplay()
         elif self.ticks == SIXTY_FOUR:
             x, y = (VIEW_WIDTH - self.lowLine1.get_width()) // 2, VIEW_HEIGHT - 30 * SCALAR
             screen.blit(self.lowLine1, (x, y))
-            pygame.display.flip()
+            view.flipDisplay()
         elif self.ticks > SIXTY_FOUR:
             if keyPresses[K_SPACE]:
                 return showTitle()
@@ -15,27 +15,31 @@ CHECKPOINT_FRAME_SKIP = 12 // VELOCITY
 class Flames(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     def __init__(self):
-        if Flames.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "flame-frames.png")
-            Flames.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Flames.framesImage)
-        spriteFrames = StaticFrames(animationFrames, FLAMES_FRAME_SKIP)
+        with framesLock:
+            if Flames.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "flame-frames.png")
+                Flames.framesImage = view.loadScaledImage(imagePath, None)        
+                Flames.animationFrames = view.copyStaticFrames(view.processStaticFrames(Flames.framesImage))
+        spriteFrames = StaticFrames(Flames.animationFrames, FLAMES_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (4, 2))
 
 class Coin(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (8 * SCALAR, BASE_RECT_HEIGHT)
         
     def __init__(self):
-        if Coin.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "coin-frames.png")
-            Coin.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Coin.framesImage)
-        spriteFrames = StaticFrames(animationFrames, COIN_FRAME_SKIP)
+        with framesLock:
+            if Coin.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "coin-frames.png")
+                Coin.framesImage = view.loadScaledImage(imagePath, None)        
+                Coin.animationFrames = view.copyStaticFrames(view.processStaticFrames(Coin.framesImage))
+        spriteFrames = StaticFrames(Coin.animationFrames, COIN_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (2, 2))
         
     def processCollision(self, player):
@@ -47,15 +51,17 @@ class Coin(OtherSprite):
 class Key(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (8 * SCALAR, BASE_RECT_HEIGHT)
         
     def __init__(self):
-        if Key.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "key-frames.png")
-            Key.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Key.framesImage, 6)
-        spriteFrames = StaticFrames(animationFrames, KEY_FRAME_SKIP)
+        with framesLock:
+            if Key.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "key-frames.png")
+                Key.framesImage = view.loadScaledImage(imagePath, None)        
+                Key.animationFrames = view.copyStaticFrames(view.processStaticFrames(Key.framesImage, 6))
+        spriteFrames = StaticFrames(Key.animationFrames, KEY_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (2, 2))
         
     def processCollision(self, player):
@@ -67,51 +73,65 @@ class Key(OtherSprite):
 class Chest(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (8 * SCALAR, BASE_RECT_HEIGHT)
         
     def __init__(self):
-        if Chest.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "chest.png")
-            Chest.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Chest.framesImage, 1)
-        spriteFrames = StaticFrames(animationFrames)
+        with framesLock:
+            if Chest.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "chest.png")
+                Chest.framesImage = view.loadScaledImage(imagePath, None)        
+                Chest.animationFrames = view.copyStaticFrames(view.processStaticFrames(Chest.framesImage, 1))
+        spriteFrames = StaticFrames(Chest.animationFrames)
         OtherSprite.__init__(self, spriteFrames)
         
     # override
     def advanceFrame(self, increment, metadata):
         pass
+    
+    # override
+    def canBake(self):
+        return True
                 
 class Rock(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (8 * SCALAR, BASE_RECT_HEIGHT)
         
     def __init__(self):
-        if Rock.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "rock.png")
-            Rock.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Rock.framesImage, 1)
-        spriteFrames = StaticFrames(animationFrames)
+        with framesLock:
+            if Rock.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "rock.png")
+                Rock.framesImage = view.loadScaledImage(imagePath, None)        
+                Rock.animationFrames = view.copyStaticFrames(view.processStaticFrames(Rock.framesImage, 1))
+        spriteFrames = StaticFrames(Rock.animationFrames)
         OtherSprite.__init__(self, spriteFrames, (0, -4))
         
     # override
     def advanceFrame(self, increment, metadata):
         pass
+    
+    # override
+    def canBake(self):
+        return True
                 
 class Door(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (4 * SCALAR, BASE_RECT_HEIGHT)    
 
     def __init__(self):
-        if Door.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "door-frames.png")
-            Door.framesImage = view.loadScaledImage(imagePath, None)
-        animationFrames = view.processStaticFrames(Door.framesImage, 10)
-        spriteFrames = StaticFrames(animationFrames, DOOR_FRAME_SKIP)
+        with framesLock:
+            if Door.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "door-frames.png")
+                Door.framesImage = view.loadScaledImage(imagePath, None)
+                Door.animationFrames = view.copyStaticFrames(view.processStaticFrames(Door.framesImage, 10))
+        spriteFrames = StaticFrames(Door.animationFrames, DOOR_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (0, -16))
         self.opening = False
 
@@ -144,15 +164,17 @@ class Door(OtherSprite):
 class Checkpoint(OtherSprite):
     
     framesImage = None
+    animationFrames = None
     
     baseRectSize = (8 * SCALAR, BASE_RECT_HEIGHT)
         
     def __init__(self):
-        if Checkpoint.framesImage is None:    
-            imagePath = os.path.join(SPRITES_FOLDER, "check-frames.png")
-            Checkpoint.framesImage = view.loadScaledImage(imagePath, None)        
-        animationFrames = view.processStaticFrames(Checkpoint.framesImage, 4)
-        spriteFrames = StaticFrames(animationFrames, CHECKPOINT_FRAME_SKIP)
+        with framesLock:
+            if Checkpoint.framesImage is None:    
+                imagePath = os.path.join(SPRITES_FOLDER, "check-frames.png")
+                Checkpoint.framesImage = view.loadScaledImage(imagePath, None)        
+                Checkpoint.animationFrames = view.copyStaticFrames(view.processStaticFrames(Checkpoint.framesImage, 4))
+        spriteFrames = StaticFrames(Checkpoint.animationFrames, CHECKPOINT_FRAME_SKIP)
         OtherSprite.__init__(self, spriteFrames, (3, -3))
         
     def processCollision(self, player):
@@ -10,7 +10,12 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
 
+# everything is drawn at SCALAR times the size of the art, and the screen is shown
+# at DISPLAY_SCALAR times the size it's drawn at - see useNativeResolution
 SCALAR = 2
+DISPLAY_SCALAR = 1
+# if set, the display is this size and the screen is scaled up as far as it fits
+DISPLAY_SIZE = None
 
 TILE_SIZE = 16 * SCALAR
 
@@ -23,12 +28,107 @@ NONE, UP, DOWN, LEFT, RIGHT = 0, 1, 2, 4, 8
 
 DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
 
+# the surface that's drawn on + the display it's scaled up onto, if they differ
+screen = None
+display = None
+# the part of the display the screen is scaled up onto
+displayRect = None
+
+# set to False to draw the screen without ever showing it, eg. when headless
+PRESENT_DISPLAY = True
+
+# bits per pixel for the display mode - 0 lets SDL pick, but the dummy video driver
+# picks 8 bit, which is nothing like a real display and slow to draw on
+DISPLAY_DEPTH = 0
+
+"""
+Switches to drawing everything at the native size of the art, eg. a 256x160 view,
+and scaling the whole screen up by displayScalar when it's shown instead.  If a
+display size is given the screen is scaled up as far as it will go on a display
+of that size instead - see getDisplayRect.  Every size + movement is derived from
+SCALAR, so the game plays the same - one move unit is one pixel of the art either
+way.
+
+This has to be called before any of the other rpg modules are imported, as they
+take their own copies of SCALAR and the sizes that come from it.
+"""
+def useNativeResolution(displayScalar = 2, displaySize = None):
+    global SCALAR, DISPLAY_SCALAR, DISPLAY_SIZE, TILE_SIZE, VIEW_WIDTH, VIEW_HEIGHT
+    SCALAR = 1
+    DISPLAY_SCALAR = displayScalar
+    DISPLAY_SIZE = displaySize
+    TILE_SIZE = 16 * SCALAR
+    VIEW_WIDTH = TILE_SIZE * 16
+    VIEW_HEIGHT = TILE_SIZE * 10
+
+"""
+Sets the display mode and returns the surface to draw the screen on, which is a
+separate surface if the display is scaled up.  Use flipDisplay and updateDisplay
+rather than pygame.display so it's scaled up before it's shown.
+"""
+def setDisplayMode(dimensions):
+    global screen, display, displayRect
+    if DISPLAY_SCALAR == 1 and not DISPLAY_SIZE:
+        screen = pygame.display.set_mode(dimensions, 0, DISPLAY_DEPTH)
+        return screen
+    width, height = dimensions
+    displaySize = DISPLAY_SIZE or (width * DISPLAY_SCALAR, height * DISPLAY_SCALAR)
+    display = pygame.display.set_mode(displaySize, 0, DISPLAY_DEPTH)
+    displayRect = getDisplayRect(dimensions, displaySize)
+    screen = createRectangle(dimensions)
+    return screen
+
+"""
+Returns the rect of a display of the given size that a screen of the given
+dimensions is scaled up onto - the biggest whole multiple of the screen that fits
+on the display, centred with black borders round it.  Whole multiples keep every
+pixel of the art the same size.  The screen is never scaled down.
+"""
+def getDisplayRect(dimensions, displaySize):
+    width, height = dimensions
+    displayWidth, displayHeight = displaySize
+    scalar = max(1, min(displayWidth // width, displayHeight // height))
+    return pygame.Rect((displayWidth - width * scalar) // 2, (displayHeight - height * scalar) // 2,
+                       width * scalar, height * scalar)
+
+def flipDisplay():
+    if not PRESENT_DISPLAY:
+        return
+    if display:
+        scale(screen, displayRect.size, display.subsurface(displayRect))
+    pygame.display.flip()
+
+# updates just the given rects of the display
+def updateDisplay(rects):
+    if not PRESENT_DISPLAY:
+        return
+    if display:
+        rects = [scaleScreenRect(rect) for rect in rects]
+    pygame.display.update(rects)
+
+def scaleScreenRect(rect):
+    scalar = displayRect.width // screen.get_width()
+    scaledRect = pygame.Rect(displayRect.left + rect.left * scalar, displayRect.top + rect.top * scalar,
+                             rect.width * scalar, rect.height * scalar)
+    scale(screen.subsurface(rect), scaledRect.size, display.subsurface(scaledRect))
+    return scaledRect
+
 def createRectangle(dimensions, colour = None):
     rectangle = pygame.Surface(dimensions).convert()
     if colour is not None:
         rectangle.fill(colour)
     return rectangle
 
+def getSurfaceBytes(surface):
+    return surface.get_pitch() * surface.get_height()
+
+def getBytesPerPixel():
+    # surfaces are converted to the display format
+    screen = pygame.display.get_surface()
+    if screen:
+        return screen.get_bytesize()
+    return 4
+
 def loadImage(imagePath, colourKey = None):
     try:
         image = pygame.image.load(imagePath)
@@ -40,8 +140,10 @@ def loadImage(imagePath, colourKey = None):
         image.set_colorkey(colourKey, RLEACCEL)
     return image
 
-def loadScaledImage(imagePath, colourKey = None, scalar = SCALAR):
+def loadScaledImage(imagePath, colourKey = None, scalar = None):
     img = loadImage(imagePath, colourKey)
+    if scalar is None:
+        scalar = SCALAR
     return scale(img, (img.get_width() * scalar, img.get_height() * scalar))
         
 def createDuplicateSpriteImage(spriteImage):
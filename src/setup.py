@@ -4,7 +4,7 @@ from distutils.core import setup
 
 setup(name = "ulmo-game",
       version = "1.1",
-      py_modules=["play"],
+      py_modules=["play", "compilemaps", "headless"],
       packages=["rpg"],
       author="Sam Eldred",
       author_email="samuel.eldred@gmail.com",